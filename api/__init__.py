@@ -3,56 +3,49 @@
 Routes Specified:
   https://docs.google.com/spreadsheets/d/19zLqvcoFI7Jm_y6nPPgcRmaBuPEkDKtgeiyozekbMoU/edit?usp=sharing
 """
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Dict, Tuple
 
 from flask import Flask, request
-from pymongo import MongoClient  # type:ignore
+from werkzeug.exceptions import RequestEntityTooLarge
 
-from .mailer import send_feedback
-from .request_schemas import FeedbackSchema, validate_request_body
+from .encoding import JSONApp, install_json
+from .profiling import install_profiler
 
 
-def create_app() -> Flask:
+def create_app(json_provider: str = "auto") -> Flask:
     """Construct Flask App with all Endpoints.
 
+    Arguments:
+      json_provider: JSON encoder of responses, see `api.encoding`
+
     Returns:
       Flask app
     """
-    app = Flask(__name__)
-
-    @app.route("/health")
-    def health() -> Tuple[Dict[str, str], int]:
-        """Health route."""
-        return {"msg": "healthy"}, 200
-
-    @app.route("/api/v1/feedback", methods=["POST"])
-    def feedback() -> Tuple[Dict[str, str], int]:
-        """Send feedback to $GMAIL_USERNAME.
-
-        Arguments:
-          POST Body:
+    app = JSONApp(__name__)
 
-          {
-            "feedback": "...",
-          }
+    app.config["MAX_CONTENT_LENGTH"] = 2 * 1024 * 1024
+    app.config["JSON_PROVIDER"] = json_provider
+    install_json(app)
 
-        Returns:
-          200 - feedback sent
-
-          {"msg": "feedback sent"}
-
-          400 - malformed request
-          500 - otherwise
+    @app.before_request
+    def check_content_length() -> None:
+        """Reject bodies over MAX_CONTENT_LENGTH before they are read.
 
+        Flask only enforces MAX_CONTENT_LENGTH for form data, not JSON.
         """
-        body = validate_request_body(FeedbackSchema, request.json)
-        if isinstance(body, str):
-            return {"msg": body}, 400
+        limit = app.config["MAX_CONTENT_LENGTH"]
+        if limit is not None and (request.content_length or 0) > limit:
+            raise RequestEntityTooLarge()
 
-        feedback = body["feedback"]
+    @app.errorhandler(RequestEntityTooLarge)
+    def too_large(err: RequestEntityTooLarge) -> Tuple[Dict[str, str], int]:
+        """Request body over MAX_CONTENT_LENGTH."""
+        return {"msg": "request body too large"}, 413
 
-        send_feedback(app, feedback)
-
-        return {"msg": "feedback sent"}, 200
+    @app.route("/health")
+    def health() -> Tuple[Dict[str, str], int]:
+        """Health route."""
+        return {"msg": "healthy"}, 200
 
+    install_profiler(app)
     return app
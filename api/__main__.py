@@ -6,13 +6,27 @@ from flask_cors import CORS  # type: ignore
 
 from . import create_app, db_connection
 from .auth import auth_routes
+from .bundle import bundle_routes
+from .indexes import ensure_capped, ensure_indexes
+from .mailer.digest import start_scheduler
+from .mailer.outbox import start_workers
+from .metrics import metrics_routes
 from .resource.admin import admin_routes
 from .resource.culture import culture_routes
+from .resource.feedback import feedback_routes
+from .resource.insight import insight_routes
+from .search import search_routes
+from .slow_ops import slow_ops_routes
+from .suggest import suggest_routes
 
 load_dotenv()
 
 db = db_connection.connect()
-app = create_app()
+ensure_capped(db)
+ensure_indexes(db)
+# Gunicorn may fork workers from this process, they open their own connections
+db.close()
+app = create_app(os.getenv("JSON_PROVIDER", "auto"))
 
 app.config.update(
     # EMAIL SETTINGS
@@ -21,13 +35,36 @@ app.config.update(
     MAIL_USE_SSL=True,
     MAIL_USERNAME=os.getenv("GMAIL_ADDRESS"),
     MAIL_PASSWORD=os.getenv("GMAIL_PASSWORD"),
+    MAIL_MAX_ATTEMPTS=int(os.getenv("MAIL_MAX_ATTEMPTS", "5")),
+    FEEDBACK_DIGEST_INTERVAL=int(os.getenv("FEEDBACK_DIGEST_INTERVAL", "3600")),
     SECRET_KEY=os.getenv("SECRET_KEY"),
+    CULTURE_RAW_BSON=os.getenv("CULTURE_RAW_BSON") == "1",
+    CULTURE_READ_MODEL=os.getenv("CULTURE_READ_MODEL", ""),
+    CULTURE_READ_MODEL_INTERVAL=float(os.getenv("CULTURE_READ_MODEL_INTERVAL", "1")),
+    METRICS_DIR=os.getenv("METRICS_DIR"),
+    SLOW_OPS_THRESHOLD_MS=float(os.getenv("SLOW_OPS_THRESHOLD_MS", "100")),
+    SLOW_OPS_EXPLAIN_SAMPLE_RATE=float(os.getenv("SLOW_OPS_EXPLAIN_SAMPLE_RATE", "0")),
+    PROFILE_DIR=os.getenv("PROFILE_DIR"),
+    PROFILE_MODE=os.getenv("PROFILE_MODE", "cprofile"),
+    PROFILE_SAMPLE_RATE=float(os.getenv("PROFILE_SAMPLE_RATE", "0")),
 )
 
 CORS(app)
+metrics_routes(app, db)
+db_connection.pool_routes(app, db)
+slow_ops_routes(app, db)
 auth_routes(app, db)
 admin_routes(app, db)
 culture_routes(app, db)
+insight_routes(app, db)
+bundle_routes(app, db)
+search_routes(app, db)
+suggest_routes(app, db)
+feedback_routes(app, db)
+
+# Deliver queued emails and feedback digests in the background
+start_workers(app, db, int(os.getenv("MAIL_OUTBOX_WORKERS", "1")))
+start_scheduler(app, db)
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0")
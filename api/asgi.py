@@ -0,0 +1,311 @@
+"""ASGI app with a non-blocking read path for the public culture routes.
+
+GET /api/v1/cultures and GET /api/v1/cultures/<name> are answered on the event
+loop with motor, so a worker waiting on MongoDB (or on a slow mobile client)
+keeps serving other requests. Responses match the Flask routes: same bodies,
+ETags, `Cache-Control` and 304s, and the same encoded culture cache.
+
+Every other request, and cultures written before digests were stored, is
+passed to the Flask app, which uvicorn runs in a thread pool. So is every
+request when the Flask app serves cultures from its read model
+(`CULTURE_READ_MODEL`).
+
+The Flask hooks don't run for the two routes, so their responses get the
+CORS headers of `CORS(app)` and are counted in the metrics here. Their MongoDB
+commands go through the command listeners of the Flask app's database, metrics
+and slow operations included. They are not profiled, the profilers of
+api/profiling.py follow one request per thread.
+
+See deploy/gunicorn_asgi.py.
+"""
+import calendar
+import re
+import time
+from email.utils import formatdate, parsedate
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from flask import Flask
+from flask_cors.core import get_cors_headers, get_cors_options  # type: ignore
+
+from .caching import content_digest, make_etag
+from .encoding import PROVIDERS
+from .metrics import record_request
+from .request_schemas import RESERVED_CULTURE_NAMES
+
+Scope = Dict[str, Any]
+Receive = Callable[[], Awaitable[Dict[str, Any]]]
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+ASGIApp = Callable[[Scope, Receive, Send], Awaitable[None]]
+
+CULTURE_PATH = re.compile(r"^/api/v1/cultures/([^/]+)$")
+
+# Static routes under /api/v1/cultures/ served by Flask
+FLASK_CULTURE_ROUTES = RESERVED_CULTURE_NAMES
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """Check an `If-None-Match` header against an ETag.
+
+    Arguments:
+      header: value of `If-None-Match`
+      etag: ETag without quotes
+
+    Returns:
+      True if the header lists the ETag, or is `*`
+    """
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or any(
+        (tag[2:] if tag.startswith("W/") else tag).strip('"') == etag for tag in tags
+    )
+
+
+class AsyncCultureReads:
+    """ASGI app serving culture reads itself and passing the rest on.
+
+    The database is created on the first request, inside the worker's event
+    loop.
+    """
+
+    def __init__(
+        self,
+        flask_app: Flask,
+        fallback: ASGIApp,
+        database_factory: Callable[[], Any],
+        cors: Optional[Dict[str, Any]] = None,
+    ):
+        """Create the app.
+
+        Arguments:
+          flask_app: Flask app, for its config, JSON provider and culture cache
+          fallback: ASGI app serving every other request
+          database_factory: creates the motor database
+          cors: (optional) options of the Flask app's flask-cors extension, no
+            CORS headers are sent when None
+        """
+        self.flask_app = flask_app
+        self.fallback = fallback
+        self.database_factory = database_factory
+        self.cors = cors
+        self.database: Optional[Any] = None
+
+    def db(self) -> Any:
+        """Motor database, created if needed."""
+        if self.database is None:
+            self.database = self.database_factory()
+        return self.database
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Serve a request, see ASGI."""
+        # Flask answers from memory with `CULTURE_READ_MODEL`, nothing to wait on
+        read_model = "culture_read_model" in self.flask_app.extensions
+        if (
+            scope["type"] == "http"
+            and scope["method"] in ("GET", "HEAD")
+            and not read_model
+        ):
+            headers = {
+                key.decode("latin-1").lower(): value.decode("latin-1")
+                for key, value in scope.get("headers", [])
+            }
+            query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+            start = time.perf_counter()
+
+            if scope["path"] == "/api/v1/cultures":
+                response = await self.cultures(query, headers)
+                await self.respond(send, scope, headers, "cultures", start, *response)
+                return
+
+            match = CULTURE_PATH.match(scope["path"])
+            if match and match.group(1) not in FLASK_CULTURE_ROUTES:
+                culture = await self.culture(match.group(1), headers)
+                if culture is not None:
+                    await self.respond(send, scope, headers, "culture", start, *culture)
+                    return
+
+        await self.fallback(scope, receive, send)
+
+    async def respond(
+        self,
+        send: Send,
+        scope: Scope,
+        request_headers: Dict[str, str],
+        endpoint: str,
+        start: float,
+        status: int,
+        headers: List[Tuple[str, str]],
+        body: bytes,
+    ) -> None:
+        """Send a complete response, with CORS headers, and record its metrics.
+
+        Arguments:
+          send: ASGI send
+          scope: ASGI scope of the request
+          request_headers: headers of the request, lowercase names
+          endpoint: name of the Flask endpoint answering the same request
+          start: `time.perf_counter()` when the request was received
+          status: status code of the response
+          headers: headers of the response
+          body: body of the response
+        """
+        headers = headers + [("Content-Length", str(len(body)))]
+        if self.cors is not None:
+            cors = get_cors_headers(
+                self.cors, {"Origin": request_headers.get("origin")}, scope["method"]
+            )
+            headers += list(cors.items(multi=True))
+
+        metrics_file = self.flask_app.extensions.get("metrics_file")
+        if metrics_file is not None:
+            metrics_file.start()
+        record_request(
+            endpoint, scope["method"], status, time.perf_counter() - start, len(body)
+        )
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [
+                    (key.lower().encode("latin-1"), value.encode("latin-1"))
+                    for key, value in headers
+                ],
+            }
+        )
+        await send(
+            {
+                "type": "http.response.body",
+                "body": b"" if scope["method"] == "HEAD" else body,
+            }
+        )
+
+    def json(self, status: int, obj: Any) -> Tuple[int, List[Tuple[str, str]], bytes]:
+        """Encode a JSON response with the Flask app's JSON provider."""
+        dumps = PROVIDERS[self.flask_app.extensions.get("json_provider", "stdlib")]
+        return status, [("Content-Type", "application/json")], dumps(obj)
+
+    def cache_headers(
+        self, etag: str, last_modified: Optional[int] = None
+    ) -> List[Tuple[str, str]]:
+        """Validators and `Cache-Control`, see `api.caching.cache_headers`."""
+        max_age = self.flask_app.config.get("CULTURE_CACHE_MAX_AGE", 0)
+        headers = [
+            ("ETag", f'"{etag}"'),
+            ("Cache-Control", f"public, max-age={max_age}, must-revalidate"),
+        ]
+        if last_modified is not None:
+            headers.append(("Last-Modified", formatdate(last_modified, usegmt=True)))
+        return headers
+
+    @staticmethod
+    def is_fresh(
+        headers: Dict[str, str], etag: str, last_modified: Optional[int] = None
+    ) -> bool:
+        """Check the client's validators, see `api.caching.is_fresh`."""
+        if "if-none-match" in headers:
+            return etag_matches(headers["if-none-match"], etag)
+
+        since = parsedate(headers.get("if-modified-since", ""))
+        if last_modified is None or since is None:
+            return False
+        return last_modified <= calendar.timegm(since)
+
+    async def cultures(
+        self, query: Dict[str, List[str]], headers: Dict[str, str]
+    ) -> Tuple[int, List[Tuple[str, str]], bytes]:
+        """GET /api/v1/cultures, see `api.resource.culture.cultures`."""
+        criteria: Dict[str, Any] = {}
+        if "after" in query:
+            criteria["name"] = {"$gt": query["after"][0]}
+
+        limit_arg = query.get("limit", ["0"])[0]
+        if not limit_arg.isdigit() or int(limit_arg) > self.flask_app.config.get(
+            "CULTURE_PAGE_MAX", 500
+        ):
+            return self.json(400, {"msg": f"invalid limit `{limit_arg}`"})
+        limit = int(limit_arg)
+
+        cursor = (
+            self.db()
+            .cultures.find(criteria, {"_id": 0, "name": 1, "modified": 1})
+            .sort("name")
+            .hint("name_modified")
+            .limit(limit)
+        )
+        cultures = [
+            {"name": culture["name"], "modified": culture["modified"]}
+            async for culture in cursor
+        ]
+
+        page: Dict[str, Any] = {"cultures": cultures}
+        if limit and len(cultures) == limit:
+            page["next"] = cultures[-1]["name"]
+
+        etag = content_digest(page)
+        if self.is_fresh(headers, etag):
+            return 304, self.cache_headers(etag), b""
+
+        status, content_type, body = self.json(200, page)
+        return status, content_type + self.cache_headers(etag), body
+
+    async def culture(
+        self, name: str, headers: Dict[str, str]
+    ) -> Optional[Tuple[int, List[Tuple[str, str]], bytes]]:
+        """GET /api/v1/cultures/<name>, see `api.resource.culture.culture`.
+
+        Returns:
+          response, None to pass the request to Flask
+        """
+        collection = self.db().cultures
+        stamp = await collection.find_one({"name": name}, {"modified": 1, "digest": 1})
+        if stamp is None:
+            return self.json(404, {"msg": f"unknown culture `{name}`"})
+        if "digest" not in stamp:
+            # Flask backfills the digest
+            return None
+
+        modified = stamp["modified"]
+        etag = make_etag(modified, stamp["digest"])
+        if self.is_fresh(headers, etag, modified):
+            return 304, self.cache_headers(etag, modified), b""
+
+        encoded = self.flask_app.extensions["culture_cache"]
+        key = (stamp["_id"], modified, stamp["digest"])
+        data = encoded.get(key)
+        if data is None:
+            culture = await collection.find_one({"_id": stamp["_id"]})
+            if culture is None:
+                return self.json(404, {"msg": f"unknown culture `{name}`"})
+            digest = culture.pop("digest", stamp["digest"])
+            _, _, data = self.json(200, culture)
+            encoded.put((culture["_id"], culture["modified"], digest), data)
+
+        return (
+            200,
+            [("Content-Type", "application/json")] + self.cache_headers(etag, modified),
+            data,
+        )
+
+
+def create_asgi_app() -> AsyncCultureReads:
+    """Construct the ASGI app around the Flask app of `api.__main__`.
+
+    Returns:
+      ASGI app
+    """
+    # pylint: disable=import-outside-toplevel
+    from motor.motor_asyncio import AsyncIOMotorClient  # type: ignore
+    from uvicorn.middleware.wsgi import WSGIMiddleware  # type: ignore
+
+    from .__main__ import app, db
+    from .db_connection import client_options, database_name
+
+    def database() -> Any:
+        return AsyncIOMotorClient(
+            **client_options(), event_listeners=db.command_listeners()
+        )[database_name()]
+
+    # api/__main__.py installs flask-cors with its defaults and the app's config
+    return AsyncCultureReads(
+        app, WSGIMiddleware(app), database, cors=get_cors_options(app)
+    )
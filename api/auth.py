@@ -1,15 +1,28 @@
 """module for Authentication and Authorization Routes."""
-from datetime import timedelta
-from typing import Any, Dict, Tuple
+import secrets
+import time
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Any, Dict, Tuple, Union
 
 from flask import Flask, request
 from flask_jwt_extended import JWTManager  # type: ignore
-from flask_jwt_extended import create_access_token, jwt_required
+from flask_jwt_extended import (create_access_token, create_refresh_token,
+                                decode_token, get_jwt_identity, get_raw_jwt,
+                                jwt_refresh_token_required, jwt_required)
 from pymongo import MongoClient  # type: ignore
+from pymongo.errors import DuplicateKeyError  # type: ignore
 from werkzeug.security import check_password_hash, generate_password_hash
 
 from .request_schemas import (AdminLoginSchema, AdminRegisterSchema,
                               validate_request_body)
+from .throttle import count, stats, take
+
+
+@lru_cache(maxsize=None)
+def dummy_password_hash() -> str:
+    """Hash checked for unknown emails so they cost as much as known ones."""
+    return generate_password_hash(secrets.token_hex(16))
 
 
 def auth_routes(app: Flask, db: MongoClient) -> None:
@@ -17,16 +30,52 @@ def auth_routes(app: Flask, db: MongoClient) -> None:
 
     Docs: https://flask-jwt-extended.readthedocs.io/en/latest/basic_usage/
 
+    Login and register hand out an access token and a refresh token. Refresh
+    tokens are single use, `refresh_tokens` holds the ones not used yet.
+
     Arguments:
         app: Flask app
 
         db: MongoDB client
 
     """
+    # Set before JWTManager, its init_app sets a 15 minute default otherwise
+    app.config.setdefault("JWT_ACCESS_TOKEN_EXPIRES", timedelta(days=1))
+    app.config.setdefault("JWT_REFRESH_TOKEN_EXPIRES", timedelta(days=30))
     jwt = JWTManager(app)
 
+    # Login attempts: burst `CAPACITY`, then `RATE` attempts per second
+    app.config.setdefault("LOGIN_IP_CAPACITY", 20)
+    app.config.setdefault("LOGIN_IP_RATE", 10 / 60)
+    app.config.setdefault("LOGIN_EMAIL_CAPACITY", 5)
+    app.config.setdefault("LOGIN_EMAIL_RATE", 1 / 60)
+
+    def issue_tokens(email: str) -> Dict[str, str]:
+        """Create an access token and a refresh token for an admin.
+
+        Arguments:
+          email: email of admin
+
+        Returns:
+          {"token": JWT, "refresh_token": JWT}
+        """
+        refresh_token = create_refresh_token(identity=email)
+        db.refresh_tokens.insert_one(
+            {
+                "jti": decode_token(refresh_token)["jti"],
+                "email": email,
+                "expires": datetime.utcnow() + app.config["JWT_REFRESH_TOKEN_EXPIRES"],
+            }
+        )
+        return {
+            "token": create_access_token(identity=email),
+            "refresh_token": refresh_token,
+        }
+
     @app.route("/api/v1/login", methods=["POST"])
-    def login() -> Tuple[Dict[str, str], int]:
+    def login() -> Union[
+        Tuple[Dict[str, Any], int], Tuple[Dict[str, str], int, Dict[str, str]]
+    ]:
         """Login a User.
 
         Arguments:
@@ -41,6 +90,7 @@ def auth_routes(app: Flask, db: MongoClient) -> None:
 
           {
             "token": JWT,
+            "refresh_token": JWT,
             "user": {
               "name": "name",
               "email": "test@gmail.com",
@@ -50,6 +100,9 @@ def auth_routes(app: Flask, db: MongoClient) -> None:
 
           400 - malformed request body
           401 - wrong password
+          429 - too many attempts from this IP or for this email
+
+          Retry-After: seconds until the next attempt is allowed
           500 - otherwise
         """
         body = validate_request_body(AdminLoginSchema, request.json)
@@ -59,9 +112,29 @@ def auth_routes(app: Flask, db: MongoClient) -> None:
         email = body["email"]
         password = body["password"]
 
+        # Throttle before hashing, every attempt costs a PBKDF2 hash
+        now = time.time()
+        ip = request.headers.get("X-Real-IP") or request.remote_addr
+        for bucket, capacity, rate in [
+            (f"ip:{ip}", "LOGIN_IP_CAPACITY", "LOGIN_IP_RATE"),
+            (f"email:{email}", "LOGIN_EMAIL_CAPACITY", "LOGIN_EMAIL_RATE"),
+        ]:
+            allowed, retry_after = take(
+                db, bucket, app.config[capacity], app.config[rate], now
+            )
+            if not allowed:
+                count(db, f"rejected_{bucket.split(':')[0]}")
+                return (
+                    {"msg": "Too many login attempts"},
+                    429,
+                    {"Retry-After": str(int(retry_after) + 1)},
+                )
+        count(db, "allowed")
+
         admin = db.admins.find_one({"email": email})
 
         if not admin:
+            check_password_hash(dummy_password_hash(), password)
             return {"msg": "Invalid username or password"}, 401
 
         if not check_password_hash(admin["password"], password):
@@ -70,15 +143,7 @@ def auth_routes(app: Flask, db: MongoClient) -> None:
         admin["_id"] = str(admin["_id"])
         del admin["password"]
 
-        return (
-            {
-                "token": create_access_token(
-                    identity=email, expires_delta=timedelta(days=1)
-                ),
-                "user": admin,
-            },
-            200,
-        )
+        return {**issue_tokens(email), "user": admin}, 200
 
     @app.route("/api/v1/register", methods=["POST"])
     @jwt_required
@@ -102,6 +167,7 @@ def auth_routes(app: Flask, db: MongoClient) -> None:
 
           {
             "token": JWT,
+            "refresh_token": JWT,
             "user": {
               "name": "name",
               "email": "test@gmail.com",
@@ -111,6 +177,7 @@ def auth_routes(app: Flask, db: MongoClient) -> None:
 
           400 - Malformed body
           401 - unauthorized
+          409 - admin with email already exists
           500 - otherwise
         """
         body = validate_request_body(AdminRegisterSchema, request.get_json())
@@ -124,30 +191,66 @@ def auth_routes(app: Flask, db: MongoClient) -> None:
             )
         del body["password_confirmation"]
 
-        if db.admins.find_one({"email": body["email"]}) is not None:
-            return (
-                {
-                    "msg": f"failed to create admin with email <{body['email']}>: duplicate"
-                },
-                409,
-            )
+        duplicate = (
+            {"msg": f"failed to create admin with email <{body['email']}>: duplicate"},
+            409,
+        )
+        # Skip the password hash for taken emails, the unique index still
+        # catches a concurrent register
+        if db.admins.find_one({"email": body["email"]}, {"_id": 1}) is not None:
+            return duplicate
 
         body["password"] = generate_password_hash(body["password"])
         body["superUser"] = False
 
-        result = db.admins.insert_one(body)
+        try:
+            result = db.admins.insert_one(body)
+        except DuplicateKeyError:
+            return duplicate
         if not result.acknowledged:
             return {"msg": "internal error"}, 500
 
         del body["password"]
         body["_id"] = str(body["_id"])
 
-        return (
-            {
-                "user": body,
-                "token": create_access_token(
-                    identity=body["email"], expires_delta=timedelta(days=1)
-                ),
-            },
-            201,
-        )
+        return {"user": body, **issue_tokens(body["email"])}, 201
+
+    @app.route("/api/v1/token/refresh", methods=["POST"])
+    @jwt_refresh_token_required
+    def token_refresh() -> Tuple[Dict[str, str], int]:
+        """Exchange a refresh token for a new access token and refresh token.
+
+        The refresh token is passed via `Authorization: Bearer <refresh_token>`
+        and can only be used once. Reusing one revokes every refresh token of
+        the admin, as it means the token was stolen.
+
+        Returns:
+          200 - new tokens
+
+          {"token": JWT, "refresh_token": JWT}
+
+          401 - refresh token already used or revoked
+          422 - not a refresh token
+          500 - otherwise
+        """
+        email = get_jwt_identity()
+        if db.refresh_tokens.find_one_and_delete({"jti": get_raw_jwt()["jti"]}) is None:
+            db.refresh_tokens.delete_many({"email": email})
+            return {"msg": "refresh token revoked"}, 401
+
+        return issue_tokens(email), 200
+
+    @app.route("/api/v1/login/throttle")
+    @jwt_required
+    def login_throttle() -> Tuple[Dict[str, int], int]:
+        """Fetch the login limiter counters.
+
+        Returns:
+          200 - counters since the limiter was deployed
+
+          {"allowed": 10, "rejected_ip": 2, "rejected_email": 1, "buckets": 3}
+
+          401 - bad auth token
+          500 - otherwise
+        """
+        return stats(db), 200
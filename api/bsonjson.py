@@ -0,0 +1,135 @@
+"""Module for transcoding raw BSON straight to JSON.
+
+Decoding a large culture into dicts and lists only to encode them again
+allocates an object graph the size of the document, twice over. `transcode`
+walks the BSON bytes instead and yields JSON in chunks, allocating one value
+at a time.
+
+ObjectId, datetime and Decimal128 are rendered as strings, the way
+`api.encoding` renders them. Binary becomes a base64 string and non finite
+doubles become null. Other BSON types (e.g. regex, code) never occur in
+cultures and raise ValueError.
+"""
+import base64
+import math
+import struct
+from datetime import datetime, timedelta
+from json.encoder import encode_basestring  # type: ignore
+from typing import Dict, Iterator, Tuple
+
+from bson.decimal128 import Decimal128  # type: ignore
+
+INT32 = struct.Struct("<i")
+INT64 = struct.Struct("<q")
+DOUBLE = struct.Struct("<d")
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def _string(data: bytes, pos: int) -> bytes:
+    """JSON string of the BSON string at `pos`, length prefix included."""
+    length = INT32.unpack_from(data, pos)[0]
+    value = data[pos + 4 : pos + 3 + length].decode("utf-8")
+    return encode_basestring(value).encode("utf-8")
+
+
+def _key(key: bytes) -> bytes:
+    """JSON object key of a BSON element name, colon included."""
+    return encode_basestring(key.decode("utf-8")).encode("utf-8") + b":"
+
+
+def _scalar(data: bytes, kind: int, pos: int) -> Tuple[bytes, int]:
+    """JSON of the BSON value of type `kind` at `pos`.
+
+    Returns:
+      (JSON, position after the value)
+    """
+    if kind == 0x01:
+        value = DOUBLE.unpack_from(data, pos)[0]
+        return (repr(value).encode() if math.isfinite(value) else b"null"), pos + 8
+    if kind == 0x02:
+        return _string(data, pos), pos + 4 + INT32.unpack_from(data, pos)[0]
+    if kind == 0x05:
+        length = INT32.unpack_from(data, pos)[0]
+        encoded = base64.b64encode(data[pos + 5 : pos + 5 + length])
+        return b'"' + encoded + b'"', pos + 5 + length
+    if kind == 0x07:
+        return b'"' + data[pos : pos + 12].hex().encode() + b'"', pos + 12
+    if kind == 0x08:
+        return (b"true" if data[pos] else b"false"), pos + 1
+    if kind == 0x09:
+        millis = INT64.unpack_from(data, pos)[0]
+        value = str(EPOCH + timedelta(milliseconds=millis))
+        return encode_basestring(value).encode(), pos + 8
+    if kind in (0x06, 0x0A):
+        return b"null", pos
+    if kind == 0x10:
+        return str(INT32.unpack_from(data, pos)[0]).encode(), pos + 4
+    if kind == 0x12:
+        return str(INT64.unpack_from(data, pos)[0]).encode(), pos + 8
+    if kind == 0x13:
+        value = str(Decimal128.from_bid(data[pos : pos + 16]))
+        return encode_basestring(value).encode(), pos + 16
+    raise ValueError(f"unsupported BSON type 0x{kind:02x}")
+
+
+def transcode(data: bytes, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """Transcode a BSON document to JSON.
+
+    Arguments:
+      data: BSON document, e.g. `RawBSONDocument.raw`
+      chunk_size: approximate size of the chunks yielded
+
+    Yields:
+      UTF-8 encoded JSON in chunks of about `chunk_size` bytes
+    """
+    buffer = bytearray(b"{")
+    # (end of the document, whether it is an array) of enclosing documents
+    stack = [(INT32.unpack_from(data, 0)[0] - 1, False)]
+    pos = 4
+    first = True
+    keys: Dict[bytes, bytes] = {}
+
+    while stack:
+        end, array = stack[-1]
+        if pos >= end:
+            # Trailing NUL of the document
+            buffer += b"]" if array else b"}"
+            stack.pop()
+            pos = end + 1
+            first = False
+            continue
+
+        kind = data[pos]
+        key_end = data.index(b"\x00", pos + 1, end)
+        if not first:
+            buffer += b","
+        if not array:
+            # Cultures repeat a handful of keys, encode each once
+            key = data[pos + 1 : key_end]
+            encoded = keys.get(key)
+            if encoded is None:
+                encoded = keys[key] = _key(key)
+            buffer += encoded
+        pos = key_end + 1
+
+        if kind == 0x02:
+            length = INT32.unpack_from(data, pos)[0]
+            buffer += _string(data, pos)
+            pos += 4 + length
+        elif kind in (0x03, 0x04):
+            stack.append((pos + INT32.unpack_from(data, pos)[0] - 1, kind == 0x04))
+            buffer += b"[" if kind == 0x04 else b"{"
+            pos += 4
+            first = True
+            continue
+        else:
+            value, pos = _scalar(data, kind, pos)
+            buffer += value
+        first = False
+
+        if len(buffer) >= chunk_size:
+            yield bytes(buffer)
+            buffer.clear()
+
+    yield bytes(buffer)
@@ -0,0 +1,301 @@
+"""Module for the offline download bundle of the whole culture catalog.
+
+See docs/culture-download.md. The bundle is built once per catalog version,
+in a background thread after cultures are created, updated or deleted, and
+kept on disk as `bundle-<version>-<hash>.json.gz`. Requests only stream the
+file, a bundle is only built by a request when its version isn't built yet.
+
+Each version is built once: a process builds one bundle at a time, and the
+process creating `bundle-<version>.building` first builds that version while
+the others wait for its bundle.
+"""
+import glob
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from flask import Flask, Response, send_file
+from pymongo import MongoClient  # type: ignore
+
+from .caching import cache_headers, is_fresh, not_modified
+from .catalog import catalog_version, subscribe
+
+
+def bundle_dir(app: Flask) -> str:
+    """Directory bundles are stored in, `$BUNDLE_DIR` or `<instance>/bundles`.
+
+    Arguments:
+      app: Flask app
+
+    Returns:
+      path of the directory
+    """
+    return app.config.get("BUNDLE_DIR") or os.path.join(app.instance_path, "bundles")
+
+
+def bundle_hash(path: str) -> str:
+    """Extract the content hash from a bundle's file name.
+
+    Arguments:
+      path: path of the bundle
+
+    Returns:
+      content hash of the bundle
+    """
+    return os.path.basename(path).split(".")[0].split("-")[-1]
+
+
+# One build at a time per process
+BUILD_LOCK = threading.Lock()
+
+
+def find_bundle(app: Flask, version: int) -> Optional[str]:
+    """Find the bundle of a catalog version.
+
+    Arguments:
+      app: Flask app
+      version: catalog version
+
+    Returns:
+      path of the bundle, None when it isn't built
+    """
+    bundles = glob.glob(os.path.join(bundle_dir(app), f"bundle-{version}-*.json.gz"))
+    return min(bundles) if bundles else None
+
+
+def wait_for_claim(app: Flask, claim: str) -> None:
+    """Wait until the process that claimed a version has built it.
+
+    A claim older than `$BUNDLE_BUILD_TIMEOUT` (default 60) seconds was left by
+    a worker that died building, it is removed.
+
+    Arguments:
+      app: Flask app
+      claim: path of the claim
+    """
+    timeout = app.config.get("BUNDLE_BUILD_TIMEOUT", 60)
+    while True:
+        try:
+            if time.time() - os.path.getmtime(claim) > timeout:
+                os.remove(claim)
+                return
+        except FileNotFoundError:
+            return
+        time.sleep(0.05)
+
+
+def build_bundle(app: Flask, db: MongoClient) -> str:
+    """Build the bundle of the current catalog version, unless already built.
+
+    Arguments:
+      app: Flask app
+      db: MongoDB client
+
+    Returns:
+      path of the bundle
+    """
+    directory = bundle_dir(app)
+    os.makedirs(directory, exist_ok=True)
+    with BUILD_LOCK:
+        while True:
+            version = catalog_version(db)
+            path = find_bundle(app, version["version"])
+            if path is not None:
+                return path
+
+            claim = os.path.join(directory, f"bundle-{version['version']}.building")
+            try:
+                os.close(os.open(claim, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            except FileExistsError:
+                wait_for_claim(app, claim)
+                continue
+            try:
+                return write_bundle(app, db, version)
+            finally:
+                os.remove(claim)
+
+
+def write_bundle(app: Flask, db: MongoClient, version: Dict[str, int]) -> str:
+    """Write the bundle of a catalog version.
+
+    Format (gzip compressed):
+    {
+      "version": 42,
+      "modified": 00000000,
+      "cultures": [{"name": "culture1", ...}, ...]
+    }
+
+    Arguments:
+      app: Flask app
+      db: MongoDB client
+      version: catalog version and last modified time
+
+    Returns:
+      path of the bundle
+    """
+    cultures = list(db.cultures.find({}, {"digest": 0}).sort("name"))
+    for culture in cultures:
+        culture["_id"] = str(culture["_id"])
+
+    payload = json.dumps(
+        {**version, "cultures": cultures}, separators=(",", ":")
+    ).encode("utf-8")
+    digest = hashlib.sha256(payload).hexdigest()[:16]
+
+    path = os.path.join(bundle_dir(app), f"bundle-{version['version']}-{digest}.json.gz")
+
+    # Write then rename so a concurrent request never streams a partial file
+    partial = f"{path}.{os.getpid()}.tmp"
+    with open(partial, "wb") as f:
+        f.write(gzip.compress(payload, compresslevel=6, mtime=0))
+    os.replace(partial, path)
+
+    prune_bundles(app)
+    return path
+
+
+def prune_bundles(app: Flask) -> None:
+    """Delete all but the newest `$BUNDLE_KEEP` (default 3) bundles.
+
+    Arguments:
+      app: Flask app
+    """
+    bundles = sorted(
+        glob.glob(os.path.join(bundle_dir(app), "bundle-*.json.gz")),
+        key=lambda path: int(os.path.basename(path).split("-")[1]),
+    )
+    for path in bundles[: -app.config.get("BUNDLE_KEEP", 3)]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class BundleRebuild:
+    """Rebuilds the bundle in a background thread after catalog writes.
+
+    Writes within `$BUNDLE_REBUILD_DELAY` seconds (default 1) of the first
+    share one build, so a burst of insight edits costs a single build.
+    """
+
+    def __init__(self, app: Flask):
+        """Create the rebuild of an app.
+
+        Arguments:
+          app: Flask app
+        """
+        self.app = app
+        self._lock = threading.Lock()
+        self._pending = False
+
+    def schedule(self, db: MongoClient) -> None:
+        """Build the bundle after the delay, unless a build is already due.
+
+        Arguments:
+          db: MongoDB client
+        """
+        with self._lock:
+            if self._pending:
+                return
+            self._pending = True
+
+        timer = threading.Timer(
+            self.app.config.get("BUNDLE_REBUILD_DELAY", 1), self._build, args=(db,)
+        )
+        timer.daemon = True
+        timer.start()
+
+    def _build(self, db: MongoClient) -> None:
+        """Build the bundle of the latest catalog version."""
+        with self._lock:
+            # Writes landing during the build schedule another one
+            self._pending = False
+        try:
+            build_bundle(self.app, db)
+        except Exception:  # pylint: disable=broad-except
+            self.app.logger.exception("bundle rebuild failed")
+
+
+def current_bundle(app: Flask, db: MongoClient) -> str:
+    """Find the bundle of the current catalog version, building it if missing.
+
+    Arguments:
+      app: Flask app
+      db: MongoDB client
+
+    Returns:
+      path of the bundle
+    """
+    path = find_bundle(app, catalog_version(db)["version"])
+    if path is not None:
+        return path
+
+    return build_bundle(app, db)
+
+
+def send_bundle(path: str) -> Response:
+    """Stream a bundle, gunicorn serves it with sendfile(2).
+
+    Arguments:
+      path: path of the bundle
+
+    Returns:
+      response streaming the file
+    """
+    return send_file(
+        path,
+        mimetype="application/gzip",
+        as_attachment=True,
+        attachment_filename="cultures.json.gz",
+        add_etags=False,
+        conditional=False,
+    )
+
+
+def bundle_routes(app: Flask, db: MongoClient) -> None:
+    """Adds the bundle route to Flask App and rebuilds it after culture writes.
+
+    Arguments:
+    app: Flask app
+
+    db: MongoDB client
+    """
+    subscribe(app, BundleRebuild(app).schedule)
+
+    @app.route("/api/v1/bundle")
+    def bundle() -> Response:
+        """Download every culture as one gzip compressed JSON document.
+
+        The ETag is the bundle's content hash, `If-None-Match` with the hash of
+        the client's copy is answered with 304.
+
+        Returns:
+          200 - gzip compressed bundle (application/gzip)
+
+          {
+            "version": 42,
+            "modified": 00000000,
+            "cultures": [{"name": "culture1", ...}, ...]
+          }
+
+          304 - bundle unchanged since the client's copy
+          500 - otherwise
+        """
+        path = current_bundle(app, db)
+        etag = bundle_hash(path)
+        if is_fresh(etag):
+            return not_modified(etag)
+
+        try:
+            response = send_bundle(path)
+        except FileNotFoundError:
+            # Pruned by a newer build since it was looked up
+            path = current_bundle(app, db)
+            etag = bundle_hash(path)
+            response = send_bundle(path)
+
+        return cache_headers(response, etag)
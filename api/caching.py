@@ -0,0 +1,114 @@
+"""Module for HTTP caching helpers used by conditional GET requests.
+
+Cultures carry a `modified` timestamp and a `digest` of their content, which
+are combined into a strong ETag. Clients that revalidate with `If-None-Match`
+or `If-Modified-Since` get an empty 304 instead of the whole document.
+
+Partial updates, which never see the whole document, store a random
+`revision` as the digest instead. It changes the ETag all the same.
+"""
+import calendar
+import hashlib
+import json
+import uuid
+from typing import Any, Dict, Optional
+
+from flask import Response, current_app, request
+
+# Fields that describe a stored document rather than its content
+UNHASHED_FIELDS = ("_id", "digest")
+
+
+def content_digest(document: Dict[str, Any]) -> str:
+    """Hash the content of a document.
+
+    Arguments:
+      document: document to hash, `_id` and `digest` are ignored
+
+    Returns:
+      hex encoded sha256 of the canonical JSON encoding of `document`
+    """
+    content = {k: v for k, v in document.items() if k not in UNHASHED_FIELDS}
+    encoded = json.dumps(content, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def revision() -> str:
+    """Digest for a partially updated document.
+
+    Returns:
+      random hex string, unique to this write
+    """
+    return uuid.uuid4().hex
+
+
+def make_etag(modified: int, digest: str) -> str:
+    """Build a strong ETag from a `modified` timestamp and content digest.
+
+    Arguments:
+      modified: EPOCH timestamp of the last write
+      digest: content digest of the document
+
+    Returns:
+      ETag value without quotes
+    """
+    return f"{modified}-{digest[:16]}"
+
+
+def is_fresh(etag: Optional[str], last_modified: Optional[int] = None) -> bool:
+    """Check whether the client's cached copy is still valid.
+
+    `If-None-Match` takes precedence over `If-Modified-Since` (RFC 7232 6).
+
+    Arguments:
+      etag: current ETag of the resource
+      last_modified: EPOCH timestamp of the last write of the resource
+
+    Returns:
+      True if a 304 can be returned
+    """
+    if request.if_none_match:
+        return etag is not None and request.if_none_match.contains(etag)
+
+    since = request.if_modified_since
+    if last_modified is None or since is None:
+        return False
+
+    return last_modified <= calendar.timegm(since.utctimetuple())
+
+
+def cache_headers(
+    response: Response, etag: Optional[str], last_modified: Optional[int] = None
+) -> Response:
+    """Attach validators and `Cache-Control` to a response.
+
+    Arguments:
+      response: response to modify
+      etag: ETag of the resource
+      last_modified: EPOCH timestamp of the last write of the resource
+
+    Returns:
+      the modified response
+    """
+    if etag is not None:
+        response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config.get("CULTURE_CACHE_MAX_AGE", 0)
+    response.cache_control.must_revalidate = True
+    return response
+
+
+def not_modified(etag: Optional[str], last_modified: Optional[int] = None) -> Response:
+    """Construct an empty 304 response.
+
+    Arguments:
+      etag: ETag of the resource
+      last_modified: EPOCH timestamp of the last write of the resource
+
+    Returns:
+      304 response
+    """
+    return cache_headers(Response(status=304), etag, last_modified)
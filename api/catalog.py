@@ -0,0 +1,227 @@
+"""Module for tracking changes to the culture catalog.
+
+Every write to `cultures` bumps a catalog-wide version number stored in the
+`catalog` collection. Deleted (or renamed) cultures leave a tombstone in
+`culture_tombstones` so clients can sync incrementally instead of
+re-downloading every culture.
+
+Anything derived from the whole catalog (e.g. the offline bundle) can
+`subscribe` to be rebuilt when the culture routes `notify` of a write.
+In-memory indexes extend `CatalogMirror` to be kept current incrementally.
+"""
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from flask import Flask
+from pymongo import MongoClient, ReturnDocument  # type: ignore
+
+CATALOG_ID = "cultures"
+
+# Fields of cultures `changes_since` fetches by default
+CHANGES_PROJECTION = {"digest": 0}
+
+# Seconds before `since` that `changes_since` looks back, see there
+CHANGES_WINDOW = 60
+
+
+def catalog_version(db: MongoClient) -> Dict[str, int]:
+    """Fetch the current catalog version.
+
+    Arguments:
+      db: MongoDB client
+
+    Returns:
+      {"version": 0, "modified": 00000000}
+    """
+    catalog = db.catalog.find_one({"_id": CATALOG_ID}) or {}
+    return {
+        "version": catalog.get("version", 0),
+        "modified": catalog.get("modified", 0),
+    }
+
+
+def _bump(db: MongoClient, modified: int) -> int:
+    """Increment the catalog version.
+
+    Arguments:
+      db: MongoDB client
+      modified: EPOCH timestamp of the write
+
+    Returns:
+      the new catalog version
+    """
+    catalog = db.catalog.find_one_and_update(
+        {"_id": CATALOG_ID},
+        {"$inc": {"version": 1}, "$max": {"modified": modified}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return catalog["version"]
+
+
+def culture_written(db: MongoClient, name: str, modified: int) -> int:
+    """Record that a culture was created or updated.
+
+    Arguments:
+      db: MongoDB client
+      name: name of the culture
+      modified: EPOCH timestamp of the write
+
+    Returns:
+      the new catalog version
+    """
+    db.culture_tombstones.delete_one({"name": name})
+    return _bump(db, modified)
+
+
+def culture_deleted(db: MongoClient, name: str, modified: int) -> int:
+    """Record that a culture was deleted or renamed away from `name`.
+
+    Arguments:
+      db: MongoDB client
+      name: name of the culture
+      modified: EPOCH timestamp of the delete
+
+    Returns:
+      the new catalog version
+    """
+    db.culture_tombstones.update_one(
+        {"name": name}, {"$set": {"deleted": modified}}, upsert=True
+    )
+    return _bump(db, modified)
+
+
+def changes_since(
+    db: MongoClient,
+    since: int,
+    projection: Optional[Dict[str, Any]] = CHANGES_PROJECTION,
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Fetch cultures written and deleted at or after `since`, and shortly before.
+
+    `modified` is stamped when a write starts but the catalog's `modified` only
+    moves when it lands, so a slow write (or one from a host with a lagging
+    clock) can land after a sync with an older stamp. Changes from
+    `CHANGES_WINDOW` seconds before `since` are sent again rather than missed.
+
+    Arguments:
+      db: MongoDB client
+      since: EPOCH timestamp, usually `modified` of the previous sync
+      projection: (optional) fields of cultures to fetch, all but `digest` by
+        default, None for every field
+
+    Returns:
+      (cultures, tombstones)
+    """
+    since -= CHANGES_WINDOW
+    cultures = list(
+        db.cultures.find({"modified": {"$gte": since}}, projection)
+    )
+    for culture in cultures:
+        culture["_id"] = str(culture["_id"])
+
+    tombstones = list(
+        db.culture_tombstones.find({"deleted": {"$gte": since}}, {"_id": 0})
+    )
+    return cultures, tombstones
+
+
+def subscribe(app: Flask, listener: Callable[[MongoClient], Any]) -> None:
+    """Register a listener called after every write to the catalog.
+
+    Arguments:
+      app: Flask app
+      listener: called with the MongoDB client, its result is ignored
+    """
+    app.extensions.setdefault("catalog_listeners", []).append(listener)
+
+
+def notify(app: Flask, db: MongoClient) -> None:
+    """Call every listener registered with `subscribe`.
+
+    A failing listener is logged, the write it follows has already succeeded.
+
+    Arguments:
+      app: Flask app
+      db: MongoDB client
+    """
+    for listener in app.extensions.get("catalog_listeners", []):
+        try:
+            listener(db)
+        except Exception:  # pylint: disable=broad-except
+            app.logger.exception("catalog listener %r failed", listener)
+
+
+class CatalogMirror(ABC):
+    """In-memory data derived from cultures, kept current incrementally.
+
+    Loaded on the first `refresh`. The worker handling a write refreshes
+    through the catalog listeners, other workers pick the write up from
+    `changes_since` once the catalog version moves. Thread safe, gthread
+    workers share one mirror.
+
+    Subclasses implement `_add` and `_remove`, both called with `_lock` held.
+    """
+
+    # Fields of cultures `_add` needs, None for every field
+    projection: Optional[Dict[str, Any]] = CHANGES_PROJECTION
+
+    def __init__(self) -> None:
+        """Create an empty mirror, nothing is loaded until `refresh`."""
+        self.version: Optional[int] = None
+        self.modified = 0
+        self.checked = 0.0
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def _add(self, culture: Dict[str, Any]) -> None:
+        """Add a culture, replacing an older copy of it."""
+
+    @abstractmethod
+    def _remove(self, name: str) -> None:
+        """Drop a culture."""
+
+    def refresh(self, db: MongoClient) -> None:
+        """Apply writes made since the last refresh.
+
+        Arguments:
+          db: MongoDB client
+        """
+        with self._lock:
+            self.checked = time.monotonic()
+            version = catalog_version(db)
+            if version["version"] == self.version:
+                return
+
+            cultures, tombstones = changes_since(db, self.modified, self.projection)
+            for tombstone in tombstones:
+                self._remove(tombstone["name"])
+            for culture in cultures:
+                self._add(culture)
+
+            self.version = version["version"]
+            self.modified = version["modified"]
+
+    def refresh_if_stale(self, db: MongoClient, interval: float) -> None:
+        """Refresh unless it was checked less than `interval` seconds ago.
+
+        Arguments:
+          db: MongoDB client
+          interval: seconds between checks of the catalog version
+        """
+        if self.version is None or time.monotonic() - self.checked >= interval:
+            self.refresh(db)
+
+    def follow(self, app: Flask) -> None:
+        """Refresh after every write of this worker, once loaded.
+
+        Arguments:
+          app: Flask app
+        """
+
+        def written(db: MongoClient) -> None:
+            if self.version is not None:
+                self.refresh(db)
+
+        subscribe(app, written)
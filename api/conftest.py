@@ -1,12 +1,24 @@
 """Pytest setup."""
+import socketserver
+import threading
+
 import mongomock  # type: ignore
 import pytest  # type: ignore
 from werkzeug.security import generate_password_hash
 
 from . import create_app
 from .auth import auth_routes
+from .bundle import bundle_routes
+from .db_connection import LazyDatabase, pool_routes
+from .indexes import ensure_indexes
+from .metrics import metrics_routes
 from .resource.admin import admin_routes
 from .resource.culture import culture_routes
+from .resource.feedback import feedback_routes
+from .resource.insight import insight_routes
+from .search import search_routes
+from .slow_ops import slow_ops_routes
+from .suggest import suggest_routes
 
 
 def login_admin(flask_client):
@@ -26,17 +38,39 @@ def login_admin(flask_client):
 
 
 @pytest.fixture
-def client():
-    """Constructs Flask test client."""
-    db = mongomock.MongoClient().db
+def db():
+    """Constructs mongomock database with every index."""
+    db = LazyDatabase("db", {}, lambda **options: mongomock.MongoClient())
+    ensure_indexes(db)
+    return db
+
+
+@pytest.fixture
+def app(db, tmp_path):
+    """Constructs Flask app with every route."""
     app = create_app()
     app.config["SECRET_KEY"] = "testing"
+    app.config["BUNDLE_DIR"] = str(tmp_path / "bundles")
 
+    metrics_routes(app, db)
+    pool_routes(app, db)
+    slow_ops_routes(app, db)
     auth_routes(app, db)
     admin_routes(app, db)
     culture_routes(app, db)
+    insight_routes(app, db)
+    bundle_routes(app, db)
+    search_routes(app, db)
+    suggest_routes(app, db)
+    feedback_routes(app, db)
     app.config["TESTING"] = True
 
+    return app
+
+
+@pytest.fixture
+def client(app, db):
+    """Constructs Flask test client."""
     # Create test user
     db.admins.insert_one(
         {
@@ -52,3 +86,76 @@ def client():
     flask_client.environ_base["HTTP_AUTHORIZATION"] = "Bearer " + token
 
     yield flask_client
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """Local SMTP server that records every message it receives."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        """Listen on a free local port."""
+        super().__init__(("127.0.0.1", 0), SMTPHandler)
+        self.messages = []
+        self.connections = 0
+        self.fail = False
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """Speaks just enough SMTP for smtplib."""
+
+    def reply(self, line):
+        """Write one reply line."""
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        """Serve one SMTP session."""
+        self.server.connections += 1
+        self.reply("220 localhost stand-in")
+        recipients = []
+        for raw in self.rfile:
+            command = raw.decode().strip()
+            verb = command.split(" ")[0].upper()
+            if verb in ("EHLO", "HELO"):
+                self.reply("250 localhost")
+            elif verb == "MAIL":
+                recipients = []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                recipients.append(command.split(":", 1)[1].strip("<> "))
+                self.reply("250 OK")
+            elif verb == "DATA":
+                if self.server.fail:
+                    self.reply("451 try again later")
+                    continue
+                self.reply("354 end with .")
+                data = b"".join(iter(self.rfile.readline, b".\r\n"))
+                self.server.messages.append({"to": recipients, "data": data})
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+@pytest.fixture
+def smtp_server(app):
+    """Runs a local SMTP stand-in and points the app at it."""
+    server = SMTPStandIn()
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+
+    app.config.update(
+        MAIL_SERVER="127.0.0.1",
+        MAIL_PORT=server.server_address[1],
+        MAIL_USE_SSL=False,
+        MAIL_SUPPRESS_SEND=False,
+        MAIL_USERNAME="app@gmail.com",
+    )
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
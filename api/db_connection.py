@@ -1,54 +1,317 @@
-"""Module that handles MongoDB connection."""
+"""Module that handles MongoDB connection.
+
+`connect` returns a `LazyDatabase`, which creates its MongoClient on first use
+in each process. Gunicorn forks workers after the app is imported, and a
+MongoClient must not be shared across a fork, so each worker gets its own
+client and connection pool.
+
+Pool ENV variables (all optional):
+    MONGO_MAX_POOL_SIZE - connections per server per worker (default 100)
+    MONGO_MIN_POOL_SIZE - connections kept open while idle (default 0)
+    MONGO_MAX_IDLE_TIME_MS - close connections idle for longer
+    MONGO_WAIT_QUEUE_TIMEOUT_MS - fail a request waiting longer for a connection
+    MONGO_SERVER_SELECTION_TIMEOUT_MS - fail when no server answers (default 5000)
+    MONGO_CONNECT_TIMEOUT_MS - timeout of opening a connection (default 5000)
+    MONGO_READ_CONCERN - e.g. local, majority
+    MONGO_WRITE_CONCERN - e.g. 1, majority
+"""
 import os
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from dotenv import load_dotenv
-from pymongo import MongoClient  # type:ignore
-from pymongo.errors import ServerSelectionTimeoutError  # type:ignore
+from flask import Flask
+from flask_jwt_extended import jwt_required  # type: ignore
+from pymongo import MongoClient, monitoring  # type:ignore
+
+from .metrics import CommandMetrics
 
 load_dotenv()
 
-FLASK_ENV = os.getenv("FLASK_ENV")
-DOMAIN = os.getenv("MONGO_IP")
-PORT = os.getenv("MONGO_PORT")
-MONGO_INITDB_DATABASE = os.getenv("MONGO_INITDB_DATABASE")
-MONGO_INITDB_ROOT_USERNAME = os.getenv("MONGO_INITDB_ROOT_USERNAME")
-MONGO_INITDB_ROOT_PASSWORD = os.getenv("MONGO_INITDB_ROOT_PASSWORD")
-MONGO_URI = os.getenv("MONGO_URI")
+POOL_ENV = {
+    "maxPoolSize": "MONGO_MAX_POOL_SIZE",
+    "minPoolSize": "MONGO_MIN_POOL_SIZE",
+    "maxIdleTimeMS": "MONGO_MAX_IDLE_TIME_MS",
+    "waitQueueTimeoutMS": "MONGO_WAIT_QUEUE_TIMEOUT_MS",
+    "serverSelectionTimeoutMS": "MONGO_SERVER_SELECTION_TIMEOUT_MS",
+    "connectTimeoutMS": "MONGO_CONNECT_TIMEOUT_MS",
+}
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Connection pool counters of one process, per server.
+
+    `in_use` against `MONGO_MAX_POOL_SIZE` and the time spent waiting for a
+    connection show whether the pool is sized for the worker's threads.
+    """
+
+    def __init__(self) -> None:
+        """Create zeroed counters."""
+        self._lock = threading.Lock()
+        self._pools: Dict[str, Dict[str, float]] = defaultdict(
+            lambda: defaultdict(float)
+        )
+        self._waiting = threading.local()
+
+    def _count(self, address: Tuple[str, int], counter: str, value: float = 1) -> None:
+        """Add to a counter of the pool of `address`."""
+        with self._lock:
+            self._pools["%s:%d" % address][counter] += value
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Copy the counters.
+
+        Returns:
+          {
+            "host:27017": {
+              "open": 3, "in_use": 1, "created": 4, "closed": 1,
+              "checked_out": 120, "check_out_failed": 0,
+              "wait_seconds": 0.02, "max_wait_seconds": 0.01, "cleared": 0
+            }
+          }
+        """
+        with self._lock:
+            return {address: dict(pool) for address, pool in self._pools.items()}
+
+    def pool_created(self, event: monitoring.PoolCreatedEvent) -> None:
+        """Pool opened."""
+        self._count(event.address, "open", 0)
+
+    def pool_cleared(self, event: monitoring.PoolClearedEvent) -> None:
+        """Pool connections dropped, e.g. on a network error."""
+        self._count(event.address, "cleared")
+
+    def pool_closed(self, event: monitoring.PoolClosedEvent) -> None:
+        """Pool closed."""
+
+    def connection_created(self, event: monitoring.ConnectionCreatedEvent) -> None:
+        """Connection opened."""
+        self._count(event.address, "created")
+        self._count(event.address, "open")
+
+    def connection_ready(self, event: monitoring.ConnectionReadyEvent) -> None:
+        """Connection handshake done."""
+
+    def connection_closed(self, event: monitoring.ConnectionClosedEvent) -> None:
+        """Connection closed."""
+        self._count(event.address, "closed")
+        self._count(event.address, "open", -1)
+
+    def connection_check_out_started(
+        self, event: monitoring.ConnectionCheckOutStartedEvent
+    ) -> None:
+        """Thread started waiting for a connection."""
+        self._waiting.since = time.monotonic()
+
+    def connection_check_out_failed(
+        self, event: monitoring.ConnectionCheckOutFailedEvent
+    ) -> None:
+        """Thread gave up waiting for a connection."""
+        self._count(event.address, "check_out_failed")
+
+    def connection_checked_out(
+        self, event: monitoring.ConnectionCheckedOutEvent
+    ) -> None:
+        """Thread got a connection."""
+        waited = time.monotonic() - getattr(self._waiting, "since", time.monotonic())
+        with self._lock:
+            pool = self._pools["%s:%d" % event.address]
+            pool["checked_out"] += 1
+            pool["in_use"] += 1
+            pool["wait_seconds"] += waited
+            pool["max_wait_seconds"] = max(pool["max_wait_seconds"], waited)
+
+    def connection_checked_in(self, event: monitoring.ConnectionCheckedInEvent) -> None:
+        """Thread returned a connection."""
+        self._count(event.address, "in_use", -1)
+
+
+class LazyDatabase:
+    """Database creating its MongoClient on first use in each process.
+
+    Behaves like a pymongo Database, `db.cultures` and `db["cultures"]` are
+    collections of the current process' client. Thread safe.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        options: Dict[str, Any],
+        factory: Callable[..., MongoClient] = MongoClient,
+    ):
+        """Create the database, no connection is made until it is used.
+
+        Arguments:
+          name: database name
+          options: MongoClient keyword arguments
+          factory: creates the client from `options`
+        """
+        self._name = name
+        self._options = options
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._client: Optional[MongoClient] = None
+        self.pool_stats = PoolStats()
+        # Further event listeners of the clients created from now on
+        self.listeners: List[Any] = []
+
+    def client(self) -> MongoClient:
+        """Client of the current process, created if needed.
+
+        Returns:
+          MongoClient
+        """
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    # Forked, or never used: the parent's client is left alone
+                    self.pool_stats = PoolStats()
+                    self._client = self._factory(
+                        **self._options,
+                        event_listeners=[self.pool_stats, *self.command_listeners()],
+                    )
+                    self._pid = pid
+        return self._client
+
+    def command_listeners(self) -> List[Any]:
+        """Command listeners of the clients created from now on.
 
-def connect() -> MongoClient:
-    """Establishes a connection to the database.
+        The motor client of api/asgi.py takes them too, so its commands are
+        timed and recorded like the ones of this database.
+
+        Returns:
+          metrics listener and `listeners`
+        """
+        return [CommandMetrics(), *self.listeners]
+
+    def close(self) -> None:
+        """Close this process' client, the next use creates a new one."""
+        with self._lock:
+            if self._client is not None and self._pid == os.getpid():
+                self._client.close()
+            self._client = None
+            self._pid = None
+
+    def options(self) -> Dict[str, Any]:
+        """Client options, without credentials.
+
+        Returns:
+          MongoClient keyword arguments
+        """
+        hidden = ("host", "username", "password")
+        return {k: v for k, v in self._options.items() if k not in hidden}
+
+    def __getattr__(self, name: str) -> Any:
+        """Attribute (e.g. collection) of the pymongo Database."""
+        return getattr(self.client()[self._name], name)
+
+    def __getitem__(self, name: str) -> Any:
+        """Collection of the pymongo Database."""
+        return self.client()[self._name][name]
+
+
+def client_options() -> Dict[str, Any]:
+    """Build MongoClient options from ENV variables.
+
+    Returns:
+      MongoClient keyword arguments
+    """
+    options: Dict[str, Any] = {
+        "serverSelectionTimeoutMS": 5000,
+        "connectTimeoutMS": 5000,
+        # Monitoring threads start on first use, never in the gunicorn master
+        "connect": False,
+    }
+    for option, env in POOL_ENV.items():
+        if os.getenv(env):
+            options[option] = int(os.environ[env])
+
+    if os.getenv("MONGO_READ_CONCERN"):
+        options["readConcernLevel"] = os.environ["MONGO_READ_CONCERN"]
+    write_concern = os.getenv("MONGO_WRITE_CONCERN")
+    if write_concern:
+        options["w"] = int(write_concern) if write_concern.isdigit() else write_concern
+
+    if os.getenv("FLASK_ENV") == "development":
+        options.update(
+            host=[f"{os.getenv('MONGO_IP')}:{os.getenv('MONGO_PORT')}"],
+            username=os.getenv("MONGO_INITDB_ROOT_USERNAME"),
+            password=os.getenv("MONGO_INITDB_ROOT_PASSWORD"),
+        )
+    else:
+        options["host"] = os.getenv("MONGO_URI")
+    return options
+
+
+def database_name() -> str:
+    """Name of the app's database, MONGO_INITDB_DATABASE.
+
+    Returns:
+      database name
+    """
+    return os.getenv("MONGO_INITDB_DATABASE", "")
+
+
+def connect() -> LazyDatabase:
+    """Create the database, connections are opened on first use.
 
     ENV variables:
-        DOMAIN - container IP address of the mongodb container
-        PORT - port expose on the mongodb container
+        FLASK_ENV - development connects to MONGO_IP:MONGO_PORT, otherwise to
+            MONGO_URI
+        MONGO_IP - container IP address of the mongodb container
+        MONGO_PORT - port expose on the mongodb container
+        MONGO_URI - connection string outside of development
         MONGO_INITDB_DATABASE - database name
         MONGO_INITDB_ROOT_USERNAME - root access username
         MONGO_INITDB_ROOT_PASSWORD - root access user password
 
     Returns:
-        a database instance with name MONGO_INITDB_DATABASE
+        a database with name MONGO_INITDB_DATABASE
 
     Raises:
-        a ServerSelectionTimeoutError when connection takes more than 3 seconds
+        nothing here, the first operation raises ServerSelectionTimeoutError
+        when no server answers within MONGO_SERVER_SELECTION_TIMEOUT_MS
     """
-    try:
-        # try to instantiate a client instance
-        client = None
-        if FLASK_ENV == "development":
-            client = MongoClient(
-                host=[DOMAIN + ":" + PORT],  # type: ignore
-                serverSelectionTimeoutMS=5000,  # 5 second timeout
-                username=MONGO_INITDB_ROOT_USERNAME,
-                password=MONGO_INITDB_ROOT_PASSWORD,
-            )
-        else:
-            client = MongoClient(MONGO_URI)
-
-        # print the version of MongoDB server if connection successful
-        print("server version:", client.server_info()["version"])
-
-        return client[MONGO_INITDB_DATABASE]
-
-    except ServerSelectionTimeoutError as err:
-        client = None
-        print("pymongo ERROR:", err)
+    return LazyDatabase(database_name(), client_options())
+
+
+def pool_routes(app: Flask, db: LazyDatabase) -> None:
+    """Adds the connection pool statistics route to Flask App.
+
+    Arguments:
+    app: Flask app
+
+    db: MongoDB database from `connect`
+    """
+
+    @app.route("/api/v1/db/pool")
+    @jwt_required
+    def pool() -> Tuple[Dict[str, Any], int]:
+        """Fetch connection pool statistics of the worker answering.
+
+        Every gunicorn worker has its own pool, `pid` tells them apart.
+
+        Returns:
+          200 - pool options and counters per server
+
+          {
+            "pid": 1234,
+            "options": {"maxPoolSize": 100, ...},
+            "pools": {"host:27017": {"open": 3, "in_use": 1, ...}}
+          }
+
+          401 - bad auth token
+          500 - otherwise
+        """
+        return (
+            {
+                "pid": os.getpid(),
+                "options": db.options(),
+                "pools": db.pool_stats.snapshot(),
+            },
+            200,
+        )
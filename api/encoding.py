@@ -0,0 +1,168 @@
+"""Module for encoding JSON responses.
+
+Routes returning dicts, and routes calling `dumps`, are encoded by the
+provider chosen by `JSON_PROVIDER`:
+  auto - orjson when it is installed, stdlib otherwise (default)
+  orjson - orjson, fails at startup when it isn't installed
+  stdlib - the `json` module
+
+Both encode compactly, without sorting keys, and turn values JSON has no type
+for (e.g. ObjectId) into strings.
+"""
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from flask import Flask, Response, current_app
+
+try:
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
+
+def stdlib_dumps(obj: Any) -> bytes:
+    """Encode with the `json` module.
+
+    Arguments:
+      obj: object to encode
+
+    Returns:
+      UTF-8 encoded JSON
+    """
+    return json.dumps(obj, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def orjson_dumps(obj: Any) -> bytes:
+    """Encode with orjson.
+
+    Arguments:
+      obj: object to encode
+
+    Returns:
+      UTF-8 encoded JSON
+    """
+    return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+
+PROVIDERS: Dict[str, Callable[[Any], bytes]] = {
+    "stdlib": stdlib_dumps,
+    "orjson": orjson_dumps,
+}
+
+
+def install_json(app: Flask) -> None:
+    """Choose the JSON provider of an app from `JSON_PROVIDER`.
+
+    Arguments:
+      app: Flask app
+    """
+    name = app.config.get("JSON_PROVIDER", "auto")
+    if name == "auto":
+        name = "stdlib" if orjson is None else "orjson"
+    if name not in PROVIDERS:
+        raise RuntimeError(f"unknown JSON_PROVIDER `{name}`")
+    if name == "orjson" and orjson is None:
+        raise RuntimeError("JSON_PROVIDER `orjson` is not installed")
+
+    app.extensions["json_provider"] = name
+
+
+def dumps(obj: Any) -> bytes:
+    """Encode with the current app's JSON provider.
+
+    Arguments:
+      obj: object to encode
+
+    Returns:
+      UTF-8 encoded JSON
+    """
+    return PROVIDERS[current_app.extensions.get("json_provider", "stdlib")](obj)
+
+
+def json_response(data: bytes, status: int = 200) -> Response:
+    """Wrap encoded JSON in a response.
+
+    Arguments:
+      data: UTF-8 encoded JSON
+      status: HTTP status code
+
+    Returns:
+      application/json response
+    """
+    return current_app.response_class(data, status=status, mimetype="application/json")
+
+
+class JSONApp(Flask):
+    """Flask app encoding returned dicts with its JSON provider."""
+
+    def make_response(self, rv: Any) -> Response:
+        """Convert a view's return value, see `Flask.make_response`.
+
+        Arguments:
+          rv: return value of the view
+
+        Returns:
+          response
+        """
+        body = rv[0] if isinstance(rv, tuple) else rv
+        if isinstance(body, dict):
+            response = json_response(dumps(body))
+            rv = (response, *rv[1:]) if isinstance(rv, tuple) else response
+        return super().make_response(rv)
+
+
+class EncodedCache:
+    """Least recently used cache of encoded responses, bounded in bytes.
+
+    Entries are never invalidated, keys must change with the content (e.g.
+    include `modified` and `digest`). Thread safe.
+    """
+
+    def __init__(self, max_bytes: int):
+        """Create an empty cache.
+
+        Arguments:
+          max_bytes: total size of the cached responses
+        """
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        """Look up a response.
+
+        Arguments:
+          key: key the response was cached with
+
+        Returns:
+          encoded response, None when not cached
+        """
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            return data
+
+    def put(self, key: Hashable, data: bytes) -> None:
+        """Cache a response, evicting the least recently used ones over size.
+
+        Arguments:
+          key: key of the response
+          data: encoded response
+        """
+        if len(data) > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+
+            self._entries[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
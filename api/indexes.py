@@ -0,0 +1,109 @@
+"""Module for the MongoDB index manifest.
+
+Every index a route relies on is listed in `INDEXES` so it is created, and
+checked, once at startup instead of being assumed to exist. Likewise for the
+capped collections in `CAPPED`.
+"""
+from typing import Any, Dict, List, Tuple
+
+from pymongo import ASCENDING, DESCENDING, MongoClient  # type: ignore
+from pymongo.errors import CollectionInvalid, OperationFailure  # type: ignore
+
+# collection -> [(keys, options)]
+INDEXES: Dict[str, List[Tuple[List[Tuple[str, int]], Dict[str, Any]]]] = {
+    "cultures": [
+        # Covers GET /api/v1/cultures: filter and sort on name, project name/modified
+        ([("name", ASCENDING), ("modified", ASCENDING)], {"name": "name_modified"}),
+        # Culture names are unique, POST /api/v1/cultures relies on it
+        ([("name", ASCENDING)], {"name": "name_unique", "unique": True}),
+        # GET /api/v1/cultures/changes
+        ([("modified", ASCENDING)], {"name": "modified"}),
+    ],
+    "culture_tombstones": [
+        ([("name", ASCENDING)], {"name": "name_unique", "unique": True}),
+        ([("deleted", ASCENDING)], {"name": "deleted"}),
+    ],
+    "admins": [
+        # Admin emails are unique, POST /api/v1/register relies on it
+        ([("email", ASCENDING)], {"name": "email_unique", "unique": True}),
+    ],
+    "feedback": [
+        # api.mailer.digest.flush_feedback
+        ([("digested", ASCENDING)], {"name": "digested"}),
+    ],
+    "refresh_tokens": [
+        ([("jti", ASCENDING)], {"name": "jti_unique", "unique": True}),
+        ([("email", ASCENDING)], {"name": "email"}),
+        ([("expires", ASCENDING)], {"name": "expires", "expireAfterSeconds": 0}),
+    ],
+    "throttle": [
+        # Idle token buckets are dropped once they would be full again
+        ([("expires", ASCENDING)], {"name": "expires", "expireAfterSeconds": 0}),
+    ],
+    "outbox": [
+        # api.mailer.outbox.claim
+        ([("status", ASCENDING), ("next_attempt", ASCENDING)], {"name": "due"}),
+    ],
+    "slow_ops": [
+        # GET /api/v1/db/slow-ops, newest first
+        ([("at", DESCENDING)], {"name": "at"}),
+    ],
+}
+
+# collection -> create_collection options, sizes in bytes
+CAPPED: Dict[str, Dict[str, int]] = {
+    # POST /api/v1/feedback, oldest feedback is dropped past 10MB
+    "feedback": {"size": 10 * 1024 * 1024},
+    # api.slow_ops, oldest operations are dropped past 10MB
+    "slow_ops": {"size": 10 * 1024 * 1024},
+}
+
+# Error code of the server creating a collection that exists
+NAMESPACE_EXISTS = 48
+
+
+def ensure_indexes(db: MongoClient) -> None:
+    """Create every index in `INDEXES` and check that they exist.
+
+    Creating an index that already exists with the same options is a no-op.
+
+    Arguments:
+      db: MongoDB client
+
+    Raises:
+      RuntimeError when an index is missing after creation
+    """
+    for collection, indexes in INDEXES.items():
+        for keys, options in indexes:
+            db[collection].create_index(keys, **options)
+
+        existing = db[collection].index_information()
+        for keys, options in indexes:
+            if options["name"] not in existing:
+                raise RuntimeError(
+                    f"index `{options['name']}` missing on collection `{collection}`"
+                )
+
+
+def ensure_capped(db: MongoClient) -> None:
+    """Create every capped collection in `CAPPED`.
+
+    An existing collection that isn't capped is converted. Every worker runs
+    this on startup, a collection created by another worker in the meantime
+    is left as is.
+
+    Arguments:
+      db: MongoDB client
+    """
+    existing = db.list_collection_names()
+    for collection, options in CAPPED.items():
+        if collection not in existing:
+            try:
+                db.create_collection(collection, capped=True, **options)
+            except CollectionInvalid:
+                pass
+            except OperationFailure as err:
+                if err.code != NAMESPACE_EXISTS:
+                    raise
+        elif not db[collection].options().get("capped"):
+            db.command("convertToCapped", collection, size=options["size"])
@@ -1,32 +1,39 @@
-"""Contains functions that send emails."""
+"""Contains functions that queue emails, see `outbox` for their delivery."""
 
 import os
 
 from dotenv import load_dotenv
 from flask import Flask
-from flask_mail import Mail, Message  # type: ignore
-from jinja2 import Template
+from flask_mail import Message  # type: ignore
+from jinja2 import Environment, FileSystemLoader
+from pymongo import MongoClient  # type: ignore
+
+from .outbox import enqueue
 
 load_dotenv()
 
 FRONTEND_URL = os.getenv("FRONTEND_URL")
 
+# Templates are compiled once, when this module is imported
+TEMPLATES = Environment(
+    loader=FileSystemLoader(os.path.join(os.path.dirname(__file__), "templates")),
+    auto_reload=False,
+)
+INVITE_TEMPLATE = TEMPLATES.get_template("invite.html")
+
 
-def send_invite_email(app: Flask, token: str, email: str) -> None:
-    """Prepare the admin invite email and send it.
+def send_invite_email(app: Flask, db: MongoClient, token: str, email: str) -> None:
+    """Prepare the admin invite email and queue it.
 
     Arguments:
       app: the flask app
+      db: MongoDB client
       token: token created for the email
       email: address the email is being sent to
     """
-    mail = Mail(app)
-    with open("api/mailer/templates/invite.html", "r") as f:
-        template = Template(f.read())
-
     msg = Message("Account Activation", sender="App Admin", recipients=[f"{email}"],)
 
-    msg.html = template.render(
+    msg.html = INVITE_TEMPLATE.render(
         url=f"{FRONTEND_URL}/register/{token}",
         title="OSUMC Cultural Awareness App Admin Invitation Email",
         link_caption="Click the following link to register for an admin account",
@@ -34,24 +41,21 @@ def send_invite_email(app: Flask, token: str, email: str) -> None:
         action="Register",
     )
 
-    mail.send(msg)
+    enqueue(db, msg)
 
 
-def send_recovery_email(app: Flask, token: str, email: str) -> None:
-    """Prepare the admin recovery email and send it.
+def send_recovery_email(app: Flask, db: MongoClient, token: str, email: str) -> None:
+    """Prepare the admin recovery email and queue it.
 
     Arguments:
       app: the flask app
+      db: MongoDB client
       token: token created for the email
       email: address the email is being sent to
     """
-    mail = Mail(app)
-    with open("api/mailer/templates/invite.html", "r") as f:
-        template = Template(f.read())
-
     msg = Message("Account Recovery", sender="App Admin", recipients=[email])
 
-    msg.html = template.render(
+    msg.html = INVITE_TEMPLATE.render(
         url=f"{FRONTEND_URL}/recovery/{email}/{token}",
         title="OSUMC Cultural Awareness App Admin Recovery Email",
         link_caption="Click the following link to recover your account",
@@ -59,25 +63,5 @@ def send_recovery_email(app: Flask, token: str, email: str) -> None:
         action="Recover Account",
     )
 
-    mail.send(msg)
-
+    enqueue(db, msg)
 
-def send_feedback(app: Flask, feedback: str) -> None:
-    """Send feedback to $MAIL_USERNAME if not provided logs the feedback.
-
-    Arguments:
-      app: the flask app
-      feedback: feedback from user
-    """
-    mail = Mail(app)
-    try:
-        msg = Message(
-            "Feedback",
-            sender="User",
-            recipients=[app.config["MAIL_USERNAME"]],
-            body=feedback,
-        )
-        mail.send(msg)
-    except KeyError:
-        print("$MAIL_USERNAME not configured")
-        print(f'Feedback: "{feedback}"')
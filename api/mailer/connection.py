@@ -0,0 +1,88 @@
+"""Module for SMTP connections reused across messages."""
+import smtplib
+import time
+from contextlib import ExitStack
+from typing import Optional
+
+from flask_mail import Connection, Mail, Message  # type: ignore
+
+from ..metrics import SMTP_DURATION
+
+
+class PersistentConnection:
+    """SMTP connection kept open between messages.
+
+    Opening a connection costs a TLS handshake and a login, so one connection
+    is reused until it has been idle for `idle_timeout` seconds or the server
+    drops it. Not thread safe, each outbox worker owns one.
+
+    Must be used inside an app context.
+    """
+
+    def __init__(self, mail: Mail, idle_timeout: float = 60):
+        """Create a connection, the SMTP session is only opened on `send`.
+
+        Arguments:
+          mail: Mail holding the SMTP settings
+          idle_timeout: seconds without a message after which to reconnect
+        """
+        self.mail = mail
+        self.idle_timeout = idle_timeout
+        self.connection: Optional[Connection] = None
+        self.last_used = 0.0
+        self._stack = ExitStack()
+
+    def open(self) -> Connection:
+        """Open the SMTP session if it isn't already.
+
+        Returns:
+          flask_mail Connection
+        """
+        if self.connection is None:
+            self.connection = self._stack.enter_context(self.mail.connect())
+        return self.connection
+
+    def close(self) -> None:
+        """Quit the SMTP session, if open."""
+        try:
+            self._stack.close()
+        except (smtplib.SMTPException, OSError):
+            # Already dropped by the server
+            pass
+        self.connection = None
+
+    def close_if_idle(self) -> None:
+        """Quit the SMTP session if it has been idle for `idle_timeout`."""
+        if (
+            self.connection is not None
+            and time.monotonic() - self.last_used >= self.idle_timeout
+        ):
+            self.close()
+
+    def send(self, msg: Message) -> None:
+        """Send a message, reconnecting once if the session was dropped.
+
+        Any other error leaves the session in an unknown state, it is closed
+        and the next message opens a new one.
+
+        Arguments:
+          msg: message to send
+        """
+        self.close_if_idle()
+
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            try:
+                self.open().send(msg)
+            except smtplib.SMTPServerDisconnected:
+                self.close()
+                self.open().send(msg)
+            outcome = "ok"
+        except Exception:
+            self.close()
+            raise
+        finally:
+            SMTP_DURATION.observe((outcome,), time.perf_counter() - start)
+
+        self.last_used = time.monotonic()
@@ -0,0 +1,141 @@
+"""Module for batching feedback into periodic digest emails.
+
+POST /api/v1/feedback only inserts into the capped `feedback` collection. A
+scheduler thread flushes undigested feedback into the outbox as digests of at
+most `FEEDBACK_DIGEST_SIZE` entries, so SMTP volume is bounded by the flush
+interval rather than by traffic.
+"""
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from flask import Flask
+from flask_mail import Message  # type: ignore
+from pymongo import MongoClient  # type: ignore
+from pymongo.errors import DuplicateKeyError  # type: ignore
+
+from .outbox import enqueue
+
+LOCK_ID = "feedback_digest"
+
+
+def acquire(db: MongoClient, seconds: float) -> Optional[str]:
+    """Take the digest lock so only one worker flushes at a time.
+
+    Arguments:
+      db: MongoDB client
+      seconds: how long the lock is held unless released
+
+    Returns:
+      owner token to `release` the lock with, None when held by another worker
+    """
+    now = time.time()
+    owner = uuid.uuid4().hex
+    try:
+        db.locks.find_one_and_update(
+            {"_id": LOCK_ID, "expires": {"$lte": now}},
+            {"$set": {"expires": now + seconds, "owner": owner}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # The upsert collided with the lock held by another worker
+        return None
+    return owner
+
+
+def release(db: MongoClient, owner: str) -> None:
+    """Release the digest lock, unless it expired and was taken over.
+
+    Arguments:
+      db: MongoDB client
+      owner: token returned by `acquire`
+    """
+    db.locks.update_one({"_id": LOCK_ID, "owner": owner}, {"$set": {"expires": 0}})
+
+
+def digest_message(app: Flask, entries: List[Dict[str, Any]]) -> Message:
+    """Compose one digest email.
+
+    Arguments:
+      app: Flask app
+      entries: feedback documents
+
+    Returns:
+      message to $MAIL_USERNAME
+    """
+    body = "\n\n".join(
+        f"[{time.strftime('%Y-%m-%d %H:%M UTC', time.gmtime(entry['created']))}]\n"
+        f"{entry['feedback']}"
+        for entry in entries
+    )
+    return Message(
+        f"Feedback ({len(entries)})",
+        sender="User",
+        recipients=[app.config["MAIL_USERNAME"]],
+        body=body,
+    )
+
+
+def flush_feedback(app: Flask, db: MongoClient) -> int:
+    """Queue digests of all undigested feedback.
+
+    Feedback is left undigested until $MAIL_USERNAME is configured.
+
+    Arguments:
+      app: Flask app
+      db: MongoDB client
+
+    Returns:
+      number of digests queued
+    """
+    if not app.config.get("MAIL_USERNAME"):
+        app.logger.warning("$MAIL_USERNAME not configured, feedback not digested")
+        return 0
+
+    owner = acquire(db, app.config.get("FEEDBACK_DIGEST_LOCK", 300))
+    if owner is None:
+        return 0
+
+    digests = 0
+    try:
+        size = app.config.get("FEEDBACK_DIGEST_SIZE", 50)
+        while True:
+            entries = list(
+                db.feedback.find({"digested": False}).sort("$natural", 1).limit(size)
+            )
+            if not entries:
+                return digests
+
+            enqueue(db, digest_message(app, entries))
+            digests += 1
+
+            db.feedback.update_many(
+                {"_id": {"$in": [entry["_id"] for entry in entries]}},
+                {"$set": {"digested": True}},
+            )
+    finally:
+        release(db, owner)
+
+
+def start_scheduler(app: Flask, db: MongoClient) -> threading.Event:
+    """Start a daemon thread flushing feedback every `FEEDBACK_DIGEST_INTERVAL`.
+
+    Arguments:
+      app: Flask app
+      db: MongoDB client
+
+    Returns:
+      event that stops the scheduler when set
+    """
+    stop = threading.Event()
+
+    def schedule() -> None:
+        while not stop.wait(app.config.get("FEEDBACK_DIGEST_INTERVAL", 3600)):
+            try:
+                flush_feedback(app, db)
+            except Exception:  # pylint: disable=broad-except
+                app.logger.exception("feedback digest failed")
+
+    threading.Thread(target=schedule, name="feedback-digest", daemon=True).start()
+    return stop
@@ -0,0 +1,201 @@
+"""Module for the MongoDB backed mail outbox.
+
+Routes queue messages with `enqueue` and return immediately, background
+workers deliver them with `deliver`. A message that fails is retried with
+exponential backoff and moved to `dead` after `MAIL_MAX_ATTEMPTS`.
+
+Format:
+{
+  "status": "pending" | "sending" | "dead",
+  "subject": "Account Activation",
+  "sender": "App Admin",
+  "recipients": ["test@gmail.com"],
+  "html": "<html>...",
+  "body": "...",
+  "attempts": 0,
+  "next_attempt": 00000000.0,
+  "error": "..."
+}
+"""
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from bson import ObjectId  # type: ignore
+from flask import Flask
+from flask_mail import Mail, Message  # type: ignore
+from pymongo import MongoClient, ReturnDocument  # type: ignore
+
+from .connection import PersistentConnection
+
+PENDING = "pending"
+SENDING = "sending"
+DEAD = "dead"
+
+
+def enqueue(db: MongoClient, msg: Message) -> ObjectId:
+    """Queue a message for delivery.
+
+    Arguments:
+      db: MongoDB client
+      msg: message to send
+
+    Returns:
+      id of the queued message
+    """
+    result = db.outbox.insert_one(
+        {
+            "status": PENDING,
+            "subject": msg.subject,
+            "sender": msg.sender,
+            "recipients": msg.recipients,
+            "html": msg.html,
+            "body": msg.body,
+            "attempts": 0,
+            "next_attempt": time.time(),
+        }
+    )
+    return result.inserted_id
+
+
+def claim(app: Flask, db: MongoClient) -> Optional[Dict[str, Any]]:
+    """Claim the next message due for delivery.
+
+    Messages stuck in `sending` past their lease (e.g. the worker died) are
+    claimed again.
+
+    Arguments:
+      app: Flask app
+      db: MongoDB client
+
+    Returns:
+      claimed message or None when nothing is due
+    """
+    now = time.time()
+    return db.outbox.find_one_and_update(
+        {
+            "$or": [
+                {"status": PENDING, "next_attempt": {"$lte": now}},
+                {"status": SENDING, "lease": {"$lte": now}},
+            ]
+        },
+        {
+            "$set": {
+                "status": SENDING,
+                "lease": now + app.config.get("MAIL_LEASE", 300),
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("next_attempt", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def backoff(app: Flask, attempts: int) -> float:
+    """Seconds to wait before the next attempt.
+
+    Arguments:
+      app: Flask app
+      attempts: attempts made so far
+
+    Returns:
+      `MAIL_BACKOFF` * 2 ^ (attempts - 1), at most `MAIL_MAX_BACKOFF`
+    """
+    return min(
+        app.config.get("MAIL_BACKOFF", 30) * 2 ** (attempts - 1),
+        app.config.get("MAIL_MAX_BACKOFF", 3600),
+    )
+
+
+def deliver(app: Flask, db: MongoClient, connection: PersistentConnection) -> int:
+    """Deliver every message that is due over one SMTP connection.
+
+    Arguments:
+      app: Flask app
+      db: MongoDB client
+      connection: connection used to send messages
+
+    Returns:
+      number of messages sent
+    """
+    sent = 0
+    with app.app_context():
+        while True:
+            queued = claim(app, db)
+            if queued is None:
+                return sent
+
+            msg = Message(
+                queued["subject"],
+                sender=queued["sender"],
+                recipients=queued["recipients"],
+                html=queued["html"],
+                body=queued["body"],
+            )
+
+            try:
+                connection.send(msg)
+            except Exception as err:  # pylint: disable=broad-except
+                failed(app, db, queued, err)
+                continue
+
+            db.outbox.delete_one({"_id": queued["_id"]})
+            sent += 1
+
+
+def failed(app: Flask, db: MongoClient, queued: Dict[str, Any], err: Exception) -> None:
+    """Schedule a retry of a message, or dead letter it.
+
+    Arguments:
+      app: Flask app
+      db: MongoDB client
+      queued: message that failed
+      err: cause of the failure
+    """
+    attempts = queued["attempts"]
+    if attempts >= app.config.get("MAIL_MAX_ATTEMPTS", 5):
+        app.logger.error("giving up on mail %s: %s", queued["_id"], err)
+        update: Dict[str, Any] = {"status": DEAD, "error": str(err)}
+    else:
+        app.logger.warning(
+            "mail %s failed, attempt %d: %s", queued["_id"], attempts, err
+        )
+        update = {
+            "status": PENDING,
+            "error": str(err),
+            "next_attempt": time.time() + backoff(app, attempts),
+        }
+
+    db.outbox.update_one({"_id": queued["_id"]}, {"$set": update})
+
+
+def start_workers(app: Flask, db: MongoClient, count: int) -> threading.Event:
+    """Start daemon threads delivering the outbox.
+
+    Arguments:
+      app: Flask app
+      db: MongoDB client
+      count: number of threads
+
+    Returns:
+      event that stops the workers when set
+    """
+    stop = threading.Event()
+
+    def work() -> None:
+        connection = PersistentConnection(
+            Mail(app), app.config.get("MAIL_IDLE_TIMEOUT", 60)
+        )
+        while not stop.is_set():
+            try:
+                deliver(app, db, connection)
+                with app.app_context():
+                    connection.close_if_idle()
+            except Exception:  # pylint: disable=broad-except
+                app.logger.exception("outbox worker failed")
+            stop.wait(app.config.get("MAIL_POLL_INTERVAL", 1))
+
+    for i in range(count):
+        threading.Thread(target=work, name=f"outbox-{i}", daemon=True).start()
+
+    return stop
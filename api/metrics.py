@@ -0,0 +1,450 @@
+"""Module for Prometheus metrics.
+
+Every process counts into the module's `Counter`s and `Histogram`s:
+  http_requests_total - requests by endpoint, method and status
+  http_request_duration_seconds - time to build the response by endpoint
+  http_response_size_bytes - response bodies by endpoint, streams excluded
+  mongodb_command_duration_seconds - MongoDB commands by command and outcome
+  smtp_send_duration_seconds - SMTP sends by outcome
+
+GET /metrics renders them in the Prometheus text format. Gunicorn workers are
+separate processes, so with `METRICS_DIR` set each one writes its values to a
+file of its own in that directory every `METRICS_FLUSH_INTERVAL` (default 5)
+seconds, and /metrics adds up the files of every worker, past and present.
+Empty the directory before starting the server.
+"""
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from flask import Flask, Response, g, request
+from pymongo import MongoClient, monitoring  # type: ignore
+
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+Labels = Tuple[str, ...]
+
+
+class Counter:
+    """Monotonic counter with labels. Thread safe."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str]):
+        """Create a counter at zero.
+
+        Arguments:
+          name: metric name
+          documentation: HELP text
+          labels: label names
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values: Dict[Labels, Any] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Labels, amount: float = 1) -> None:
+        """Add to the counter of `labels`.
+
+        Arguments:
+          labels: label values, in the order of the label names
+          amount: amount to add
+        """
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def reset(self) -> None:
+        """Drop every value."""
+        with self._lock:
+            self.values = {}
+
+    def dump(self) -> List[List[Any]]:
+        """Copy the values.
+
+        Returns:
+          [[label values, value], ...]
+        """
+        with self._lock:
+            return [[list(labels), value] for labels, value in self.values.items()]
+
+    @staticmethod
+    def merge(total: Any, value: Any) -> Any:
+        """Add up the values of two processes."""
+        return total + value
+
+    def render(self, values: Dict[Labels, Any]) -> List[str]:
+        """Sample lines of the text format."""
+        return [
+            f"{self.name}{_labels(self.labels, labels)} {_number(value)}"
+            for labels, value in sorted(values.items())
+        ]
+
+
+class Histogram(Counter):
+    """Histogram with labels. Thread safe.
+
+    Values are [count per bucket, count above the last bucket, sum].
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str],
+        buckets: Sequence[float],
+    ):
+        """Create an empty histogram.
+
+        Arguments:
+          name: metric name
+          documentation: HELP text
+          labels: label names
+          buckets: upper bounds of the buckets, ascending
+        """
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, labels: Labels, value: float) -> None:
+        """Record an observation.
+
+        Arguments:
+          labels: label values, in the order of the label names
+          value: observed value, e.g. seconds
+        """
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+
+        with self._lock:
+            counts: Optional[List[float]] = self.values.get(labels)
+            if counts is None:
+                # bucket counts, then the sum
+                counts = self.values[labels] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    def dump(self) -> List[List[Any]]:
+        """Copy the values, see `Counter.dump`."""
+        with self._lock:
+            return [
+                [list(labels), list(counts)] for labels, counts in self.values.items()
+            ]
+
+    @staticmethod
+    def merge(total: Any, value: Any) -> Any:
+        """Add up the values of two processes."""
+        return [a + b for a, b in zip(total, value)]
+
+    def render(self, values: Dict[Labels, Any]) -> List[str]:
+        """Sample lines of the text format."""
+        lines = []
+        for labels, counts in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = _labels(self.labels + ("le",), labels + (_number(bound),))
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(
+                f"{self.name}_sum{_labels(self.labels, labels)} {_number(counts[-1])}"
+            )
+            lines.append(
+                f"{self.name}_count{_labels(self.labels, labels)} {cumulative}"
+            )
+        return lines
+
+
+def _number(value: float) -> str:
+    """Number in the text format."""
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _labels(names: Labels, values: Labels) -> str:
+    """Label set in the text format."""
+    if not names:
+        return ""
+    escaped = (
+        value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        for value in values
+    )
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "Requests served.", ("endpoint", "method", "status")
+)
+HTTP_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time to build responses, streaming excluded.",
+    ("endpoint", "method"),
+    LATENCY_BUCKETS,
+)
+HTTP_SIZE = Histogram(
+    "http_response_size_bytes",
+    "Size of response bodies of known length.",
+    ("endpoint", "method"),
+    SIZE_BUCKETS,
+)
+MONGODB_DURATION = Histogram(
+    "mongodb_command_duration_seconds",
+    "MongoDB command round trips.",
+    ("command", "outcome"),
+    LATENCY_BUCKETS,
+)
+SMTP_DURATION = Histogram(
+    "smtp_send_duration_seconds", "SMTP sends.", ("outcome",), LATENCY_BUCKETS
+)
+
+METRICS: List[Counter] = [
+    HTTP_REQUESTS,
+    HTTP_DURATION,
+    HTTP_SIZE,
+    MONGODB_DURATION,
+    SMTP_DURATION,
+]
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """Times MongoDB commands into `mongodb_command_duration_seconds`."""
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        """Command sent, timed by the driver."""
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        """Command answered."""
+        MONGODB_DURATION.observe(
+            (event.command_name, "ok"), event.duration_micros / 1e6
+        )
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        """Command failed."""
+        MONGODB_DURATION.observe(
+            (event.command_name, "error"), event.duration_micros / 1e6
+        )
+
+
+class MetricsFile:
+    """File holding the values of this process in `METRICS_DIR`."""
+
+    def __init__(self, directory: str, interval: float):
+        """Create the file's writer, nothing is written until `start`.
+
+        Arguments:
+          directory: METRICS_DIR
+          interval: seconds between writes
+        """
+        self.directory = directory
+        self.interval = interval
+        self.path: Optional[str] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Write periodically from a thread, once per process."""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            # A new name per process, a reused pid must not replace a dead
+            # worker's counts
+            self.path = os.path.join(
+                self.directory, f"metrics-{pid}-{uuid.uuid4().hex[:8]}.json"
+            )
+            self._pid = pid
+
+        os.makedirs(self.directory, exist_ok=True)
+        threading.Thread(target=self._run, name="metrics", daemon=True).start()
+        atexit.register(self.write)
+
+    def _run(self) -> None:
+        """Write every `interval` seconds."""
+        while True:
+            time.sleep(self.interval)
+            self.write()
+
+    def write(self) -> None:
+        """Write the values of this process."""
+        if self.path is None or self._pid != os.getpid():
+            return
+        values = {metric.name: metric.dump() for metric in METRICS}
+        partial = f"{self.path}.{threading.get_ident()}.tmp"
+        with open(partial, "w") as f:
+            json.dump(values, f)
+        os.replace(partial, self.path)
+
+
+def reset() -> None:
+    """Drop the values inherited by a forked process."""
+    for metric in METRICS:
+        metric.reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset)
+
+
+def clear_metrics_dir(directory: Optional[str]) -> None:
+    """Delete the files of a previous run, before any worker starts.
+
+    Arguments:
+      directory: METRICS_DIR, nothing is done when None
+    """
+    if directory:
+        for path in glob.glob(os.path.join(directory, "metrics-*.json")):
+            os.remove(path)
+
+
+def collect(directory: Optional[str]) -> Dict[str, Dict[Labels, Any]]:
+    """Values of every metric.
+
+    Arguments:
+      directory: METRICS_DIR to add up the files of, None for this process only
+
+    Returns:
+      {metric name: {label values: value}}
+    """
+    if directory is None:
+        dumps = [{metric.name: metric.dump() for metric in METRICS}]
+    else:
+        dumps = []
+        for path in glob.glob(os.path.join(directory, "metrics-*.json")):
+            try:
+                with open(path) as f:
+                    dumps.append(json.load(f))
+            except (OSError, ValueError):
+                # Removed by a cleanup, counted next scrape
+                continue
+
+    totals: Dict[str, Dict[Labels, Any]] = {metric.name: {} for metric in METRICS}
+    merge = {metric.name: metric.merge for metric in METRICS}
+    for dump in dumps:
+        for name, samples in dump.items():
+            if name not in totals:
+                continue
+            for labels, value in samples:
+                key = tuple(labels)
+                previous = totals[name].get(key)
+                totals[name][key] = (
+                    value if previous is None else merge[name](previous, value)
+                )
+    return totals
+
+
+def render(directory: Optional[str] = None) -> str:
+    """Render every metric in the Prometheus text format.
+
+    Arguments:
+      directory: (optional) METRICS_DIR, see `collect`
+
+    Returns:
+      text format exposition
+    """
+    totals = collect(directory)
+    lines = []
+    for metric in METRICS:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render(totals[metric.name]))
+    return "\n".join(lines) + "\n"
+
+
+def record_request(
+    endpoint: str,
+    method: str,
+    status: int,
+    seconds: Optional[float],
+    size: Optional[int],
+) -> None:
+    """Count a response and time it.
+
+    Arguments:
+      endpoint: endpoint of the request, "unmatched" without one
+      method: HTTP method
+      status: status code of the response
+      seconds: (optional) time taken to build the response
+      size: (optional) length of the response body
+    """
+    HTTP_REQUESTS.inc((endpoint, method, str(status)))
+    if seconds is not None:
+        HTTP_DURATION.observe((endpoint, method), seconds)
+    if size is not None:
+        HTTP_SIZE.observe((endpoint, method), size)
+
+
+def metrics_routes(app: Flask, db: MongoClient) -> None:
+    """Adds request instrumentation and the metrics route to Flask App.
+
+    Arguments:
+    app: Flask app
+
+    db: MongoDB client, its commands are timed by `CommandMetrics`
+    """
+    directory = app.config.get("METRICS_DIR")
+    metrics_file = (
+        MetricsFile(directory, app.config.get("METRICS_FLUSH_INTERVAL", 5))
+        if directory
+        else None
+    )
+    app.extensions["metrics_file"] = metrics_file
+
+    @app.before_request
+    def start_timer() -> None:
+        """Note when the request started."""
+        g.metrics_start = time.perf_counter()
+        if metrics_file is not None:
+            metrics_file.start()
+
+    @app.after_request
+    def record(response: Response) -> Response:
+        """Count the response and time it."""
+        start = g.pop("metrics_start", None)
+        record_request(
+            request.endpoint or "unmatched",
+            request.method,
+            response.status_code,
+            None if start is None else time.perf_counter() - start,
+            response.content_length,
+        )
+        return response
+
+    @app.route("/metrics")
+    def metrics() -> Response:
+        """Fetch metrics of every worker in the Prometheus text format.
+
+        Returns:
+          200 - text/plain; version=0.0.4
+          500 - otherwise
+        """
+        if metrics_file is not None:
+            metrics_file.write()
+        return app.response_class(
+            render(directory), content_type="text/plain; version=0.0.4; charset=utf-8"
+        )
@@ -0,0 +1,403 @@
+"""Module for profiling live requests.
+
+Off unless `PROFILE_DIR` is set. Then requests are profiled:
+  - at random, `PROFILE_SAMPLE_RATE` (default 0) of them, e.g. 0.01 for 1 in 100
+  - on demand, when an admin sends `X-Profile: 1` with a valid token
+
+`PROFILE_MODE` chooses the profiler:
+  cprofile - cProfile, function call counts and times (default)
+  sample - the request's stack sampled every `PROFILE_INTERVAL` (default 0.005)
+    seconds, cheap enough to leave on, and the flame graph shows where the
+    request spent its time
+
+Profiles are added up in memory per endpoint and per `PROFILE_WINDOW` (default
+3600) seconds. Every `PROFILE_FLUSH_INTERVAL` (default 5) seconds a thread of
+each process writes the aggregates that changed to files of its own in
+PROFILE_DIR:
+  <endpoint>.<window>.<pid>.pstats - cProfile stats, load several with
+    `pstats.Stats(*paths)` or `snakeviz`
+  <endpoint>.<window>.<pid>.collapsed - stacks in the collapsed format of
+    flamegraph.pl and speedscope
+  <endpoint>.<window>.<pid>.json - seconds spent per component, see
+    `COMPONENTS`, and the number of profiled requests
+Files of windows older than `PROFILE_KEEP` (default 24) windows are deleted
+once per window.
+"""
+import atexit
+import cProfile
+import glob
+import json
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from types import FrameType
+from typing import Any, Counter, Dict, Optional, Set, Tuple, Union
+
+from flask import Flask, g, request
+from flask_jwt_extended import verify_jwt_in_request  # type: ignore
+
+# Component -> substrings of "<file>:<function>", the first match wins. JSON
+# encoding is the stdlib encoder (which flask.json uses too), orjson and
+# api/encoding.py; api/bsonjson.py counts as BSON decoding.
+COMPONENTS = (
+    ("json_encoding", ("json/encoder.py:", "orjson.dumps", "api/encoding.py:")),
+    ("validation", ("marshmallow/",)),
+    ("bson_decoding", ("bson",)),
+    ("password_hashing", ("werkzeug/security.py:", "pbkdf2")),
+    ("mongodb_io", ("pymongo/",)),
+)
+
+
+def component(location: str) -> Optional[str]:
+    """Component a function belongs to.
+
+    Arguments:
+      location: "<file>:<function>"
+
+    Returns:
+      component name, None for anything else
+    """
+    for name, patterns in COMPONENTS:
+        if any(pattern in location for pattern in patterns):
+            return name
+    return None
+
+
+def collapse(frame: Optional[FrameType]) -> str:
+    """Stack of a frame in the collapsed format, root first.
+
+    Arguments:
+      frame: innermost frame
+
+    Returns:
+      "module.py:function;module.py:function"
+    """
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        path = code.co_filename.replace(os.sep, "/").rsplit("/", 2)
+        names.append(f"{'/'.join(path[-2:])}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    """Samples the stacks of the threads serving profiled requests.
+
+    One thread per process, started on the first profiled request.
+    """
+
+    def __init__(self, interval: float):
+        """Create the sampler, nothing is sampled until `start`.
+
+        Arguments:
+          interval: seconds between samples
+        """
+        self.interval = interval
+        self._stacks: Dict[int, Counter[str]] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, ident: int) -> None:
+        """Sample a thread until `stop`.
+
+        Arguments:
+          ident: thread identifier
+        """
+        with self._lock:
+            self._stacks[ident] = Counter()
+            # Threads don't survive a fork, a worker starts its own
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="stack-sampler", daemon=True
+                )
+                self._thread.start()
+
+    def stop(self, ident: int) -> Counter[str]:
+        """Stop sampling a thread.
+
+        Arguments:
+          ident: thread identifier
+
+        Returns:
+          number of samples per collapsed stack
+        """
+        with self._lock:
+            return self._stacks.pop(ident, Counter())
+
+    def _run(self) -> None:
+        """Sample every `interval` seconds."""
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()  # pylint: disable=protected-access
+            with self._lock:
+                for ident, stacks in self._stacks.items():
+                    if ident in frames:
+                        stacks[collapse(frames[ident])] += 1
+
+
+class Aggregate:
+    """Profiles of one endpoint and window in this process."""
+
+    def __init__(self) -> None:
+        """Create an empty aggregate."""
+        self.requests = 0
+        self.stats: Optional[pstats.Stats] = None
+        self.stacks: Counter[str] = Counter()
+        # Seconds per component
+        self.components: Dict[str, float] = defaultdict(float)
+
+    def snapshot(
+        self,
+    ) -> Tuple[Optional[Dict[Any, Any]], Dict[str, int], Dict[str, Any]]:
+        """Copy the aggregate, to write while requests add to it.
+
+        Returns:
+          (`pstats.Stats.stats` or None, stacks, content of the JSON file)
+        """
+        # Stats.add replaces entries rather than changing them, a shallow copy
+        # is enough
+        stats = None
+        if self.stats is not None:
+            stats = dict(self.stats.stats)  # type: ignore
+        summary = {
+            "requests": self.requests,
+            "components": {
+                name: round(seconds, 6) for name, seconds in self.components.items()
+            },
+        }
+        return stats, dict(self.stacks), summary
+
+
+class RequestProfiler:
+    """Profiles requests and writes aggregated profiles, see the module."""
+
+    def __init__(self, app: Flask):
+        """Create the profiler, settings are read from the config on each use.
+
+        Arguments:
+          app: Flask app
+        """
+        self.app = app
+        self.sampler = StackSampler(0.005)
+        self._aggregates: Dict[Tuple[str, int], Aggregate] = {}
+        # Aggregates changed since the last flush
+        self._dirty: Set[Tuple[str, int]] = set()
+        self._rotated: Optional[int] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def wanted(self) -> bool:
+        """Whether to profile the current request."""
+        if request.headers.get("X-Profile") == "1":
+            try:
+                verify_jwt_in_request()
+                return True
+            except Exception:  # pylint: disable=broad-except
+                # Not an admin, profiled like any other request
+                pass
+        return random.random() < self.app.config.get("PROFILE_SAMPLE_RATE", 0)
+
+    def start(self) -> None:
+        """Start profiling the current request."""
+        self.start_flushing()
+        if self.app.config.get("PROFILE_MODE", "cprofile") == "sample":
+            self.sampler.interval = self.app.config.get("PROFILE_INTERVAL", 0.005)
+            self.sampler.start(threading.get_ident())
+            g.profile = "sample"
+            return
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+ allows one profiler per process, skip this request
+            return
+        g.profile = profiler
+
+    def stop(self) -> None:
+        """Stop profiling the current request and add it to its aggregate."""
+        profile = g.pop("profile", None)
+        if profile is None:
+            return
+        if profile == "sample":
+            stacks = self.sampler.stop(threading.get_ident())
+            self.add(request.endpoint or "unmatched", stacks=stacks)
+        else:
+            profile.disable()
+            self.add(request.endpoint or "unmatched", profile=profile)
+
+    def add(
+        self,
+        endpoint: str,
+        profile: Optional[cProfile.Profile] = None,
+        stacks: Optional[Counter[str]] = None,
+    ) -> None:
+        """Add a request's profile to the aggregate of its endpoint.
+
+        Arguments:
+          endpoint: endpoint of the request
+          profile: (optional) cProfile of the request
+          stacks: (optional) sampled stacks of the request
+        """
+        window_seconds = self.app.config.get("PROFILE_WINDOW", 3600)
+        window = int(time.time() // window_seconds * window_seconds)
+
+        stats = None
+        components: Dict[str, float] = defaultdict(float)
+        if profile is not None:
+            stats = pstats.Stats(profile)
+            # Time spent in the functions themselves, callees excluded
+            for (path, _, function), timing in stats.stats.items():  # type: ignore
+                name = component(f"{path.replace(os.sep, '/')}:{function}")
+                if name is not None:
+                    components[name] += timing[2]
+
+        with self._lock:
+            aggregate = self._aggregates.setdefault((endpoint, window), Aggregate())
+            aggregate.requests += 1
+            for name, seconds in components.items():
+                aggregate.components[name] += seconds
+            if stats is not None:
+                if aggregate.stats is None:
+                    aggregate.stats = stats
+                else:
+                    aggregate.stats.add(stats)
+            if stacks:
+                aggregate.stacks.update(stacks)
+                interval = self.sampler.interval
+                for stack, count in stacks.items():
+                    # Component of the innermost frame that has one
+                    frames = reversed(stack.split(";"))
+                    name = next(filter(None, map(component, frames)), None)
+                    if name is not None:
+                        aggregate.components[name] += count * interval
+            self._dirty.add((endpoint, window))
+
+    def start_flushing(self) -> None:
+        """Flush periodically from a thread, once per process."""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            # Aggregates inherited from the parent are its to write
+            self._aggregates = {}
+            self._dirty = set()
+            self._pid = pid
+
+        threading.Thread(target=self._run, name="profile-flush", daemon=True).start()
+        atexit.register(self.flush)
+
+    def _run(self) -> None:
+        """Flush every `PROFILE_FLUSH_INTERVAL` seconds."""
+        while True:
+            time.sleep(self.app.config.get("PROFILE_FLUSH_INTERVAL", 5))
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the aggregates that changed, and rotate on a new window.
+
+        Aggregates are copied with the lock held and written without it, so
+        requests being profiled don't wait on the disk.
+        """
+        if self._pid != os.getpid() or not self.app.config.get("PROFILE_DIR"):
+            return
+        window_seconds = self.app.config.get("PROFILE_WINDOW", 3600)
+        window = int(time.time() // window_seconds * window_seconds)
+
+        with self._flush_lock:
+            with self._lock:
+                copies = [
+                    (key, self._aggregates[key].snapshot()) for key in self._dirty
+                ]
+                self._dirty = set()
+                # Requests started in the previous window may still add to it
+                for key in [
+                    key for key in self._aggregates if key[1] < window - window_seconds
+                ]:
+                    del self._aggregates[key]
+
+            for (endpoint, key_window), snapshot in copies:
+                self.write(endpoint, key_window, *snapshot)
+            if self._rotated != window:
+                self.rotate(window, window_seconds)
+                self._rotated = window
+
+    def write(
+        self,
+        endpoint: str,
+        window: int,
+        stats: Optional[Dict[Any, Any]],
+        stacks: Dict[str, int],
+        summary: Dict[str, Any],
+    ) -> None:
+        """Write the files of an aggregate.
+
+        Arguments:
+          endpoint: endpoint of the aggregate
+          window: start of the aggregate's window
+          stats: `pstats.Stats.stats` of the aggregate, None if none
+          stacks: sampled stacks of the aggregate
+          summary: content of the JSON file
+        """
+        directory = self.app.config["PROFILE_DIR"]
+        os.makedirs(directory, exist_ok=True)
+        prefix = os.path.join(directory, f"{endpoint}.{window}.{os.getpid()}")
+
+        if stats is not None:
+            # The format of `pstats.Stats.dump_stats`
+            _write(prefix + ".pstats", marshal.dumps(stats))
+        if stacks:
+            _write(
+                prefix + ".collapsed",
+                "".join(f"{stack} {count}\n" for stack, count in stacks.items()),
+            )
+        _write(prefix + ".json", json.dumps(summary))
+
+    def rotate(self, window: int, window_seconds: int) -> None:
+        """Delete the files of windows past `PROFILE_KEEP`."""
+        oldest = window - self.app.config.get("PROFILE_KEEP", 24) * window_seconds
+        for path in glob.glob(os.path.join(self.app.config["PROFILE_DIR"], "*.*.*")):
+            parts = os.path.basename(path).split(".")
+            if len(parts) == 4 and parts[1].isdigit() and int(parts[1]) < oldest:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+
+def _write(path: str, data: Union[str, bytes]) -> None:
+    """Replace a file atomically."""
+    partial = f"{path}.{threading.get_ident()}.tmp"
+    with open(partial, "wb") as f:
+        f.write(data.encode() if isinstance(data, str) else data)
+    os.replace(partial, path)
+
+
+def install_profiler(app: Flask) -> None:
+    """Profile requests of an app once `PROFILE_DIR` is set.
+
+    Arguments:
+      app: Flask app
+    """
+    profiler = RequestProfiler(app)
+    app.extensions["profiler"] = profiler
+
+    @app.before_request
+    def start_profile() -> None:
+        """Profile the request if enabled and wanted."""
+        if app.config.get("PROFILE_DIR") and profiler.wanted():
+            profiler.start()
+
+    @app.teardown_request
+    def stop_profile(exc: Optional[BaseException]) -> None:
+        """Record the request's profile, if any."""
+        profiler.stop()
@@ -0,0 +1,214 @@
+"""Module for serving culture reads from an in-memory copy of the catalog.
+
+With `CULTURE_READ_MODEL` set, every worker keeps an immutable `Snapshot` of
+all cultures, encoded and indexed by name, and GET /api/v1/cultures and
+GET /api/v1/cultures/<name> are answered from it without touching MongoDB.
+
+Writes go to MongoDB as before. The worker handling a write applies it at once
+through the catalog listeners, other workers pick it up:
+  poll - when `CULTURE_READ_MODEL_INTERVAL` (default 1) seconds have passed
+    since they last checked the catalog version
+  watch - as soon as a change stream on `catalog` reports the version bump,
+    falling back to polling when change streams are unavailable (they need a
+    replica set)
+
+Refreshing builds a new snapshot and swaps it in, readers keep the one they
+started with and never wait on a refresh.
+"""
+import bisect
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+from flask import Flask
+from pymongo import MongoClient  # type: ignore
+
+from .caching import content_digest
+from .catalog import CatalogMirror
+
+MODES = ("poll", "watch")
+
+
+class CultureEntry(NamedTuple):
+    """Culture as served by GET /api/v1/cultures/<name>."""
+
+    modified: int
+    digest: str
+    # Encoded culture, `digest` excluded
+    data: bytes
+
+
+class Snapshot(NamedTuple):
+    """Immutable copy of the catalog at one version."""
+
+    version: int
+    # Sorted culture names
+    names: Tuple[str, ...]
+    cultures: Dict[str, CultureEntry]
+
+    def page(self, after: Optional[str], limit: int) -> Dict[str, Any]:
+        """List cultures, see `api.resource.culture.cultures`.
+
+        Arguments:
+          after: only list cultures whose name sorts after this one
+          limit: maximum number of cultures, 0 for all
+
+        Returns:
+          {"cultures": [{"name": "culture1", "modified": 00000000}], "next": ...}
+        """
+        start = 0 if after is None else bisect.bisect_right(self.names, after)
+        names = self.names[start : start + limit if limit else None]
+
+        page: Dict[str, Any] = {
+            "cultures": [
+                {"name": name, "modified": self.cultures[name].modified}
+                for name in names
+            ]
+        }
+        if limit and len(names) == limit:
+            page["next"] = names[-1]
+        return page
+
+
+class ReadModel(CatalogMirror):
+    """Snapshot of every culture, kept current as a `CatalogMirror`."""
+
+    # Everything, `digest` included
+    projection = None
+
+    def __init__(
+        self,
+        dumps: Callable[[Any], bytes],
+        mode: str = "poll",
+        interval: float = 1,
+        logger: Optional[logging.Logger] = None,
+    ):
+        """Create an empty read model, nothing is loaded until `current`.
+
+        Arguments:
+          dumps: JSON encoder of cultures
+          mode: poll or watch, see the module docstring
+          interval: seconds between checks of the catalog version when polling
+          logger: (optional) logs change stream failures
+        """
+        if mode not in MODES:
+            raise ValueError(f"unknown CULTURE_READ_MODEL `{mode}`")
+
+        super().__init__()
+        self.dumps = dumps
+        self.mode = mode
+        self.interval = interval
+        self.logger = logger or logging.getLogger(__name__)
+        self.snapshot: Optional[Snapshot] = None
+        self.watching = False
+        self._watcher_pid: Optional[int] = None
+        # Changed by `_add` and `_remove`, published as a copy by `refresh`
+        self._cultures: Dict[str, CultureEntry] = {}
+
+    def _add(self, culture: Dict[str, Any]) -> None:
+        """Encode a culture, replacing an older copy of it."""
+        digest = culture.pop("digest", None) or content_digest(culture)
+        self._cultures[culture["name"]] = CultureEntry(
+            culture["modified"], digest, self.dumps(culture)
+        )
+
+    def _remove(self, name: str) -> None:
+        """Drop a culture."""
+        self._cultures.pop(name, None)
+
+    def refresh(self, db: MongoClient) -> None:
+        """Apply writes made since the last refresh and swap in a new snapshot.
+
+        Arguments:
+          db: MongoDB client
+        """
+        super().refresh(db)
+        with self._lock:
+            if self.snapshot is None or self.snapshot.version != self.version:
+                self.snapshot = Snapshot(
+                    self.version or 0,
+                    tuple(sorted(self._cultures)),
+                    dict(self._cultures),
+                )
+
+    def current(self, db: MongoClient) -> Snapshot:
+        """Snapshot to serve a request from.
+
+        The first call loads the catalog. Afterwards a stale snapshot is
+        refreshed by the request noticing it, requests arriving meanwhile are
+        served the previous snapshot.
+
+        Arguments:
+          db: MongoDB client
+
+        Returns:
+          the latest snapshot
+        """
+        if self.mode == "watch" and self._watcher_pid != os.getpid():
+            self._start_watching(db)
+
+        if self.snapshot is None:
+            self.refresh(db)
+        elif (
+            not self.watching
+            and time.monotonic() - self.checked >= self.interval
+            # Racy, at worst a second request waits for the refresh
+            and not self._lock.locked()
+        ):
+            self.refresh(db)
+
+        assert self.snapshot is not None
+        return self.snapshot
+
+    def _start_watching(self, db: MongoClient) -> None:
+        """Start the change stream thread of this process."""
+        with self._lock:
+            if self._watcher_pid == os.getpid():
+                return
+            # Threads don't survive a fork, each worker starts its own
+            self._watcher_pid = os.getpid()
+            self.watching = False
+
+        threading.Thread(
+            target=self._watch, args=(db,), name="culture-read-model", daemon=True
+        ).start()
+
+    def _watch(self, db: MongoClient) -> None:
+        """Refresh on every catalog version bump until the stream fails."""
+        try:
+            with db.catalog.watch() as stream:
+                self.watching = True
+                # Writes made before the stream opened
+                self.refresh(db)
+                for _ in stream:
+                    self.refresh(db)
+        except Exception:  # pylint: disable=broad-except
+            self.logger.exception("catalog change stream failed, polling instead")
+        finally:
+            self.watching = False
+
+
+def install_read_model(
+    app: Flask, dumps: Callable[[Any], bytes]
+) -> Optional[ReadModel]:
+    """Create the read model of an app when `CULTURE_READ_MODEL` is set.
+
+    Arguments:
+      app: Flask app
+      dumps: JSON encoder of cultures
+
+    Returns:
+      the read model, None when disabled
+    """
+    mode = app.config.get("CULTURE_READ_MODEL")
+    if not mode:
+        return None
+
+    read_model = ReadModel(
+        dumps, mode, app.config.get("CULTURE_READ_MODEL_INTERVAL", 1), app.logger
+    )
+    read_model.follow(app)
+    app.extensions["culture_read_model"] = read_model
+    return read_model
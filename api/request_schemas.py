@@ -1,7 +1,16 @@
 """Module for request body schemas and validation function."""
-from typing import Any, Dict, Optional, Union
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Type, Union
 
-from marshmallow import Schema, ValidationError, fields
+from marshmallow import (Schema, ValidationError, fields, pre_load,
+                         validates_schema)
+
+# Per list caps, checked before any insight of the list is validated
+MAX_INSIGHTS = 500
+MAX_CATEGORIES = 100
+
+# Static routes under /api/v1/cultures/, a culture of that name couldn't be read
+RESERVED_CULTURE_NAMES = ("version", "changes", "suggest")
 
 
 class InsightSchema(Schema):
@@ -23,21 +32,96 @@ class InsightSchema(Schema):
     source = fields.Dict(keys=fields.String(), values=fields.String(), required=True)
 
 
-def feedback_validator(feedback: str) -> Optional[ValidationError]:
+def insight_errors(insight: Any) -> Optional[Dict[str, Any]]:
+    """Validate one insight without building an `InsightSchema`.
+
+    Arguments:
+      insight: insight to validate
+
+    Returns:
+      errors in the format of `InsightSchema().validate`, None when valid
+    """
+    if not isinstance(insight, dict):
+        return {"_schema": ["Invalid input type."]}
+
+    errors: Dict[str, Any] = {}
+    for field in ("summary", "information"):
+        if field not in insight:
+            errors[field] = ["Missing data for required field."]
+        elif not isinstance(insight[field], str):
+            errors[field] = ["Not a valid string."]
+
+    source = insight.get("source")
+    if source is None:
+        errors["source"] = ["Missing data for required field."]
+    elif not isinstance(source, dict):
+        errors["source"] = ["Not a valid mapping type."]
+    else:
+        source_errors: Dict[Any, Any] = {}
+        for key, value in source.items():
+            if not isinstance(key, str):
+                source_errors.setdefault(key, {})["key"] = ["Not a valid string."]
+            if not isinstance(value, str):
+                source_errors.setdefault(key, {})["value"] = ["Not a valid string."]
+        if source_errors:
+            errors["source"] = source_errors
+
+    for field in insight.keys() - {"summary", "information", "source"}:
+        errors[field] = ["Unknown field."]
+
+    return errors or None
+
+
+class InsightList(fields.Field):
+    """List of insights validated in one pass.
+
+    Equivalent to `fields.List(fields.Nested(InsightSchema()))` without
+    building nested schemas and fields for every insight, large cultures are
+    validated several times faster.
+    """
+
+    default_error_messages = {
+        "invalid": "Not a valid list.",
+        "too_long": f"More than {MAX_INSIGHTS} insights.",
+    }
+
+    def _deserialize(self, value: Any, attr: Any, data: Any, **kwargs) -> List[Dict]:
+        if not isinstance(value, list):
+            raise self.make_error("invalid")
+        if len(value) > MAX_INSIGHTS:
+            raise self.make_error("too_long")
+
+        errors = {}
+        for i, insight in enumerate(value):
+            error = insight_errors(insight)
+            if error is not None:
+                errors[i] = error
+        if errors:
+            raise ValidationError(errors)
+
+        return [
+            {
+                "summary": insight["summary"],
+                "information": insight["information"],
+                "source": dict(insight["source"]),
+            }
+            for insight in value
+        ]
+
+
+def feedback_validator(feedback: str) -> None:
     """Feedback validator, checks if the feedback has 0 < x < 300 characters.
 
     Arguments:
       feedback: feedback to validate
 
-    Returns:
-      ValidationError or None - None meaning valid input
+    Raises:
+      ValidationError when invalid
     """
     if len(feedback) == 0:
-        return ValidationError("Feedback is too short")
+        raise ValidationError("Feedback is too short")
     if len(feedback) > 300:
-        return ValidationError("Feedback is too long")
-
-    return None
+        raise ValidationError("Feedback is too long")
 
 
 class FeedbackSchema(Schema):
@@ -52,6 +136,19 @@ class FeedbackSchema(Schema):
     feedback = fields.String(validate=feedback_validator, required=True)
 
 
+def culture_name_validator(name: str) -> None:
+    """Culture name validator, rejects names of static culture routes.
+
+    Arguments:
+      name: culture name to validate
+
+    Raises:
+      ValidationError when invalid
+    """
+    if name in RESERVED_CULTURE_NAMES:
+        raise ValidationError(f"`{name}` is reserved")
+
+
 class CultureCreateSchema(Schema):
     """POST /api/v1/cultures.
 
@@ -61,7 +158,7 @@ class CultureCreateSchema(Schema):
     }
     """
 
-    name = fields.String(required=True)
+    name = fields.String(validate=culture_name_validator, required=True)
 
 
 class CultureUpdateSchema(Schema):
@@ -75,13 +172,63 @@ class CultureUpdateSchema(Schema):
     }
     """
 
-    name = fields.String(required=True)
-    general_insights = fields.List(fields.Nested(InsightSchema()), required=True)
+    name = fields.String(validate=culture_name_validator, required=True)
+    general_insights = InsightList(required=True)
     specialized_insights = fields.Dict(
         keys=fields.String(),
-        values=fields.List(fields.Nested(InsightSchema()), required=True),
+        values=InsightList(required=True),
     )
 
+    @pre_load
+    def check_categories(self, data: Any, **kwargs) -> Any:
+        """Reject too many categories before validating any of them."""
+        if not isinstance(data, dict):
+            return data
+
+        categories = data.get("specialized_insights")
+        if isinstance(categories, dict) and len(categories) > MAX_CATEGORIES:
+            raise ValidationError(
+                f"More than {MAX_CATEGORIES} categories.", "specialized_insights"
+            )
+        return data
+
+
+class InsightPatchSchema(Schema):
+    """PATCH /api/v1/cultures/<name>/insights/<category>/<index>.
+
+    Format (at least one field):
+    {
+      "summary": "summary",
+      "information": "text",
+      "source": {
+        "data": "www.example.com",
+        "type": "link"
+      }
+    }
+    """
+
+    summary = fields.String()
+    information = fields.String()
+    source = fields.Dict(keys=fields.String(), values=fields.String())
+
+    @validates_schema
+    def not_empty(self, data: Dict[str, Any], **kwargs) -> None:
+        """Require at least one field."""
+        if not data:
+            raise ValidationError("No fields to update.")
+
+
+class InsightReorderSchema(Schema):
+    """POST /api/v1/cultures/<name>/insights/<category>/reorder.
+
+    Format, current indexes in their new order:
+    {
+      "order": [2, 0, 1]
+    }
+    """
+
+    order = fields.List(fields.Integer(), required=True)
+
 
 class AdminLoginSchema(Schema):
     """POST /api/v1/login.
@@ -147,10 +294,18 @@ class AdminUpdateSchema(Schema):
     superUser = fields.Boolean()
 
 
-def validate_request_body(schema, body: Dict) -> Union[str, Dict[str, Any]]:
+@lru_cache(maxsize=None)
+def schema_instance(schema: Type[Schema]) -> Schema:
+    """Build each schema once, instances are reused across requests."""
+    return schema()
+
+
+def validate_request_body(
+    schema: Type[Schema], body: Dict
+) -> Union[str, Dict[str, Any]]:
     """Validates a request body using the corresponding request schema."""
     try:
-        return schema().load(body)
+        return schema_instance(schema).load(body)
     except ValidationError as err:
         return (
             f"Error: Request body containing `{err.valid_data}` invalid: {err.messages}"
@@ -6,6 +6,7 @@ from flask import Flask, request
 from flask_jwt_extended import create_access_token  # type: ignore
 from flask_jwt_extended import jwt_required
 from pymongo import MongoClient  # type:ignore
+from pymongo.errors import DuplicateKeyError  # type: ignore
 from werkzeug.security import generate_password_hash
 
 from ..mailer import send_invite_email, send_recovery_email
@@ -104,7 +105,7 @@ def admin_routes(app: Flask, db: MongoClient) -> None:
 
         token = create_access_token(identity=email, expires_delta=timedelta(days=1))
 
-        send_invite_email(app, token, email)
+        send_invite_email(app, db, token, email)
 
         return {"msg": f"email sent to {email}"}, 200
 
@@ -131,13 +132,17 @@ def admin_routes(app: Flask, db: MongoClient) -> None:
           {"msg": "successfully updated admin <EMAIL>"}
 
           401 - bad auth token
+          404 - can't find admin
+          409 - another admin has the new email
           500 - otherwise
         """
         body = validate_request_body(AdminUpdateSchema, request.json)
         if isinstance(body, str):
             return {"msg": body}, 400
 
-        admin = db.admins.find_one({"email": body["email"]})
+        admin = db.admins.find_one({"email": email})
+        if admin is None:
+            return {"msg": f"unknown admin `{email}`"}, 404
 
         if "password" in body:
             if body["password"] != body["password_confirmation"]:
@@ -156,10 +161,21 @@ def admin_routes(app: Flask, db: MongoClient) -> None:
         if "name" not in body:
             body["name"] = admin["name"]
 
-        result = db.admins.replace_one({"email": email}, body)
+        try:
+            result = db.admins.replace_one({"email": email}, body)
+        except DuplicateKeyError:
+            return (
+                {"msg": f"failed to update admin <{email}>: {body['email']} exists"},
+                409,
+            )
         if result.matched_count == 0 or result.modified_count == 0:
             return {"msg": "Internal server error"}, 500
 
+        if body["password"] != admin["password"] or body["email"] != email:
+            # Sessions logged in with the old password or as the old email
+            # have to log in again
+            db.refresh_tokens.delete_many({"email": email})
+
         return {"msg": f"successfully updated admin <{email}>"}, 200
 
     @app.route("/api/v1/admins/<email>", methods=["DELETE"])
@@ -182,6 +198,8 @@ def admin_routes(app: Flask, db: MongoClient) -> None:
         result = collection.delete_one({"email": email})
         if result.deleted_count == 0:
             return {"msg": "Internal server error"}, 500
+
+        db.refresh_tokens.delete_many({"email": email})
         return {"msg": f"successfully deleted admin <{email}>"}, 200
 
     @app.route("/api/v1/admins/recover", methods=["POST"])
@@ -216,6 +234,6 @@ def admin_routes(app: Flask, db: MongoClient) -> None:
 
         token = create_access_token(identity=email, expires_delta=timedelta(days=1))
 
-        send_recovery_email(app, token, email)
+        send_recovery_email(app, db, token, email)
 
         return {"msg": f"email sent to {email}"}, 200
@@ -1,11 +1,21 @@
 """Module for culture routes."""
 import time
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, Tuple, Union
 
-from flask import Flask, request
+from bson.codec_options import CodecOptions  # type: ignore
+from bson.raw_bson import RawBSONDocument  # type: ignore
+from flask import Flask, Response, request
 from flask_jwt_extended import jwt_required  # type: ignore
 from pymongo import MongoClient  # type:ignore
-
+from pymongo.errors import DuplicateKeyError  # type:ignore
+
+from ..bsonjson import transcode
+from ..caching import (cache_headers, content_digest, is_fresh, make_etag,
+                       not_modified)
+from ..catalog import (catalog_version, changes_since, culture_deleted,
+                       culture_written, notify)
+from ..encoding import PROVIDERS, EncodedCache, dumps, json_response
+from ..read_model import install_read_model
 from ..request_schemas import (CultureCreateSchema, CultureUpdateSchema,
                                validate_request_body)
 
@@ -18,47 +28,197 @@ def culture_routes(app: Flask, db: MongoClient) -> None:
 
     db: MongoDB client
     """
+    encoded = app.extensions.setdefault(
+        "culture_cache",
+        EncodedCache(app.config.get("CULTURE_ENCODED_CACHE_BYTES", 32 * 1024 * 1024)),
+    )
+    read_model = install_read_model(
+        app, PROVIDERS[app.extensions.get("json_provider", "stdlib")]
+    )
 
     @app.route("/api/v1/cultures")
-    def cultures() -> Tuple[Dict[str, List[Dict[str, Any]]], int]:
+    def cultures() -> Union[Response, Tuple[Dict[str, str], int]]:
         """Fetch a list of all culture groups in alphabetical order with their last modified timestamps.
 
+        The query is covered by the `name_modified` index, or the list is
+        taken from the read model when `CULTURE_READ_MODEL` is set. Responses
+        carry an ETag of the list, `If-None-Match` is answered with 304.
+
+        Arguments:
+          after: (optional) only list cultures whose name sorts after this one
+
+          limit: (optional) maximum number of cultures to list, when the page is
+            full `next` holds the `after` value of the following page
+
         Returns:
           200 - list of the all the names of culture groups
           {
             "cultures": [
                 { "name": "culture1", "modified": 00000000 },
                 { "name": "culture2", "modified": 00000001 },
+            ],
+            "next": "culture2"
+          }
+
+          304 - list unchanged since the client's copy
+          400 - bad `limit`
+          500 - otherwise
+        """
+        query: Dict[str, Any] = {}
+        after = request.args.get("after")
+        if after is not None:
+            query["name"] = {"$gt": after}
+
+        limit_arg = request.args.get("limit", "0")
+        if not limit_arg.isdigit() or int(limit_arg) > app.config.get(
+            "CULTURE_PAGE_MAX", 500
+        ):
+            return {"msg": f"invalid limit `{limit_arg}`"}, 400
+        limit = int(limit_arg)
+
+        if read_model is not None:
+            page = read_model.current(db).page(after, limit)
+        else:
+            cursor = (
+                db.cultures.find(query, {"_id": 0, "name": 1, "modified": 1})
+                .sort("name")
+                .hint("name_modified")
+                .limit(limit)
+            )
+            cultures = [
+                {"name": culture["name"], "modified": culture["modified"]}
+                for culture in cursor
             ]
+
+            page = {"cultures": cultures}
+            if limit and len(cultures) == limit:
+                page["next"] = cultures[-1]["name"]
+
+        etag = content_digest(page)
+        if is_fresh(etag):
+            return not_modified(etag)
+
+        return cache_headers(json_response(dumps(page)), etag)
+
+    @app.route("/api/v1/cultures/version")
+    def cultures_version() -> Tuple[Dict[str, int], int]:
+        """Fetch the catalog version, which changes on every culture write.
+
+        Returns:
+          200 - catalog version and timestamp of the latest write
+
+          {"version": 42, "modified": 00000000}
+
+          500 - otherwise
+        """
+        return catalog_version(db), 200
+
+    @app.route("/api/v1/cultures/changes")
+    def cultures_changes() -> Tuple[Dict[str, Any], int]:
+        """Fetch cultures changed since a timestamp along with deleted cultures.
+
+        Arguments:
+          since: EPOCH timestamp, usually `modified` of the previous sync
+
+        Returns:
+          200 - changed cultures and tombstones of deleted cultures
+
+          {
+            "version": 42,
+            "modified": 00000001,
+            "cultures": [{"name": "culture1", "modified": 00000001, ...}],
+            "deleted": [{"name": "culture2", "deleted": 00000001}]
           }
 
+          400 - missing or malformed `since`
           500 - otherwise
         """
-        collection = db.cultures
-        cultures = [
-            {"name": culture["name"], "modified": culture["modified"]}
-            for culture in collection.find().sort("name")
-        ]
-        return {"cultures": cultures}, 200
+        since = request.args.get("since", "")
+        if not since.isdigit():
+            return {"msg": f"invalid since `{since}`"}, 400
+
+        # Read the version first, writes racing this request are sent next sync
+        version = catalog_version(db)
+        cultures, tombstones = changes_since(db, int(since))
+
+        return {**version, "cultures": cultures, "deleted": tombstones}, 200
 
     @app.route("/api/v1/cultures/<name>")
-    def culture(name: str) -> Tuple[Dict[str, Any], int]:
+    def culture(name: str) -> Union[Response, Tuple[Dict[str, Any], int]]:
         """Fetch information about a specific Culture Group.
 
+        The culture's `modified` and `digest` are loaded first, they answer
+        `If-None-Match` and `If-Modified-Since` and look up the encoded culture
+        in a cache of `CULTURE_ENCODED_CACHE_BYTES` (default 32MB) per worker.
+        Only a culture missing from the cache is loaded and encoded.
+
+        With `CULTURE_RAW_BSON` set a missed culture is instead streamed as it
+        is transcoded from BSON, without being cached or decoded.
+
+        With `CULTURE_READ_MODEL` set the culture is served from the worker's
+        snapshot of the catalog instead, see `api.read_model`.
+
         Arguments:
           group_name: name of Culture Group
 
         Returns:
           200 - all general insights for a group
+          304 - culture unchanged since the client's copy
+          404 - unknown culture
           500 - otherwise
         """
+        if read_model is not None:
+            entry = read_model.current(db).cultures.get(name)
+            if entry is None:
+                return {"msg": f"unknown culture `{name}`"}, 404
+
+            etag = make_etag(entry.modified, entry.digest)
+            if is_fresh(etag, entry.modified):
+                return not_modified(etag, entry.modified)
+            return cache_headers(json_response(entry.data), etag, entry.modified)
+
         collection = db.cultures
+
+        stamp = collection.find_one({"name": name}, {"modified": 1, "digest": 1})
+        if stamp is None:
+            return {"msg": f"unknown culture `{name}`"}, 404
+
+        if "digest" in stamp:
+            etag = make_etag(stamp["modified"], stamp["digest"])
+            if is_fresh(etag, stamp["modified"]):
+                return not_modified(etag, stamp["modified"])
+
+            data = encoded.get((stamp["_id"], stamp["modified"], stamp["digest"]))
+            if data is not None:
+                return cache_headers(json_response(data), etag, stamp["modified"])
+
+            if app.config.get("CULTURE_RAW_BSON", False):
+                raw = collection.with_options(
+                    codec_options=CodecOptions(document_class=RawBSONDocument)
+                ).find_one({"_id": stamp["_id"]}, {"digest": 0})
+                if raw is not None:
+                    response = app.response_class(
+                        transcode(raw.raw), mimetype="application/json"
+                    )
+                    return cache_headers(response, etag, stamp["modified"])
+
         culture = collection.find_one({"name": name})
         if culture is None:
             return {"msg": f"unknown culture `{name}`"}, 404
 
-        culture["_id"] = str(culture["_id"])
-        return culture, 200
+        digest = culture.pop("digest", None)
+        if digest is None:
+            # Written before digests were stored, backfill it for the next read
+            digest = content_digest(culture)
+            collection.update_one(
+                {"_id": culture["_id"], "digest": {"$exists": False}},
+                {"$set": {"digest": digest}},
+            )
+
+        data = dumps(culture)
+        encoded.put((culture["_id"], culture["modified"], digest), data)
+        etag = make_etag(culture["modified"], digest)
+        return cache_headers(json_response(data), etag, culture["modified"])
 
     @app.route("/api/v1/cultures", methods=["POST"])
     @jwt_required
@@ -76,6 +236,7 @@ def culture_routes(app: Flask, db: MongoClient) -> None:
           200 - group successfully added
           400 - malformed POST body
           401 - bad auth token
+          409 - culture already exists
           500 - otherwise
         """
         body = validate_request_body(CultureCreateSchema, request.get_json())
@@ -84,21 +245,25 @@ def culture_routes(app: Flask, db: MongoClient) -> None:
 
         body["modified"] = int(time.time())
 
-        collection = db.cultures
-        if collection.find_one({"name": body["name"]}) is not None:
+        body["general_insights"] = []
+        body["specialized_insights"] = []
+        body["digest"] = content_digest(body)
+
+        try:
+            result = db.cultures.insert_one(body)
+        except DuplicateKeyError:
             return (
                 {"msg": f"failed to create culture {body['name']}: already exists"},
                 409,
             )
 
-        body["general_insights"] = []
-        body["specialized_insights"] = []
-
-        result = collection.insert_one(body)
-
         if not result.acknowledged:
             return {"msg": f"failed to create culture {body['name']}"}, 500
 
+        culture_written(db, body["name"], body["modified"])
+        notify(app, db)
+
+        del body["digest"]
         body["_id"] = str(body["_id"])
         return body, 201
 
@@ -135,6 +300,7 @@ def culture_routes(app: Flask, db: MongoClient) -> None:
 
           400 - malformed POST body
           401 - bad auth token
+          409 - renamed to the name of another culture
           500 - otherwise
         """
         body = validate_request_body(CultureUpdateSchema, request.get_json())
@@ -142,7 +308,20 @@ def culture_routes(app: Flask, db: MongoClient) -> None:
             return {"msg": body}, 400
 
         body["modified"] = int(time.time())
-        result = db.cultures.replace_one({"name": name}, body, upsert=True)
+        try:
+            result = db.cultures.replace_one(
+                {"name": name}, {**body, "digest": content_digest(body)}, upsert=True
+            )
+        except DuplicateKeyError:
+            return (
+                {"msg": f"failed to rename culture {name}: {body['name']} exists"},
+                409,
+            )
+
+        if result.matched_count and body["name"] != name:
+            culture_deleted(db, name, body["modified"])
+        culture_written(db, body["name"], body["modified"])
+        notify(app, db)
 
         if result.matched_count == 0:
             return body, 201
@@ -168,12 +347,13 @@ def culture_routes(app: Flask, db: MongoClient) -> None:
           404 - unknown culture
           500 - otherwise
         """
-        collection = db.cultures
-        if collection.find_one({"name": name}) is None:
+        result = db.cultures.delete_one({"name": name})
+        if not result.acknowledged:
+            return {"msg": "Internal server error"}, 500
+        if result.deleted_count == 0:
             return {"msg": f"Unknown culture `{name}`"}, 404
 
-        result = collection.delete_one({"name": name})
-        if result.deleted_count == 0:
-            return {"msg": "Internal server error"}, 500
+        culture_deleted(db, name, int(time.time()))
+        notify(app, db)
 
         return {"msg": f"deleted {name}"}, 200
@@ -0,0 +1,114 @@
+"""Module for feedback routes."""
+import time
+from typing import Any, Dict, Tuple
+
+from bson import ObjectId  # type: ignore
+from bson.errors import InvalidId  # type: ignore
+from flask import Flask, request
+from flask_jwt_extended import jwt_required  # type: ignore
+from pymongo import MongoClient  # type:ignore
+
+from ..request_schemas import FeedbackSchema, validate_request_body
+
+
+def feedback_routes(app: Flask, db: MongoClient) -> None:
+    """Adds Feedback routes to Flask App.
+
+    Feedback is stored in the capped `feedback` collection and emailed to
+    $GMAIL_USERNAME in digests, see `api.mailer.digest`.
+
+    Arguments:
+    app: Flask app
+
+    db: MongoDB client
+    """
+
+    @app.route("/api/v1/feedback", methods=["POST"])
+    def feedback() -> Tuple[Dict[str, str], int]:
+        """Submit feedback.
+
+        Arguments:
+          POST Body:
+
+          {
+            "feedback": "...",
+          }
+
+        Returns:
+          200 - feedback saved
+
+          {"msg": "feedback sent"}
+
+          400 - malformed request
+          500 - otherwise
+
+        """
+        body = validate_request_body(FeedbackSchema, request.json)
+        if isinstance(body, str):
+            return {"msg": body}, 400
+
+        result = db.feedback.insert_one(
+            {
+                "feedback": body["feedback"],
+                "created": int(time.time()),
+                "digested": False,
+            }
+        )
+        if not result.acknowledged:
+            return {"msg": "Internal server error"}, 500
+
+        return {"msg": "feedback sent"}, 200
+
+    @app.route("/api/v1/feedback")
+    @jwt_required
+    def feedback_list() -> Tuple[Dict[str, Any], int]:
+        """List feedback, newest first.
+
+        Arguments:
+          before: (optional) only list feedback older than this `_id`
+
+          limit: (optional) maximum number of feedback to list, default 50,
+            when the page is full `next` holds the `before` value of the
+            following page
+
+        Returns:
+          200 - feedback
+
+          {
+            "feedback": [
+              {"_id": "...", "feedback": "...", "created": 00000000}
+            ],
+            "next": "..."
+          }
+
+          400 - bad `before` or `limit`
+          401 - bad auth token
+          500 - otherwise
+        """
+        query: Dict[str, Any] = {}
+        before = request.args.get("before")
+        if before is not None:
+            try:
+                query["_id"] = {"$lt": ObjectId(before)}
+            except InvalidId:
+                return {"msg": f"invalid before `{before}`"}, 400
+
+        limit_arg = request.args.get("limit", "50")
+        if not limit_arg.isdigit() or not 0 < int(limit_arg) <= 500:
+            return {"msg": f"invalid limit `{limit_arg}`"}, 400
+        limit = int(limit_arg)
+
+        entries = [
+            {
+                "_id": str(entry["_id"]),
+                "feedback": entry["feedback"],
+                "created": entry["created"],
+            }
+            for entry in db.feedback.find(query).sort("_id", -1).limit(limit)
+        ]
+
+        page: Dict[str, Any] = {"feedback": entries}
+        if len(entries) == limit:
+            page["next"] = entries[-1]["_id"]
+
+        return page, 200
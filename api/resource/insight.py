@@ -0,0 +1,395 @@
+"""Module for insight routes, reads and edits of single insights of a culture.
+
+Reads return one page of one category through a `$slice` projection and edits
+turn into a targeted `$push`/`$set`/`$pull`, so payloads scale with the page
+or the edit rather than with the culture.
+
+Categories:
+  general - `general_insights`
+  anything else - `specialized_insights.<category>`
+"""
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from flask import Flask, Response, request
+from flask_jwt_extended import jwt_required  # type: ignore
+from pymongo import MongoClient  # type:ignore
+
+from ..caching import (cache_headers, content_digest, is_fresh, not_modified,
+                       revision)
+from ..catalog import culture_written, notify
+from ..encoding import dumps, json_response
+from ..request_schemas import (MAX_INSIGHTS, InsightPatchSchema,
+                               InsightReorderSchema, InsightSchema,
+                               validate_request_body)
+
+
+def insight_path(category: str) -> Optional[str]:
+    """Document path of a category's insights.
+
+    Arguments:
+      category: "general" or name of a specialized category
+
+    Returns:
+      path, None when the category can't be used as a field name
+    """
+    if category == "general":
+        return "general_insights"
+    if not category or "." in category or category.startswith("$"):
+        return None
+    return f"specialized_insights.{category}"
+
+
+def category_insights(culture: Dict[str, Any], path: str) -> List[Dict[str, Any]]:
+    """Insights of a category from a culture document or projection.
+
+    Arguments:
+      culture: culture document
+      path: path returned by `insight_path`
+
+    Returns:
+      insights, empty when the category doesn't exist
+    """
+    insights: Any = culture
+    for key in path.split("."):
+        insights = insights.get(key, {}) if isinstance(insights, dict) else {}
+    return insights or []
+
+
+def insight_routes(app: Flask, db: MongoClient) -> None:
+    """Adds Insight routes to Flask App.
+
+    Arguments:
+    app: Flask app
+
+    db: MongoDB client
+    """
+
+    def written() -> Dict[str, Any]:
+        """Fields to `$set` on every write, a new `modified` and digest."""
+        return {"modified": int(time.time()), "digest": revision()}
+
+    @app.route("/api/v1/cultures/<name>/insights")
+    def insights(name: str) -> Union[Response, Tuple[Dict[str, Any], int]]:
+        """Fetch one page of the insights of a category.
+
+        The page is sliced by the database, the rest of the culture is never
+        sent to the app server. Responses carry an ETag of the page, `If-None-Match` is
+        answered with 304.
+
+        Arguments:
+          name: name of culture
+
+          category: (optional) "general" (default) or name of a specialized
+            category
+
+          offset: (optional) position of the first insight, defaults to 0
+
+          limit: (optional) maximum number of insights, defaults to
+            INSIGHT_PAGE_SIZE (20), when more insights follow `next` holds the
+            `offset` of the following page
+
+          summary: (optional) "true" to return only the `summary` of insights
+
+        Returns:
+          200 - page of insights
+
+          {
+            "name": "culture-name",
+            "category": "general",
+            "modified": 00000000,
+            "insights": [{"summary": "summary"}],
+            "total": 42,
+            "next": 20
+          }
+
+          304 - page unchanged since the client's copy
+          400 - malformed category, `offset` or `limit`
+          404 - unknown culture
+          500 - otherwise
+        """
+        category = request.args.get("category", "general")
+        path = insight_path(category)
+        if path is None:
+            return {"msg": f"invalid category `{category}`"}, 400
+
+        offset_arg = request.args.get("offset", "0")
+        if not offset_arg.isdigit():
+            return {"msg": f"invalid offset `{offset_arg}`"}, 400
+        offset = int(offset_arg)
+
+        limit_arg = request.args.get(
+            "limit", str(app.config.get("INSIGHT_PAGE_SIZE", 20))
+        )
+        if not limit_arg.isdigit() or not 0 < int(limit_arg) <= MAX_INSIGHTS:
+            return {"msg": f"invalid limit `{limit_arg}`"}, 400
+        limit = int(limit_arg)
+
+        category_array = {"$ifNull": [f"${path}", []]}
+        pipeline: List[Dict[str, Any]] = [
+            {"$match": {"name": name}},
+            {
+                "$project": {
+                    "_id": 0,
+                    "modified": 1,
+                    "insights": {"$slice": [category_array, offset, limit]},
+                    "total": {"$size": category_array},
+                }
+            },
+        ]
+        if request.args.get("summary") == "true":
+            # Leave the other fields of insights in the database
+            pipeline.append(
+                {"$project": {"modified": 1, "insights.summary": 1, "total": 1}}
+            )
+        culture = next(db.cultures.aggregate(pipeline), None)
+        if culture is None:
+            return {"msg": f"unknown culture `{name}`"}, 404
+
+        insights = culture["insights"]
+
+        page: Dict[str, Any] = {
+            "name": name,
+            "category": category,
+            "modified": culture["modified"],
+            "insights": insights,
+            "total": culture["total"],
+        }
+        if offset + len(insights) < culture["total"]:
+            page["next"] = offset + limit
+
+        etag = content_digest(page)
+        if is_fresh(etag):
+            return not_modified(etag, culture["modified"])
+
+        return cache_headers(json_response(dumps(page)), etag, culture["modified"])
+
+    @app.route("/api/v1/cultures/<name>/insights/<category>", methods=["POST"])
+    @jwt_required
+    def insight_create(name: str, category: str) -> Tuple[Dict[str, Any], int]:
+        """Append an insight to a category, creating the category if needed.
+
+        Arguments:
+          name: name of culture
+
+          category: "general" or name of a specialized category
+
+          POST Body: InsightSchema
+
+          {
+            "summary": "summary",
+            "information": "text",
+            "source": {"data": "www.example.com", "type": "link"}
+          }
+
+        Returns:
+          201 - insight appended
+
+          {"msg": "added insight to CULTURE", "modified": 00000000}
+
+          400 - malformed POST body or category
+          401 - bad auth token
+          404 - unknown culture
+          409 - category already holds MAX_INSIGHTS insights
+          500 - otherwise
+        """
+        path = insight_path(category)
+        if path is None:
+            return {"msg": f"invalid category `{category}`"}, 400
+
+        body = validate_request_body(InsightSchema, request.get_json())
+        if isinstance(body, str):
+            return {"msg": body}, 400
+
+        if path != "general_insights":
+            # Cultures are created with `specialized_insights` as a list
+            db.cultures.update_one(
+                {"name": name, "specialized_insights": {"$type": "array"}},
+                {"$set": {"specialized_insights": {}}},
+            )
+
+        fields = written()
+        result = db.cultures.update_one(
+            {"name": name, f"{path}.{MAX_INSIGHTS - 1}": {"$exists": False}},
+            {"$push": {path: body}, "$set": fields},
+        )
+        if result.matched_count == 0:
+            if db.cultures.count_documents({"name": name}, limit=1) == 0:
+                return {"msg": f"unknown culture `{name}`"}, 404
+            return {"msg": f"`{category}` holds {MAX_INSIGHTS} insights"}, 409
+
+        culture_written(db, name, fields["modified"])
+        notify(app, db)
+        return {"msg": f"added insight to {name}", "modified": fields["modified"]}, 201
+
+    @app.route(
+        "/api/v1/cultures/<name>/insights/<category>/<int:index>", methods=["PATCH"]
+    )
+    @jwt_required
+    def insight_update(
+        name: str, category: str, index: int
+    ) -> Tuple[Dict[str, Any], int]:
+        """Update fields of one insight.
+
+        Arguments:
+          name: name of culture
+
+          category: "general" or name of a specialized category
+
+          index: position of the insight in the category
+
+          PATCH Body: any of InsightSchema's fields
+
+          {"summary": "fixed typo"}
+
+        Returns:
+          200 - insight updated
+
+          {"msg": "updated insight of CULTURE", "modified": 00000000}
+
+          400 - malformed PATCH body or category
+          401 - bad auth token
+          404 - unknown culture or insight
+          500 - otherwise
+        """
+        path = insight_path(category)
+        if path is None:
+            return {"msg": f"invalid category `{category}`"}, 400
+
+        body = validate_request_body(InsightPatchSchema, request.get_json())
+        if isinstance(body, str):
+            return {"msg": body}, 400
+
+        updates = {f"{path}.{index}.{field}": value for field, value in body.items()}
+        fields = written()
+        result = db.cultures.update_one(
+            {"name": name, f"{path}.{index}": {"$exists": True}},
+            {"$set": {**updates, **fields}},
+        )
+        if result.matched_count == 0:
+            return {"msg": f"unknown insight `{category}/{index}` of `{name}`"}, 404
+
+        culture_written(db, name, fields["modified"])
+        notify(app, db)
+        return (
+            {"msg": f"updated insight of {name}", "modified": fields["modified"]},
+            200,
+        )
+
+    @app.route(
+        "/api/v1/cultures/<name>/insights/<category>/<int:index>", methods=["DELETE"]
+    )
+    @jwt_required
+    def insight_delete(
+        name: str, category: str, index: int
+    ) -> Tuple[Dict[str, Any], int]:
+        """Delete one insight, later insights move up one position.
+
+        Arguments:
+          name: name of culture
+
+          category: "general" or name of a specialized category
+
+          index: position of the insight in the category
+
+        Returns:
+          200 - insight deleted
+
+          {"msg": "deleted insight of CULTURE", "modified": 00000000}
+
+          400 - malformed category
+          401 - bad auth token
+          404 - unknown culture or insight
+          409 - culture changed concurrently, retry
+          500 - otherwise
+        """
+        path = insight_path(category)
+        if path is None:
+            return {"msg": f"invalid category `{category}`"}, 400
+
+        culture = db.cultures.find_one({"name": name}, {path: 1, "digest": 1})
+        insights = [] if culture is None else category_insights(culture, path)
+        if index >= len(insights):
+            return {"msg": f"unknown insight `{category}/{index}` of `{name}`"}, 404
+
+        # Arrays can't be pulled from by position, the category is rewritten
+        # without the insight, like `insight_reorder` does
+        fields = written()
+        result = db.cultures.update_one(
+            {"_id": culture["_id"], "digest": culture.get("digest")},
+            {"$set": {path: insights[:index] + insights[index + 1 :], **fields}},
+        )
+        if result.matched_count == 0:
+            return {"msg": f"`{name}` changed concurrently"}, 409
+
+        culture_written(db, name, fields["modified"])
+        notify(app, db)
+        return (
+            {"msg": f"deleted insight of {name}", "modified": fields["modified"]},
+            200,
+        )
+
+    @app.route(
+        "/api/v1/cultures/<name>/insights/<category>/reorder", methods=["POST"]
+    )
+    @jwt_required
+    def insight_reorder(name: str, category: str) -> Tuple[Dict[str, Any], int]:
+        """Reorder the insights of a category.
+
+        Only the category is rewritten, and only if nothing else changed the
+        culture since its insights were read.
+
+        Arguments:
+          name: name of culture
+
+          category: "general" or name of a specialized category
+
+          POST Body: current indexes in their new order
+
+          {"order": [2, 0, 1]}
+
+        Returns:
+          200 - insights reordered
+
+          {"msg": "reordered insights of CULTURE", "modified": 00000000}
+
+          400 - malformed POST body or category, `order` isn't a permutation
+          401 - bad auth token
+          404 - unknown culture
+          409 - culture changed concurrently, retry
+          500 - otherwise
+        """
+        path = insight_path(category)
+        if path is None:
+            return {"msg": f"invalid category `{category}`"}, 400
+
+        body = validate_request_body(InsightReorderSchema, request.get_json())
+        if isinstance(body, str):
+            return {"msg": body}, 400
+
+        culture = db.cultures.find_one({"name": name}, {path: 1, "digest": 1})
+        if culture is None:
+            return {"msg": f"unknown culture `{name}`"}, 404
+
+        insights = category_insights(culture, path)
+
+        if sorted(body["order"]) != list(range(len(insights))):
+            return (
+                {"msg": f"`order` must be a permutation of 0..{len(insights) - 1}"},
+                400,
+            )
+
+        fields = written()
+        result = db.cultures.update_one(
+            {"_id": culture["_id"], "digest": culture.get("digest")},
+            {"$set": {path: [insights[i] for i in body["order"]], **fields}},
+        )
+        if result.matched_count == 0:
+            return {"msg": f"`{name}` changed concurrently"}, 409
+
+        culture_written(db, name, fields["modified"])
+        notify(app, db)
+        return (
+            {"msg": f"reordered insights of {name}", "modified": fields["modified"]},
+            200,
+        )
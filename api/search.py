@@ -0,0 +1,236 @@
+"""Module for full-text search over culture names and insights.
+
+Every worker keeps an inverted index of the catalog in memory, loaded on the
+first search and kept current as a `CatalogMirror`. Other workers' writes are
+picked up within `SEARCH_REFRESH_INTERVAL` (default 5) seconds.
+
+Hits are insights (or culture names) ranked by TF-IDF, with matches in names
+and summaries weighted above matches in information.
+"""
+import math
+import re
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple, Union
+
+from flask import Flask, request
+from pymongo import MongoClient  # type: ignore
+
+from .catalog import CatalogMirror
+
+# (culture name, category, position), category is None for the name itself
+Key = Tuple[str, Optional[str], Optional[int]]
+
+WORD = re.compile(r"\w+")
+
+FIELD_WEIGHTS = {"name": 3.0, "summary": 2.0, "information": 1.0}
+
+SNIPPET_LENGTH = 160
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase words.
+
+    Arguments:
+      text: text to split
+
+    Returns:
+      words in order of appearance
+    """
+    return WORD.findall(text.lower())
+
+
+def culture_entries(culture: Dict[str, Any]) -> Iterator[Tuple[Key, Dict[str, str]]]:
+    """Searchable entries of a culture, its name and every insight.
+
+    Arguments:
+      culture: culture document
+
+    Yields:
+      (key, {field: text})
+    """
+    name = culture["name"]
+    yield (name, None, None), {"name": name}
+
+    categories = [("general", culture.get("general_insights") or [])]
+    specialized = culture.get("specialized_insights") or {}
+    if isinstance(specialized, dict):
+        categories.extend(specialized.items())
+
+    for category, insights in categories:
+        for position, insight in enumerate(insights):
+            yield (name, category, position), {
+                "summary": insight.get("summary", ""),
+                "information": insight.get("information", ""),
+            }
+
+
+def snippet(text: str, terms: Set[str]) -> Tuple[str, List[List[int]]]:
+    """Cut the part of `text` around the first matching word.
+
+    Arguments:
+      text: text to cut
+      terms: lowercase query words
+
+    Returns:
+      (snippet, [start, end] offsets of matching words within the snippet)
+    """
+    matches = [m for m in WORD.finditer(text) if m.group().lower() in terms]
+    start = 0
+    if matches and len(text) > SNIPPET_LENGTH:
+        lead = matches[0].start() - SNIPPET_LENGTH // 4
+        start = max(0, min(lead, len(text) - SNIPPET_LENGTH))
+    end = start + SNIPPET_LENGTH
+
+    highlights = [
+        [m.start() - start, m.end() - start]
+        for m in matches
+        if m.start() >= start and m.end() <= end
+    ]
+    return text[start:end], highlights
+
+
+class SearchIndex(CatalogMirror):
+    """Inverted index of the culture catalog."""
+
+    def __init__(self) -> None:
+        """Create an empty index, nothing is loaded until `refresh`."""
+        super().__init__()
+        # word -> key -> weighted term frequency
+        self.postings: Dict[str, Dict[Key, float]] = defaultdict(dict)
+        self.entries: Dict[Key, Dict[str, str]] = {}
+        self.cultures: Dict[str, List[Key]] = {}
+
+    def _remove(self, name: str) -> None:
+        """Drop a culture's entries from the index."""
+        for key in self.cultures.pop(name, []):
+            fields = self.entries.pop(key)
+            for word in {w for text in fields.values() for w in tokenize(text)}:
+                postings = self.postings[word]
+                postings.pop(key, None)
+                if not postings:
+                    del self.postings[word]
+
+    def _add(self, culture: Dict[str, Any]) -> None:
+        """Index a culture, replacing entries of an older copy."""
+        self._remove(culture["name"])
+
+        keys = []
+        for key, fields in culture_entries(culture):
+            keys.append(key)
+            self.entries[key] = fields
+            for field, text in fields.items():
+                for word in tokenize(text):
+                    postings = self.postings[word]
+                    postings[key] = postings.get(key, 0) + FIELD_WEIGHTS[field]
+        self.cultures[culture["name"]] = keys
+
+    def search(self, query: str, limit: int) -> List[Dict[str, Any]]:
+        """Rank entries matching any word of `query`.
+
+        Entries matching more of the query's words rank above entries
+        matching fewer of them.
+
+        Arguments:
+          query: search text
+          limit: maximum number of hits
+
+        Returns:
+          hits, best first
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            scores: Dict[Key, float] = defaultdict(float)
+            matched: Dict[Key, int] = defaultdict(int)
+            for term in terms:
+                postings = self.postings.get(term, {})
+                if not postings:
+                    continue
+                idf = math.log(1 + len(self.entries) / len(postings))
+                for key, frequency in postings.items():
+                    scores[key] += frequency * idf
+                    matched[key] += 1
+
+            ranked = sorted(
+                scores, key=lambda key: (-matched[key], -scores[key], key[0])
+            )[:limit]
+            found = [(key, self.entries[key], scores[key]) for key in ranked]
+
+        hits = []
+        for (name, category, position), fields, score in found:
+            text = next(
+                (
+                    fields[field]
+                    for field in ("information", "summary", "name")
+                    if terms & set(tokenize(fields.get(field, "")))
+                ),
+                "",
+            )
+            cut, highlights = snippet(text, terms)
+            hits.append(
+                {
+                    "name": name,
+                    "category": category,
+                    "position": position,
+                    "summary": fields.get("summary"),
+                    "snippet": cut,
+                    "highlights": highlights,
+                    "score": round(score, 4),
+                }
+            )
+        return hits
+
+
+def search_routes(app: Flask, db: MongoClient) -> None:
+    """Adds the search route to Flask App and keeps its index current.
+
+    Arguments:
+    app: Flask app
+
+    db: MongoDB client
+    """
+    index = app.extensions.setdefault("search_index", SearchIndex())
+    index.follow(app)
+
+    @app.route("/api/v1/search")
+    def search() -> Union[Dict[str, Any], Tuple[Dict[str, str], int]]:
+        """Search culture names and insight summaries and information.
+
+        Arguments:
+          q: search text
+
+          limit: (optional) maximum number of hits, defaults to 20
+
+        Returns:
+          200 - hits, best first, `category` and `position` are null for a
+            culture name, `highlights` are offsets of matches in `snippet`
+
+          {
+            "version": 42,
+            "hits": [
+              {
+                "name": "culture1",
+                "category": "general",
+                "position": 3,
+                "summary": "summary",
+                "snippet": "text around the match",
+                "highlights": [[12, 17]],
+                "score": 4.2
+              }
+            ]
+          }
+
+          400 - missing `q` or bad `limit`
+          500 - otherwise
+        """
+        query = request.args.get("q", "")
+        if not tokenize(query):
+            return {"msg": "missing search text `q`"}, 400
+
+        limit_arg = request.args.get("limit", "20")
+        if not limit_arg.isdigit() or not 0 < int(limit_arg) <= app.config.get(
+            "SEARCH_LIMIT_MAX", 100
+        ):
+            return {"msg": f"invalid limit `{limit_arg}`"}, 400
+
+        index.refresh_if_stale(db, app.config.get("SEARCH_REFRESH_INTERVAL", 5))
+        return {"version": index.version, "hits": index.search(query, int(limit_arg))}
@@ -0,0 +1,403 @@
+"""Module for recording slow MongoDB operations.
+
+`SlowOpRecorder` listens to the commands of every client `LazyDatabase`
+creates. A command of `SLOW_OPS_COMMANDS` taking longer than
+`SLOW_OPS_THRESHOLD_MS` (default 100) is recorded into the capped `slow_ops`
+collection by a background thread, so the request that ran it never waits on
+the recording:
+{
+  "at": 00000000.0,
+  "command": "find",
+  "collection": "cultures",
+  "duration_ms": 153.2,
+  "filter": "{\"name\": \"<str>\"}",
+  "sort": "{\"name\": 1}",
+  "projection": "{\"_id\": 0, \"name\": 1}",
+  "returned": 1,
+  "reply_bytes": 5120,
+  "explain": {
+    "stages": ["FETCH", "IXSCAN"],
+    "indexes": ["name_unique"],
+    "docs_examined": 1,
+    "keys_examined": 1
+  },
+  "flags": []
+}
+
+Filter values are replaced by their type unless `SLOW_OPS_REDACT` is off, admin
+emails must not end up in the log. Filter, sort, projection and pipeline are
+stored as extended JSON strings: their `$` operator keys can't be stored as
+document keys.
+
+`SLOW_OPS_EXPLAIN_SAMPLE_RATE` (default 0) of the recorded operations are run
+again with `explain`, and flagged against the index manifest `INDEXES`:
+  COLLSCAN - the collection was scanned
+  MISSING_INDEX - scanned, and no listed index leads with a filtered or sorted
+    field, one is needed
+  INDEX_NOT_USED:<name> - scanned, although the listed index could have served
+  UNLISTED_INDEX:<name> - an index missing from `INDEXES` was used, it won't
+    exist on a new deployment
+"""
+import logging
+import queue
+import random
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+import bson  # type: ignore
+from bson import json_util  # type: ignore
+from flask import Flask, request
+from flask_jwt_extended import jwt_required  # type: ignore
+from pymongo import DESCENDING, MongoClient, monitoring  # type: ignore
+
+from .indexes import INDEXES
+
+# Commands worth explaining, writes included (explain never applies them)
+SLOW_OPS_COMMANDS = (
+    "find",
+    "aggregate",
+    "count",
+    "distinct",
+    "findAndModify",
+    "update",
+    "delete",
+)
+
+# Command fields explain rejects or sets itself
+UNEXPLAINED_FIELDS = ("lsid", "txnNumber", "readConcern", "writeConcern")
+
+
+def redact(value: Any) -> Any:
+    """Replace the values of a filter by their type, keeping its shape.
+
+    Arguments:
+      value: filter, sort or pipeline
+
+    Returns:
+      {"name": "<str>", "modified": {"$gte": "<int>"}}
+    """
+    if isinstance(value, dict):
+        return {key: redact(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [redact(item) for item in value]
+    return f"<{type(value).__name__}>"
+
+
+def command_filter(command: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Filter of a command, wherever the command keeps it.
+
+    Arguments:
+      command: MongoDB command
+
+    Returns:
+      filter, None for commands without one
+    """
+    for field in ("filter", "query"):
+        if field in command:
+            return command[field]
+    for field in ("updates", "deletes"):
+        if command.get(field):
+            return command[field][0].get("q")
+    return None
+
+
+def plan_nodes(explain: Any, winning: bool = False) -> Iterator[Dict[str, Any]]:
+    """Stages of the winning plans of an explain result.
+
+    Arguments:
+      explain: explain result, or part of it
+      winning: whether `explain` is inside a winning plan
+
+    Yields:
+      plan stages, e.g. {"stage": "IXSCAN", "indexName": "name_unique", ...}
+    """
+    if isinstance(explain, list):
+        for item in explain:
+            yield from plan_nodes(item, winning)
+    elif isinstance(explain, dict):
+        if winning and "stage" in explain:
+            yield explain
+        for key, value in explain.items():
+            if key != "rejectedPlans":
+                yield from plan_nodes(value, winning or key == "winningPlan")
+
+
+def execution_totals(
+    explain: Any, totals: Optional[Dict[str, int]] = None
+) -> Dict[str, int]:
+    """Documents and keys examined according to an explain result.
+
+    Arguments:
+      explain: explain result with `executionStats`
+      totals: (optional) totals to add to
+
+    Returns:
+      {"docs_examined": 10, "keys_examined": 0}
+    """
+    totals = totals if totals is not None else {"docs_examined": 0, "keys_examined": 0}
+    if isinstance(explain, list):
+        for item in explain:
+            execution_totals(item, totals)
+    elif isinstance(explain, dict):
+        stats = explain.get("executionStats")
+        if isinstance(stats, dict):
+            totals["docs_examined"] += stats.get("totalDocsExamined", 0)
+            totals["keys_examined"] += stats.get("totalKeysExamined", 0)
+        for key, value in explain.items():
+            if key != "executionStats":
+                execution_totals(value, totals)
+    return totals
+
+
+def plan_flags(
+    collection: str, command: Dict[str, Any], stages: List[str], indexes: List[str]
+) -> List[str]:
+    """Compare the plan of a command with the index manifest.
+
+    Arguments:
+      collection: collection the command ran on
+      command: MongoDB command
+      stages: stages of the winning plan
+      indexes: indexes used by the winning plan
+
+    Returns:
+      flags, see the module docstring
+    """
+    listed = INDEXES.get(collection, [])
+    names = {options["name"] for _, options in listed}
+    flags = [f"UNLISTED_INDEX:{index}" for index in indexes if index not in names]
+
+    if "COLLSCAN" in stages:
+        flags.append("COLLSCAN")
+        fields = set(command_filter(command) or {}) | set(command.get("sort") or {})
+        usable = [options["name"] for keys, options in listed if keys[0][0] in fields]
+        flags.extend(f"INDEX_NOT_USED:{name}" for name in usable)
+        if fields - {"_id"} and not usable:
+            flags.append("MISSING_INDEX")
+    return flags
+
+
+class SlowOpRecorder(monitoring.CommandListener):
+    """Records slow commands into `slow_ops`, see the module docstring.
+
+    Recording and explaining happen in a thread of each process, started on
+    the first slow command. Commands are dropped while `max_pending` of them
+    wait to be recorded.
+    """
+
+    def __init__(
+        self,
+        db: MongoClient,
+        threshold_ms: float = 100,
+        explain_sample_rate: float = 0,
+        redact_values: bool = True,
+        max_pending: int = 1000,
+        logger: Optional[logging.Logger] = None,
+    ):
+        """Create the recorder, register it with `LazyDatabase.listeners`.
+
+        Arguments:
+          db: database the commands run on, `slow_ops` is written to it
+          threshold_ms: record commands taking longer
+          explain_sample_rate: share of recorded commands to explain, 0 to 1
+          redact_values: replace filter values by their type
+          max_pending: commands waiting to be recorded before dropping
+          logger: (optional) logs failures to record
+        """
+        self.db = db
+        self.threshold_ms = threshold_ms
+        self.explain_sample_rate = explain_sample_rate
+        self.redact_values = redact_values
+        self.logger = logger or logging.getLogger(__name__)
+        self.dropped = 0
+        self._commands: Dict[Tuple[Any, int], Dict[str, Any]] = {}
+        self._pending: "queue.Queue[Tuple[Dict[str, Any], Dict[str, Any]]]" = (
+            queue.Queue(max_pending)
+        )
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        """Remember the command until it finishes."""
+        if event.command_name not in SLOW_OPS_COMMANDS:
+            return
+        if event.command.get(event.command_name) == "slow_ops":
+            return
+        self._commands[(event.connection_id, event.request_id)] = event.command
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        """Queue the command if it was slow."""
+        command = self._commands.pop((event.connection_id, event.request_id), None)
+        if command is None or event.duration_micros < self.threshold_ms * 1000:
+            return
+
+        reply = event.reply
+        batch = reply.get("cursor", {}).get("firstBatch")
+        record = {
+            "at": time.time(),
+            "command": event.command_name,
+            "collection": command[event.command_name],
+            "duration_ms": event.duration_micros / 1000,
+            "returned": len(batch) if batch is not None else reply.get("n", 0),
+            "reply_bytes": len(bson.encode(reply)),
+        }
+        self.queue(record, command)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        """Forget the command."""
+        self._commands.pop((event.connection_id, event.request_id), None)
+
+    def queue(self, record: Dict[str, Any], command: Dict[str, Any]) -> None:
+        """Hand a slow command to the recording thread.
+
+        Arguments:
+          record: timings of the command
+          command: MongoDB command
+        """
+        self.start()
+        try:
+            self._pending.put_nowait((record, command))
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self) -> None:
+        """Start the recording thread of this process, if not running."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            # Threads don't survive a fork, the check above fails in a worker
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="slow-ops", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self) -> None:
+        """Record queued commands forever."""
+        while True:
+            record, command = self._pending.get()
+            try:
+                self.record(record, command)
+            except Exception:  # pylint: disable=broad-except
+                # Best effort, a failing explain must not stop the recording
+                self.logger.exception("failed to record slow %s", record["command"])
+
+    def describe(self, command: Dict[str, Any]) -> Dict[str, Any]:
+        """Filter, sort, projection and pipeline of a command.
+
+        Arguments:
+          command: MongoDB command
+
+        Returns:
+          the fields the command has as extended JSON, redacted unless
+          disabled
+        """
+        fields: Dict[str, Any] = {
+            "filter": command_filter(command),
+            "sort": command.get("sort"),
+            "projection": command.get("projection", command.get("fields")),
+            "pipeline": command.get("pipeline"),
+        }
+        if self.redact_values:
+            for field in ("filter", "pipeline"):
+                if fields[field] is not None:
+                    fields[field] = redact(fields[field])
+        return {
+            key: json_util.dumps(value)
+            for key, value in fields.items()
+            if value is not None
+        }
+
+    def explain(self, record: Dict[str, Any], command: Dict[str, Any]) -> None:
+        """Explain a command and flag its plan.
+
+        Arguments:
+          record: record of the command, `explain` and `flags` are set
+          command: MongoDB command
+        """
+        explained = {
+            key: value
+            for key, value in command.items()
+            if not key.startswith("$") and key not in UNEXPLAINED_FIELDS
+        }
+        result = self.db.command({"explain": explained, "verbosity": "executionStats"})
+
+        nodes = list(plan_nodes(result))
+        stages = [node["stage"] for node in nodes]
+        indexes = [node["indexName"] for node in nodes if "indexName" in node]
+        record["explain"] = {
+            "stages": stages,
+            "indexes": indexes,
+            **execution_totals(result),
+        }
+        record["flags"] = plan_flags(record["collection"], command, stages, indexes)
+
+    def record(self, record: Dict[str, Any], command: Dict[str, Any]) -> None:
+        """Describe, maybe explain, and store a slow command.
+
+        Arguments:
+          record: timings of the command
+          command: MongoDB command
+        """
+        record.update(self.describe(command))
+        if random.random() < self.explain_sample_rate:
+            self.explain(record, command)
+        self.db.slow_ops.insert_one(record)
+
+
+def slow_ops_routes(app: Flask, db: MongoClient) -> None:
+    """Adds the slow operation recorder and its route to Flask App.
+
+    Arguments:
+    app: Flask app
+
+    db: `LazyDatabase`, the recorder joins its listeners
+    """
+    recorder = SlowOpRecorder(
+        db,
+        app.config.get("SLOW_OPS_THRESHOLD_MS", 100),
+        app.config.get("SLOW_OPS_EXPLAIN_SAMPLE_RATE", 0),
+        app.config.get("SLOW_OPS_REDACT", True),
+        logger=app.logger,
+    )
+    db.listeners.append(recorder)
+    app.extensions["slow_ops"] = recorder
+
+    @app.route("/api/v1/db/slow-ops")
+    @jwt_required
+    def slow_ops() -> Tuple[Dict[str, Union[List[Dict[str, Any]], int, str]], int]:
+        """List the most recent slow operations, newest first.
+
+        Arguments:
+          collection: (optional) only operations on this collection
+
+          flagged: (optional) 1 for explained operations with flags only
+
+          limit: (optional) maximum number of operations, defaults to 50
+
+        Returns:
+          200 - slow operations, see `api.slow_ops`
+
+          {"dropped": 0, "slow_ops": [{"command": "find", ...}]}
+
+          400 - bad `limit`
+          401 - bad auth token
+          500 - otherwise
+        """
+        limit_arg = request.args.get("limit", "50")
+        if not limit_arg.isdigit() or not 0 < int(limit_arg) <= 1000:
+            return {"msg": f"invalid limit `{limit_arg}`"}, 400
+
+        query: Dict[str, Any] = {}
+        if "collection" in request.args:
+            query["collection"] = request.args["collection"]
+        if request.args.get("flagged") == "1":
+            query["flags.0"] = {"$exists": True}
+
+        cursor = (
+            db.slow_ops.find(query, {"_id": 0})
+            .sort("at", DESCENDING)
+            .limit(int(limit_arg))
+        )
+        return {"dropped": recorder.dropped, "slow_ops": list(cursor)}, 200
@@ -0,0 +1,211 @@
+"""Module for prefix and fuzzy lookup of culture names.
+
+Every worker keeps the culture names in memory, loaded on the first lookup and
+kept current as a `CatalogMirror`. Other workers' writes are picked up within
+`SUGGEST_REFRESH_INTERVAL` (default 5) seconds, lookups in between never touch
+MongoDB.
+
+Names are matched on a prefix of any of their words first, then by trigram
+similarity for misspellings.
+"""
+import bisect
+import re
+import unicodedata
+from collections import defaultdict
+from typing import Any, Dict, List, Set, Tuple, Union
+
+from flask import Flask, request
+from pymongo import MongoClient  # type: ignore
+
+from .catalog import CatalogMirror
+
+NON_ALPHANUMERIC = re.compile(r"[\W_]+")
+
+
+def normalize(text: str) -> str:
+    """Casefold, strip accents and collapse punctuation into single spaces.
+
+    Arguments:
+      text: text to normalize
+
+    Returns:
+      normalized text
+    """
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return NON_ALPHANUMERIC.sub(" ", stripped).strip()
+
+
+def trigrams(text: str) -> Set[str]:
+    """Trigrams of normalized text, padded so short words have some.
+
+    Arguments:
+      text: normalized text
+
+    Returns:
+      set of trigrams
+    """
+    padded = f"  {text} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class SuggestIndex(CatalogMirror):
+    """Prefix and trigram index of culture names."""
+
+    projection = {"name": 1}
+
+    def __init__(self) -> None:
+        """Create an empty index, nothing is loaded until `refresh`."""
+        super().__init__()
+        # Sorted (normalized name from the start of a word, name)
+        self.prefixes: List[Tuple[str, str]] = []
+        self.trigrams: Dict[str, Set[str]] = defaultdict(set)
+        self.names: Dict[str, Set[str]] = {}
+
+    @staticmethod
+    def _word_starts(normalized: str) -> List[str]:
+        """Suffixes of `normalized` starting at each word."""
+        return [
+            normalized[i:]
+            for i in range(len(normalized))
+            if i == 0 or normalized[i - 1] == " "
+        ]
+
+    def _remove(self, name: str) -> None:
+        """Drop a name from the index."""
+        grams = self.names.pop(name, None)
+        if grams is None:
+            return
+
+        for start in self._word_starts(normalize(name)):
+            i = bisect.bisect_left(self.prefixes, (start, name))
+            if i < len(self.prefixes) and self.prefixes[i] == (start, name):
+                del self.prefixes[i]
+
+        for gram in grams:
+            self.trigrams[gram].discard(name)
+            if not self.trigrams[gram]:
+                del self.trigrams[gram]
+
+    def _add(self, culture: Dict[str, Any]) -> None:
+        """Index a culture's name."""
+        name = culture["name"]
+        self._remove(name)
+
+        normalized = normalize(name)
+        for start in self._word_starts(normalized):
+            bisect.insort(self.prefixes, (start, name))
+
+        grams = trigrams(normalized)
+        for gram in grams:
+            self.trigrams[gram].add(name)
+        self.names[name] = grams
+
+    def suggest(
+        self, query: str, limit: int, min_similarity: float
+    ) -> List[Dict[str, Any]]:
+        """Find names starting with or resembling `query`.
+
+        Arguments:
+          query: partial or misspelled name
+          limit: maximum number of suggestions
+          min_similarity: minimum Dice coefficient (0-1) of the trigrams of
+            fuzzy matches
+
+        Returns:
+          prefix matches, shortest first, then fuzzy matches, most similar
+          first
+
+          [{"name": "culture1", "match": "prefix", "score": 1.0}, ...]
+        """
+        normalized = normalize(query)
+        if not normalized:
+            return []
+
+        with self._lock:
+            prefixed: Set[str] = set()
+            i = bisect.bisect_left(self.prefixes, (normalized, ""))
+            while i < len(self.prefixes) and self.prefixes[i][0].startswith(
+                normalized
+            ):
+                prefixed.add(self.prefixes[i][1])
+                i += 1
+
+            grams = trigrams(normalized)
+            shared: Dict[str, int] = defaultdict(int)
+            for gram in grams:
+                for name in self.trigrams.get(gram, ()):
+                    shared[name] += 1
+
+            similar = {
+                name: 2 * count / (len(grams) + len(self.names[name]))
+                for name, count in shared.items()
+                if name not in prefixed
+            }
+
+        suggestions = [
+            {"name": name, "match": "prefix", "score": 1.0}
+            for name in sorted(prefixed, key=lambda name: (len(name), name))
+        ]
+        suggestions.extend(
+            {"name": name, "match": "fuzzy", "score": round(score, 4)}
+            for name, score in sorted(
+                similar.items(), key=lambda item: (-item[1], item[0])
+            )
+            if score >= min_similarity
+        )
+        return suggestions[:limit]
+
+
+def suggest_routes(app: Flask, db: MongoClient) -> None:
+    """Adds the suggest route to Flask App and keeps its index current.
+
+    Arguments:
+    app: Flask app
+
+    db: MongoDB client
+    """
+    index = app.extensions.setdefault("suggest_index", SuggestIndex())
+    index.follow(app)
+
+    @app.route("/api/v1/cultures/suggest")
+    def suggest() -> Union[Dict[str, Any], Tuple[Dict[str, str], int]]:
+        """Suggest culture names for a partial or misspelled name.
+
+        Matching ignores case, accents and punctuation.
+
+        Arguments:
+          q: partial or misspelled name
+
+          limit: (optional) maximum number of suggestions, defaults to 10
+
+        Returns:
+          200 - suggestions, names starting with `q` (or with a word starting
+            with `q`) first
+
+          {
+            "suggestions": [
+              {"name": "culture1", "match": "prefix", "score": 1.0},
+              {"name": "culture2", "match": "fuzzy", "score": 0.42}
+            ]
+          }
+
+          400 - missing `q` or bad `limit`
+          500 - otherwise
+        """
+        query = request.args.get("q", "")
+        if not normalize(query):
+            return {"msg": "missing name `q`"}, 400
+
+        limit_arg = request.args.get("limit", "10")
+        if not limit_arg.isdigit() or not 0 < int(limit_arg) <= 50:
+            return {"msg": f"invalid limit `{limit_arg}`"}, 400
+
+        index.refresh_if_stale(db, app.config.get("SUGGEST_REFRESH_INTERVAL", 5))
+        return {
+            "suggestions": index.suggest(
+                query,
+                int(limit_arg),
+                app.config.get("SUGGEST_MIN_SIMILARITY", 0.3),
+            )
+        }
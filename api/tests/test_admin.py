@@ -1,3 +1,6 @@
+from flask_jwt_extended import decode_token  # type: ignore
+
+
 def test_list_admins(client):
     res = client.get("/api/v1/admins")
     print(res)
@@ -213,6 +216,15 @@ def test_update_admin(client):
     ]
 
 
+def test_update_admin_invalid_no_admin(client):
+    res = client.put(
+        "/api/v1/admins/tester@gmail.com",
+        json={"name": "tester", "email": "tester@gmail.com"},
+    )
+    assert res.get_json()["msg"] == "unknown admin `tester@gmail.com`"
+    assert res.status_code == 404
+
+
 def test_update_admin_invalid_400(client):
     res = client.post(
         "/api/v1/register",
@@ -259,3 +271,192 @@ def test_update_admin_invalid_password_and_confirm_dont_match(client):
     )
 
     assert res.status_code == 401
+
+
+def test_update_admin_duplicate_email_409(client):
+    res = client.post(
+        "/api/v1/register",
+        json={
+            "name": "tester",
+            "email": "tester@gmail.com",
+            "password": "password",
+            "password_confirmation": "password",
+        },
+    )
+
+    res = client.put(
+        "/api/v1/admins/tester@gmail.com",
+        json={"name": "tester", "email": "admin@gmail.com"},
+    )
+
+    assert res.status_code == 409
+    assert client.get("/api/v1/admins/tester@gmail.com").status_code == 200
+
+
+def test_update_admin_email(client):
+    client.post(
+        "/api/v1/register",
+        json={
+            "name": "tester",
+            "email": "tester@gmail.com",
+            "password": "password",
+            "password_confirmation": "password",
+        },
+    )
+    res = client.post(
+        "/api/v1/login", json={"email": "tester@gmail.com", "password": "password"}
+    )
+    refresh_token = res.get_json()["refresh_token"]
+
+    res = client.put(
+        "/api/v1/admins/tester@gmail.com",
+        json={"name": "tester", "email": "renamed@gmail.com"},
+    )
+    assert res.status_code == 200
+
+    res = client.post(
+        "/api/v1/login", json={"email": "renamed@gmail.com", "password": "password"}
+    )
+    assert res.status_code == 200
+
+    # sessions of the old email are revoked
+    res = client.post(
+        "/api/v1/token/refresh", headers={"Authorization": "Bearer " + refresh_token}
+    )
+    assert res.status_code == 401
+
+
+def test_login_throttled_by_email(client, app):
+    app.config.update(LOGIN_EMAIL_CAPACITY=2)
+    for _ in range(2):
+        res = client.post(
+            "/api/v1/login",
+            json={"email": "admin@gmail.com", "password": "not-the-password"},
+        )
+        assert res.status_code == 401
+
+    res = client.post(
+        "/api/v1/login", json={"email": "admin@gmail.com", "password": "password"}
+    )
+    assert res.status_code == 429
+    assert int(res.headers["Retry-After"]) > 0
+
+    # other emails are still allowed
+    res = client.post(
+        "/api/v1/login", json={"email": "other@gmail.com", "password": "password"}
+    )
+    assert res.status_code == 401
+
+
+def test_login_throttled_by_ip(client, app):
+    app.config.update(LOGIN_IP_CAPACITY=1)
+    res = client.post(
+        "/api/v1/login", json={"email": "other@gmail.com", "password": "password"}
+    )
+    assert res.status_code == 401
+
+    res = client.post(
+        "/api/v1/login", json={"email": "other@gmail.com", "password": "password"}
+    )
+    assert res.status_code == 429
+
+    res = client.post(
+        "/api/v1/login",
+        json={"email": "other@gmail.com", "password": "password"},
+        headers={"X-Real-IP": "10.0.0.2"},
+    )
+    assert res.status_code == 401
+
+
+def test_login_throttle_stats(client, app):
+    app.config.update(LOGIN_EMAIL_CAPACITY=1)
+    for _ in range(2):
+        client.post(
+            "/api/v1/login", json={"email": "admin@gmail.com", "password": "password"}
+        )
+
+    res = client.get("/api/v1/login/throttle")
+    assert res.status_code == 200
+    # the client fixture logs in once
+    assert res.get_json() == {"allowed": 2, "rejected_email": 1, "buckets": 2}
+
+
+def login_tokens(client):
+    res = client.post(
+        "/api/v1/login", json={"email": "admin@gmail.com", "password": "password"}
+    )
+    return res.get_json()
+
+
+def test_login_token_expiry(client, app):
+    tokens = login_tokens(client)
+
+    with app.app_context():
+        access = decode_token(tokens["token"])
+        refresh = decode_token(tokens["refresh_token"])
+
+    assert access["exp"] - access["iat"] == 24 * 60 * 60
+    assert refresh["exp"] - refresh["iat"] == 30 * 24 * 60 * 60
+
+
+def test_token_refresh(client):
+    tokens = login_tokens(client)
+    assert tokens["refresh_token"] is not None
+
+    res = client.post(
+        "/api/v1/token/refresh",
+        headers={"Authorization": "Bearer " + tokens["refresh_token"]},
+    )
+    assert res.status_code == 200
+    refreshed = res.get_json()
+    assert refreshed["refresh_token"] != tokens["refresh_token"]
+
+    res = client.get(
+        "/api/v1/admins", headers={"Authorization": "Bearer " + refreshed["token"]}
+    )
+    assert res.status_code == 200
+
+
+def test_token_refresh_reused(client):
+    tokens = login_tokens(client)
+    headers = {"Authorization": "Bearer " + tokens["refresh_token"]}
+
+    refreshed = client.post("/api/v1/token/refresh", headers=headers).get_json()
+
+    res = client.post("/api/v1/token/refresh", headers=headers)
+    assert res.status_code == 401
+
+    # reuse revokes every refresh token of the admin
+    res = client.post(
+        "/api/v1/token/refresh",
+        headers={"Authorization": "Bearer " + refreshed["refresh_token"]},
+    )
+    assert res.status_code == 401
+
+
+def test_token_refresh_access_token_422(client):
+    res = client.post("/api/v1/token/refresh")
+    assert res.status_code == 422
+
+
+def test_token_refresh_revoked_on_delete(client):
+    client.post(
+        "/api/v1/register",
+        json={
+            "name": "tester",
+            "email": "tester@gmail.com",
+            "password": "password",
+            "password_confirmation": "password",
+        },
+    )
+    res = client.post(
+        "/api/v1/login", json={"email": "tester@gmail.com", "password": "password"}
+    )
+    refresh_token = res.get_json()["refresh_token"]
+
+    client.delete("/api/v1/admins/tester@gmail.com")
+
+    res = client.post(
+        "/api/v1/token/refresh", headers={"Authorization": "Bearer " + refresh_token}
+    )
+    assert res.status_code == 401
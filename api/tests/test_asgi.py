@@ -0,0 +1,154 @@
+import asyncio
+import json
+
+from flask_cors import CORS  # type: ignore
+from flask_cors.core import get_cors_options  # type: ignore
+
+from api.asgi import AsyncCultureReads, etag_matches
+from api.metrics import HTTP_REQUESTS
+
+
+class AsyncCursor:
+    """Motor-like cursor over a mongomock cursor."""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def __getattr__(self, name):
+        return lambda *args: AsyncCursor(getattr(self.cursor, name)(*args))
+
+    def __aiter__(self):
+        return self.iterate()
+
+    async def iterate(self):
+        for document in self.cursor:
+            yield document
+
+
+class AsyncCollection:
+    """Motor-like collection over a mongomock collection."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def find_one(self, *args):
+        return self.collection.find_one(*args)
+
+    def find(self, *args):
+        return AsyncCursor(self.collection.find(*args))
+
+
+class AsyncDatabase:
+    """Motor-like database over a mongomock database."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __getattr__(self, name):
+        return AsyncCollection(self.db[name])
+
+
+def request(asgi_app, path, query=b"", headers=()):
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "query_string": query,
+        "headers": [(key.encode(), value.encode()) for key, value in headers],
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(asgi_app(scope, receive, send))
+    start, body = messages
+    return start["status"], dict(start["headers"]), body["body"]
+
+
+def asgi(app, db, fallbacks):
+    async def fallback(scope, receive, send):
+        fallbacks.append(scope["path"])
+        await send({"type": "http.response.start", "status": 418, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    return AsyncCultureReads(app, fallback, lambda: AsyncDatabase(db))
+
+
+def test_asgi_culture(app, client, db):
+    client.post("/api/v1/cultures", json={"name": "test",},)
+    flask_response = client.get("/api/v1/cultures/test")
+    fallbacks = []
+    asgi_app = asgi(app, db, fallbacks)
+
+    status, headers, body = request(asgi_app, "/api/v1/cultures/test")
+    assert status == 200
+    assert body == flask_response.data
+    assert headers[b"etag"].decode() == flask_response.headers["ETag"]
+
+    status, _, body = request(
+        asgi_app,
+        "/api/v1/cultures/test",
+        headers=[("If-None-Match", flask_response.headers["ETag"])],
+    )
+    assert status == 304
+    assert body == b""
+
+    status, _, _ = request(asgi_app, "/api/v1/cultures/unknown")
+    assert status == 404
+    assert fallbacks == []
+
+
+def test_asgi_cultures(app, client, db):
+    for name in ("a", "b", "c"):
+        client.post("/api/v1/cultures", json={"name": name},)
+    flask_response = client.get("/api/v1/cultures?limit=2")
+    asgi_app = asgi(app, db, [])
+
+    status, headers, body = request(asgi_app, "/api/v1/cultures", b"limit=2")
+    assert status == 200
+    assert headers[b"etag"].decode() == flask_response.headers["ETag"]
+    assert json.loads(body) == flask_response.get_json()
+
+    status, _, _ = request(asgi_app, "/api/v1/cultures", b"limit=x")
+    assert status == 400
+
+
+def test_asgi_cors_and_metrics(app, client, db):
+    CORS(app)
+    client.post("/api/v1/cultures", json={"name": "test"})
+    asgi_app = AsyncCultureReads(
+        app, None, lambda: AsyncDatabase(db), cors=get_cors_options(app)
+    )
+
+    for origin in ({"Origin": "https://example.com"}, {}):
+        flask_response = client.get("/api/v1/cultures/test", headers=origin)
+        _, headers, _ = request(
+            asgi_app, "/api/v1/cultures/test", headers=origin.items()
+        )
+        assert (
+            headers[b"access-control-allow-origin"].decode()
+            == flask_response.headers["Access-Control-Allow-Origin"]
+        )
+
+    served = HTTP_REQUESTS.values.get(("cultures", "GET", "200"), 0)
+    request(asgi_app, "/api/v1/cultures")
+    assert HTTP_REQUESTS.values[("cultures", "GET", "200")] == served + 1
+
+
+def test_asgi_fallback(app, db):
+    fallbacks = []
+    asgi_app = asgi(app, db, fallbacks)
+
+    request(asgi_app, "/api/v1/cultures/version")
+    request(asgi_app, "/api/v1/bundle")
+    assert fallbacks == ["/api/v1/cultures/version", "/api/v1/bundle"]
+
+
+def test_etag_matches():
+    assert etag_matches('"a", W/"b"', "b")
+    assert etag_matches("*", "a")
+    assert not etag_matches('"a"', "b")
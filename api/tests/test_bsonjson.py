@@ -0,0 +1,70 @@
+import json
+from datetime import datetime
+
+import bson  # type: ignore
+import pytest
+from bson import ObjectId  # type: ignore
+from bson.decimal128 import Decimal128  # type: ignore
+from bson.regex import Regex  # type: ignore
+
+from api.bsonjson import transcode
+from api.encoding import stdlib_dumps
+
+
+def transcoded(document, chunk_size=64 * 1024):
+    return b"".join(transcode(bson.encode(document), chunk_size))
+
+
+def test_transcode_culture():
+    insight = {
+        "summary": "summary",
+        "information": 'ünïcödé "quoted"\n',
+        "source": {"data": "www.example.com", "type": "link"},
+    }
+    culture = {
+        "_id": ObjectId(),
+        "name": "test",
+        "modified": 1600000000,
+        "general_insights": [insight] * 3,
+        "specialized_insights": {"Doctors": [insight], "Nurses": []},
+    }
+
+    assert json.loads(transcoded(culture)) == json.loads(stdlib_dumps(culture))
+
+
+def test_transcode_scalars():
+    document = {
+        "double": 1.5,
+        "int64": 2 ** 40,
+        "bool": False,
+        "null": None,
+        "date": datetime(2020, 1, 2, 3, 4, 5),
+        "decimal": Decimal128("1.10"),
+        "binary": b"\x00\x01",
+        "nan": float("nan"),
+    }
+
+    assert json.loads(transcoded(document)) == {
+        "double": 1.5,
+        "int64": 2 ** 40,
+        "bool": False,
+        "null": None,
+        "date": "2020-01-02 03:04:05",
+        "decimal": "1.10",
+        "binary": "AAE=",
+        "nan": None,
+    }
+
+
+def test_transcode_chunks():
+    document = {"insights": [{"information": "x" * 100}] * 100}
+
+    chunks = list(transcode(bson.encode(document), chunk_size=1024))
+    assert len(chunks) > 1
+    assert all(len(chunk) < 2048 for chunk in chunks)
+    assert json.loads(b"".join(chunks)) == document
+
+
+def test_transcode_unsupported():
+    with pytest.raises(ValueError):
+        transcoded({"regex": Regex("^a")})
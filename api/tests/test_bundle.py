@@ -0,0 +1,141 @@
+import gzip
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from api.bundle import build_bundle, current_bundle
+
+
+def test_bundle(client):
+    client.post("/api/v1/cultures", json={"name": "b"})
+    client.post("/api/v1/cultures", json={"name": "a"})
+
+    response = client.get("/api/v1/bundle")
+    assert response.status_code == 200
+    assert response.mimetype == "application/gzip"
+
+    bundle = json.loads(gzip.decompress(response.data))
+    assert bundle["version"] == 2
+    assert [culture["name"] for culture in bundle["cultures"]] == ["a", "b"]
+    response.close()
+
+
+def test_bundle_not_modified(client):
+    client.post("/api/v1/cultures", json={"name": "test"})
+
+    response = client.get("/api/v1/bundle")
+    etag = response.headers["ETag"]
+    response.close()
+
+    cached = client.get("/api/v1/bundle", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+
+    client.delete("/api/v1/cultures/test")
+
+    response = client.get("/api/v1/bundle", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert json.loads(gzip.decompress(response.data))["cultures"] == []
+    response.close()
+
+
+def test_bundle_empty_catalog(client):
+    response = client.get("/api/v1/bundle")
+    assert response.status_code == 200
+    assert json.loads(gzip.decompress(response.data)) == {
+        "version": 0,
+        "modified": 0,
+        "cultures": [],
+    }
+    response.close()
+
+
+def test_bundle_pruned(app, client, tmp_path):
+    app.config["BUNDLE_REBUILD_DELAY"] = 60
+    for name in ["a", "b", "c", "d", "e"]:
+        client.post("/api/v1/cultures", json={"name": name})
+        client.get("/api/v1/bundle").close()
+
+    bundles = sorted(path.name for path in (tmp_path / "bundles").iterdir())
+    assert len(bundles) == 3
+    assert bundles[-1].startswith("bundle-5-")
+
+
+def test_bundle_rebuilt_in_background(app, client, tmp_path):
+    app.config["BUNDLE_REBUILD_DELAY"] = 0.5
+    for name in ["a", "b", "c"]:
+        client.post("/api/v1/cultures", json={"name": name})
+
+    # Built without a request, once for the whole burst of writes
+    for _ in range(100):
+        bundles = [path.name for path in (tmp_path / "bundles").glob("*.json.gz")]
+        if bundles:
+            break
+        time.sleep(0.05)
+    assert len(bundles) == 1
+    assert bundles[0].startswith("bundle-3-")
+
+
+def test_bundle_concurrent(app, client):
+    # gthread workers serve requests of one process from several threads
+    headers = {"Authorization": client.environ_base["HTTP_AUTHORIZATION"]}
+
+    def write_and_read(name):
+        thread_client = app.test_client()
+        created = thread_client.post(
+            "/api/v1/cultures", json={"name": name}, headers=headers
+        )
+        culture = thread_client.get(f"/api/v1/cultures/{name}")
+        bundle = thread_client.get("/api/v1/bundle")
+        statuses = created.status_code, culture.status_code, bundle.status_code
+        json.loads(gzip.decompress(bundle.data))
+        bundle.close()
+        return statuses
+
+    names = [f"culture{i}" for i in range(16)]
+    with ThreadPoolExecutor(8) as executor:
+        assert set(executor.map(write_and_read, names)) == {(201, 200, 200)}
+
+    response = client.get("/api/v1/bundle")
+    bundle = json.loads(gzip.decompress(response.data))
+    assert [culture["name"] for culture in bundle["cultures"]] == sorted(names)
+    response.close()
+
+    bundles = os.listdir(app.config["BUNDLE_DIR"])
+    assert not [name for name in bundles if name.endswith(".tmp")]
+
+
+def test_bundle_waits_for_claimed_build(app, client, db, tmp_path):
+    app.config["BUNDLE_REBUILD_DELAY"] = 60
+    client.post("/api/v1/cultures", json={"name": "a"})
+    directory = tmp_path / "bundles"
+    directory.mkdir(exist_ok=True)
+    claim = directory / "bundle-1.building"
+    claim.touch()
+
+    # Another worker claimed version 1, its bundle is used once it's written
+    with ThreadPoolExecutor(1) as executor:
+        waiting = executor.submit(current_bundle, app, db)
+        time.sleep(0.2)
+        assert not waiting.done()
+
+        built = directory / "bundle-1-0123456789abcdef.json.gz"
+        built.write_bytes(gzip.compress(b"{}"))
+        claim.unlink()
+        assert waiting.result(timeout=5) == str(built)
+
+    assert sorted(path.name for path in directory.iterdir()) == [built.name]
+
+
+def test_bundle_stale_claim(app, client, db, tmp_path):
+    app.config["BUNDLE_REBUILD_DELAY"] = 60
+    app.config["BUNDLE_BUILD_TIMEOUT"] = 0
+    client.post("/api/v1/cultures", json={"name": "a"})
+    directory = tmp_path / "bundles"
+    directory.mkdir(exist_ok=True)
+    (directory / "bundle-1.building").touch()
+    time.sleep(0.01)
+
+    path = build_bundle(app, db)
+    assert os.path.basename(path).startswith("bundle-1-")
+    assert [path.name for path in directory.iterdir()] == [os.path.basename(path)]
@@ -1,3 +1,6 @@
+from api.catalog import CHANGES_WINDOW
+
+
 def test_list_cultures_empty(client):
     response = client.get("/api/v1/cultures")
     assert response.get_json() == {"cultures": []}
@@ -27,6 +30,20 @@ def test_create_culture_invalid_400(client):
     assert response.status_code == 400
 
 
+def test_create_culture_reserved_name_400(client):
+    for name in ["version", "changes", "suggest"]:
+        response = client.post("/api/v1/cultures", json={"name": name})
+        assert response.status_code == 400
+        assert f"`{name}` is reserved" in response.get_json()["msg"]
+
+    client.post("/api/v1/cultures", json={"name": "test"})
+    response = client.put(
+        "/api/v1/cultures/test",
+        json={"name": "suggest", "general_insights": [], "specialized_insights": {}},
+    )
+    assert response.status_code == 400
+
+
 def test_create_culture_duplicate(client):
     response = client.post("/api/v1/cultures", json={"name": "test",},)
 
@@ -127,3 +144,191 @@ def test_update_culture_create(client):
     )
 
     assert update_response.status_code == 201
+
+
+def test_get_culture_etag(client):
+    client.post("/api/v1/cultures", json={"name": "test",},)
+
+    response = client.get("/api/v1/cultures/test")
+    assert response.status_code == 200
+    assert response.headers["ETag"] is not None
+    assert response.headers["Last-Modified"] is not None
+    assert "must-revalidate" in response.headers["Cache-Control"]
+
+    cached = client.get(
+        "/api/v1/cultures/test", headers={"If-None-Match": response.headers["ETag"]}
+    )
+    assert cached.status_code == 304
+    assert cached.data == b""
+    assert cached.headers["ETag"] == response.headers["ETag"]
+
+    cached = client.get(
+        "/api/v1/cultures/test",
+        headers={"If-Modified-Since": response.headers["Last-Modified"]},
+    )
+    assert cached.status_code == 304
+
+
+def test_get_culture_etag_changes_on_update(client):
+    client.post("/api/v1/cultures", json={"name": "test",},)
+    etag = client.get("/api/v1/cultures/test").headers["ETag"]
+
+    client.put(
+        "/api/v1/cultures/test",
+        json={"name": "test", "general_insights": [], "specialized_insights": {}},
+    )
+
+    response = client.get("/api/v1/cultures/test", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert "digest" not in response.get_json()
+
+
+def test_list_cultures_etag(client):
+    client.post("/api/v1/cultures", json={"name": "test",},)
+
+    response = client.get("/api/v1/cultures")
+    etag = response.headers["ETag"]
+
+    cached = client.get("/api/v1/cultures", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+
+    client.delete("/api/v1/cultures/test")
+
+    response = client.get("/api/v1/cultures", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.get_json() == {"cultures": []}
+
+
+def test_list_cultures_paginated(client):
+    for name in ["c", "a", "d", "b"]:
+        client.post("/api/v1/cultures", json={"name": name})
+
+    page = client.get("/api/v1/cultures?limit=2").get_json()
+    assert [culture["name"] for culture in page["cultures"]] == ["a", "b"]
+    assert page["next"] == "b"
+
+    page = client.get(f"/api/v1/cultures?after={page['next']}&limit=2").get_json()
+    assert [culture["name"] for culture in page["cultures"]] == ["c", "d"]
+
+    page = client.get("/api/v1/cultures?after=d&limit=2").get_json()
+    assert page == {"cultures": []}
+
+
+def test_list_cultures_invalid_limit_400(client):
+    assert client.get("/api/v1/cultures?limit=-1").status_code == 400
+    assert client.get("/api/v1/cultures?limit=ten").status_code == 400
+    assert client.get("/api/v1/cultures?limit=100000").status_code == 400
+
+
+def test_update_culture_rename_duplicate(client):
+    client.post("/api/v1/cultures", json={"name": "test"})
+    client.post("/api/v1/cultures", json={"name": "other"})
+
+    response = client.put(
+        "/api/v1/cultures/other",
+        json={"name": "test", "general_insights": [], "specialized_insights": {}},
+    )
+    assert response.status_code == 409
+
+
+def test_cultures_version(client):
+    assert client.get("/api/v1/cultures/version").get_json() == {
+        "version": 0,
+        "modified": 0,
+    }
+
+    created = client.post("/api/v1/cultures", json={"name": "test"}).get_json()
+    client.delete("/api/v1/cultures/test")
+
+    version = client.get("/api/v1/cultures/version").get_json()
+    assert version["version"] == 2
+    assert version["modified"] >= created["modified"]
+
+
+def test_cultures_changes(client):
+    client.post("/api/v1/cultures", json={"name": "kept"})
+    client.post("/api/v1/cultures", json={"name": "deleted"})
+    client.delete("/api/v1/cultures/deleted")
+
+    changes = client.get("/api/v1/cultures/changes?since=0").get_json()
+    assert changes["version"] == 3
+    assert [culture["name"] for culture in changes["cultures"]] == ["kept"]
+    assert [tombstone["name"] for tombstone in changes["deleted"]] == ["deleted"]
+
+    # Writes landing late with an older stamp are sent again
+    since = changes["modified"] + 1
+    changes = client.get(f"/api/v1/cultures/changes?since={since}").get_json()
+    assert [culture["name"] for culture in changes["cultures"]] == ["kept"]
+
+    since += CHANGES_WINDOW
+    changes = client.get(f"/api/v1/cultures/changes?since={since}").get_json()
+    assert changes["cultures"] == []
+    assert changes["deleted"] == []
+
+
+def test_cultures_changes_recreated(client):
+    client.post("/api/v1/cultures", json={"name": "test"})
+    client.delete("/api/v1/cultures/test")
+    client.post("/api/v1/cultures", json={"name": "test"})
+
+    changes = client.get("/api/v1/cultures/changes?since=0").get_json()
+    assert [culture["name"] for culture in changes["cultures"]] == ["test"]
+    assert changes["deleted"] == []
+
+
+def test_cultures_changes_renamed(client):
+    client.post("/api/v1/cultures", json={"name": "test"})
+    client.put(
+        "/api/v1/cultures/test",
+        json={"name": "renamed", "general_insights": [], "specialized_insights": {}},
+    )
+
+    changes = client.get("/api/v1/cultures/changes?since=0").get_json()
+    assert [culture["name"] for culture in changes["cultures"]] == ["renamed"]
+    assert [tombstone["name"] for tombstone in changes["deleted"]] == ["test"]
+
+
+def test_cultures_changes_invalid_400(client):
+    assert client.get("/api/v1/cultures/changes").status_code == 400
+    assert client.get("/api/v1/cultures/changes?since=yesterday").status_code == 400
+
+
+def test_update_culture_invalid_insight_400(client):
+    client.post("/api/v1/cultures", json={"name": "test"})
+    response = client.put(
+        "/api/v1/cultures/test",
+        json={
+            "name": "test",
+            "general_insights": [{"summary": "summary", "source": {}}],
+            "specialized_insights": {"type": [{"summary": 1}]},
+        },
+    )
+
+    assert response.status_code == 400
+    assert "Missing data for required field." in response.get_json()["msg"]
+
+
+def test_update_culture_too_many_insights_400(client):
+    insight = {"summary": "summary", "information": "text", "source": {}}
+    response = client.put(
+        "/api/v1/cultures/test",
+        json={
+            "name": "test",
+            "general_insights": [insight] * 501,
+            "specialized_insights": {},
+        },
+    )
+
+    assert response.status_code == 400
+    assert "More than 500 insights." in response.get_json()["msg"]
+
+
+def test_update_culture_too_large_413(client):
+    response = client.put(
+        "/api/v1/cultures/test",
+        data="x" * (2 * 1024 * 1024 + 1),
+        content_type="application/json",
+    )
+
+    assert response.status_code == 413
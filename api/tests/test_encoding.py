@@ -0,0 +1,65 @@
+import json
+
+import pytest
+from bson import ObjectId  # type: ignore
+
+from api import create_app
+from api.encoding import PROVIDERS, EncodedCache
+
+
+@pytest.mark.parametrize("provider", sorted(PROVIDERS))
+def test_providers(provider):
+    document = {"_id": ObjectId("5f9b0c2e1c9d440000a1b2c3"), "name": "ünï", "n": 1}
+
+    assert json.loads(PROVIDERS[provider](document)) == {
+        "_id": "5f9b0c2e1c9d440000a1b2c3",
+        "name": "ünï",
+        "n": 1,
+    }
+
+
+@pytest.mark.parametrize("provider", sorted(PROVIDERS))
+def test_app_provider(provider):
+    app = create_app(provider)
+
+    response = app.test_client().get("/health")
+    assert response.content_type == "application/json"
+    assert response.get_json() == {"msg": "healthy"}
+
+
+def test_unknown_provider():
+    with pytest.raises(RuntimeError):
+        create_app("yaml")
+
+
+def test_encoded_cache():
+    cache = EncodedCache(10)
+    cache.put("a", b"1234")
+    cache.put("b", b"1234")
+    assert cache.get("a") == b"1234"
+
+    cache.put("c", b"1234")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1234"
+    assert cache.size == 8
+
+    cache.put("d", b"12345678901")
+    assert cache.get("d") is None
+
+
+def test_culture_cache(app, client):
+    client.post("/api/v1/cultures", json={"name": "test",},)
+
+    first = client.get("/api/v1/cultures/test")
+    assert app.extensions["culture_cache"].size == len(first.data)
+
+    second = client.get("/api/v1/cultures/test")
+    assert second.data == first.data
+    assert second.headers["ETag"] == first.headers["ETag"]
+
+    client.put(
+        "/api/v1/cultures/test",
+        json={"name": "test", "general_insights": [], "specialized_insights": {}},
+    )
+    third = client.get("/api/v1/cultures/test")
+    assert third.get_json()["specialized_insights"] == {}
@@ -0,0 +1,81 @@
+from api.mailer.digest import acquire, flush_feedback
+
+
+def test_feedback(client, db):
+    res = client.post("/api/v1/feedback", json={"feedback": "great app"})
+    assert res.status_code == 200
+    assert db.feedback.find_one()["feedback"] == "great app"
+    assert db.outbox.count_documents({}) == 0
+
+
+def test_feedback_invalid_400(client):
+    res = client.post("/api/v1/feedback", json={"feedbacks": "great app"})
+    assert res.status_code == 400
+
+
+def test_feedback_digest(client, db, app):
+    app.config.update(MAIL_USERNAME="app@gmail.com", FEEDBACK_DIGEST_SIZE=2)
+    for i in range(5):
+        client.post("/api/v1/feedback", json={"feedback": f"feedback {i}"})
+
+    assert flush_feedback(app, db) == 3
+    digests = list(db.outbox.find())
+    assert [digest["subject"] for digest in digests] == [
+        "Feedback (2)",
+        "Feedback (2)",
+        "Feedback (1)",
+    ]
+    assert "feedback 0" in digests[0]["body"]
+    assert "feedback 4" in digests[2]["body"]
+
+    assert flush_feedback(app, db) == 0
+
+
+def test_feedback_digest_without_mail(client, db, app, caplog):
+    app.config.update(MAIL_USERNAME=None)
+    client.post("/api/v1/feedback", json={"feedback": "great app"})
+
+    assert flush_feedback(app, db) == 0
+    assert "$MAIL_USERNAME not configured" in caplog.text
+    assert db.feedback.count_documents({"digested": False}) == 1
+
+    app.config.update(MAIL_USERNAME="app@gmail.com")
+    assert flush_feedback(app, db) == 1
+
+
+def test_feedback_digest_locked(client, db, app):
+    app.config.update(MAIL_USERNAME="app@gmail.com")
+    client.post("/api/v1/feedback", json={"feedback": "great app"})
+
+    assert acquire(db, 60) is not None
+    assert flush_feedback(app, db) == 0
+
+
+def test_list_feedback(client):
+    for i in range(3):
+        client.post("/api/v1/feedback", json={"feedback": f"feedback {i}"})
+
+    page = client.get("/api/v1/feedback?limit=2").get_json()
+    assert [entry["feedback"] for entry in page["feedback"]] == [
+        "feedback 2",
+        "feedback 1",
+    ]
+
+    page = client.get(f"/api/v1/feedback?limit=2&before={page['next']}").get_json()
+    assert [entry["feedback"] for entry in page["feedback"]] == ["feedback 0"]
+    assert "next" not in page
+
+
+def test_list_feedback_unauthorized(client):
+    del client.environ_base["HTTP_AUTHORIZATION"]
+    assert client.get("/api/v1/feedback").status_code == 401
+
+
+def test_list_feedback_invalid_400(client):
+    assert client.get("/api/v1/feedback?before=nope").status_code == 400
+    assert client.get("/api/v1/feedback?limit=0").status_code == 400
+
+
+def test_feedback_too_long_400(client):
+    res = client.post("/api/v1/feedback", json={"feedback": "x" * 301})
+    assert res.status_code == 400
@@ -0,0 +1,223 @@
+INSIGHT = {
+    "summary": "summary",
+    "information": "text",
+    "source": {"data": "www.example.com", "type": "link"},
+}
+
+
+def insight(summary):
+    return {**INSIGHT, "summary": summary}
+
+
+def test_create_insight(client):
+    client.post("/api/v1/cultures", json={"name": "test",},)
+    etag = client.get("/api/v1/cultures/test").headers["ETag"]
+
+    response = client.post(
+        "/api/v1/cultures/test/insights/general", json=insight("a")
+    )
+    assert response.status_code == 201
+
+    response = client.post(
+        "/api/v1/cultures/test/insights/Doctors", json=insight("b")
+    )
+    assert response.status_code == 201
+
+    culture = client.get("/api/v1/cultures/test")
+    assert culture.headers["ETag"] != etag
+    assert culture.get_json()["general_insights"] == [insight("a")]
+    assert culture.get_json()["specialized_insights"] == {"Doctors": [insight("b")]}
+
+
+def test_create_insight_invalid(client):
+    client.post("/api/v1/cultures", json={"name": "test",},)
+
+    response = client.post(
+        "/api/v1/cultures/test/insights/general", json={"summary": "a"}
+    )
+    assert response.status_code == 400
+
+    response = client.post("/api/v1/cultures/test/insights/$set", json=INSIGHT)
+    assert response.status_code == 400
+
+    response = client.post("/api/v1/cultures/test1/insights/general", json=INSIGHT)
+    assert response.status_code == 404
+
+
+def test_insight_of_deleted_culture(client):
+    client.post("/api/v1/cultures", json={"name": "test",},)
+    client.delete("/api/v1/cultures/test")
+    version = client.get("/api/v1/cultures/version").get_json()["version"]
+
+    response = client.post("/api/v1/cultures/test/insights/general", json=INSIGHT)
+    assert response.status_code == 404
+
+    changes = client.get("/api/v1/cultures/changes?since=0").get_json()
+    assert changes["version"] == version
+    assert [tombstone["name"] for tombstone in changes["deleted"]] == ["test"]
+
+
+def test_create_insight_full(client, db):
+    client.post("/api/v1/cultures", json={"name": "test",},)
+    db.cultures.update_one(
+        {"name": "test"}, {"$set": {"general_insights": [INSIGHT] * 500}}
+    )
+
+    response = client.post("/api/v1/cultures/test/insights/general", json=INSIGHT)
+    assert response.status_code == 409
+
+
+def test_update_insight(client):
+    client.post("/api/v1/cultures", json={"name": "test",},)
+    client.post("/api/v1/cultures/test/insights/general", json=insight("a"))
+    client.post("/api/v1/cultures/test/insights/general", json=insight("b"))
+
+    response = client.patch(
+        "/api/v1/cultures/test/insights/general/1", json={"summary": "c"}
+    )
+    assert response.status_code == 200
+
+    culture = client.get("/api/v1/cultures/test").get_json()
+    assert culture["general_insights"] == [insight("a"), insight("c")]
+
+    response = client.patch("/api/v1/cultures/test/insights/general/1", json={})
+    assert response.status_code == 400
+
+    response = client.patch(
+        "/api/v1/cultures/test/insights/general/2", json={"summary": "c"}
+    )
+    assert response.status_code == 404
+
+
+def test_delete_insight(client):
+    client.post("/api/v1/cultures", json={"name": "test",},)
+    for summary in "abc":
+        client.post("/api/v1/cultures/test/insights/general", json=insight(summary))
+
+    response = client.delete("/api/v1/cultures/test/insights/general/1")
+    assert response.status_code == 200
+
+    culture = client.get("/api/v1/cultures/test").get_json()
+    assert culture["general_insights"] == [insight("a"), insight("c")]
+
+    response = client.delete("/api/v1/cultures/test/insights/general/2")
+    assert response.status_code == 404
+
+
+def test_delete_insight_concurrent_change(client, db, monkeypatch):
+    client.post("/api/v1/cultures", json={"name": "test",},)
+    client.post("/api/v1/cultures/test/insights/general", json=insight("a"))
+
+    find_one = db.cultures.find_one
+
+    def stale(*args, **kwargs):
+        culture = find_one(*args, **kwargs)
+        culture["digest"] = "stale"
+        return culture
+
+    monkeypatch.setattr(db.cultures, "find_one", stale)
+    response = client.delete("/api/v1/cultures/test/insights/general/0")
+    assert response.status_code == 409
+    monkeypatch.undo()
+
+    culture = client.get("/api/v1/cultures/test").get_json()
+    assert culture["general_insights"] == [insight("a")]
+
+
+def test_reorder_insights(client):
+    client.post("/api/v1/cultures", json={"name": "test",},)
+    for summary in "abc":
+        client.post("/api/v1/cultures/test/insights/Doctors", json=insight(summary))
+
+    response = client.post(
+        "/api/v1/cultures/test/insights/Doctors/reorder", json={"order": [2, 0, 1]}
+    )
+    assert response.status_code == 200
+
+    culture = client.get("/api/v1/cultures/test").get_json()
+    assert culture["specialized_insights"]["Doctors"] == [
+        insight("c"),
+        insight("a"),
+        insight("b"),
+    ]
+
+    response = client.post(
+        "/api/v1/cultures/test/insights/Doctors/reorder", json={"order": [0, 0, 1]}
+    )
+    assert response.status_code == 400
+    assert response.get_json()["msg"] == "`order` must be a permutation of 0..2"
+
+
+def test_get_insights_page(client):
+    client.post("/api/v1/cultures", json={"name": "test",},)
+    for summary in "abcde":
+        client.post("/api/v1/cultures/test/insights/general", json=insight(summary))
+
+    response = client.get("/api/v1/cultures/test/insights?offset=1&limit=2")
+    assert response.status_code == 200
+    page = response.get_json()
+    assert page["insights"] == [insight("b"), insight("c")]
+    assert page["next"] == 3
+    assert page["total"] == 5
+
+    response = client.get("/api/v1/cultures/test/insights?offset=3&limit=2")
+    assert response.get_json()["insights"] == [insight("d"), insight("e")]
+
+    response = client.get("/api/v1/cultures/test/insights?offset=5&limit=2")
+    assert response.get_json()["insights"] == []
+    assert "next" not in response.get_json()
+
+    etag = response.headers["ETag"]
+    response = client.get(
+        "/api/v1/cultures/test/insights", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 200
+
+
+def test_get_insights_summary(client):
+    client.post("/api/v1/cultures", json={"name": "test",},)
+    client.post("/api/v1/cultures/test/insights/Doctors", json=insight("a"))
+
+    response = client.get(
+        "/api/v1/cultures/test/insights?category=Doctors&summary=true"
+    )
+    assert response.get_json()["insights"] == [{"summary": "a"}]
+
+    etag = response.headers["ETag"]
+    response = client.get(
+        "/api/v1/cultures/test/insights?category=Doctors&summary=true",
+        headers={"If-None-Match": etag},
+    )
+    assert response.status_code == 304
+
+    response = client.get("/api/v1/cultures/test/insights?category=Nurses")
+    assert response.get_json()["insights"] == []
+
+
+def test_get_insights_summary_projected_by_database(client, db, monkeypatch):
+    client.post("/api/v1/cultures", json={"name": "test",},)
+    client.post("/api/v1/cultures/test/insights/general", json=insight("a"))
+
+    aggregate = db.cultures.aggregate
+    fetched = []
+
+    def recording(*args, **kwargs):
+        fetched.extend(aggregate(*args, **kwargs))
+        return iter(fetched)
+
+    monkeypatch.setattr(db.cultures, "aggregate", recording)
+    client.get("/api/v1/cultures/test/insights?summary=true")
+    assert fetched[0]["insights"] == [{"summary": "a"}]
+
+
+def test_get_insights_invalid(client):
+    client.post("/api/v1/cultures", json={"name": "test",},)
+
+    response = client.get("/api/v1/cultures/test/insights?limit=0")
+    assert response.status_code == 400
+
+    response = client.get("/api/v1/cultures/test/insights?offset=-1")
+    assert response.status_code == 400
+
+    response = client.get("/api/v1/cultures/test1/insights")
+    assert response.status_code == 404
@@ -0,0 +1,126 @@
+import pytest
+from flask_mail import Mail
+
+from api import metrics
+from api.mailer.connection import PersistentConnection
+from api.mailer.outbox import DEAD, PENDING, deliver
+from api.metrics import SMTP_DURATION
+
+
+@pytest.fixture
+def connection(app, smtp_server):
+    with app.app_context():
+        connection = PersistentConnection(Mail(app))
+        yield connection
+        connection.close()
+
+
+def test_invite_queued(client, db, app, smtp_server, connection):
+    res = client.post("/api/v1/admins/invite", json={"email": "new@gmail.com"})
+    assert res.status_code == 200
+    assert smtp_server.messages == []
+
+    queued = db.outbox.find_one()
+    assert queued["status"] == PENDING
+    assert queued["recipients"] == ["new@gmail.com"]
+
+    assert deliver(app, db, connection) == 1
+    assert smtp_server.messages[0]["to"] == ["new@gmail.com"]
+    assert db.outbox.count_documents({}) == 0
+
+
+def test_recovery_queued(client, db, app, smtp_server, connection):
+    res = client.post("/api/v1/admins/recover", json={"email": "admin@gmail.com"})
+    assert res.status_code == 200
+
+    assert deliver(app, db, connection) == 1
+    assert b"Account Recovery" in smtp_server.messages[0]["data"]
+
+
+def test_delivery_retried_then_dead(client, db, app, smtp_server, connection):
+    app.config.update(MAIL_BACKOFF=0, MAIL_MAX_ATTEMPTS=2)
+    smtp_server.fail = True
+    client.post("/api/v1/admins/invite", json={"email": "new@gmail.com"})
+
+    # backoff of 0 makes the retry due immediately, within the same pass
+    assert deliver(app, db, connection) == 0
+
+    queued = db.outbox.find_one()
+    assert queued["status"] == DEAD
+    assert queued["attempts"] == 2
+    assert "try again later" in queued["error"]
+
+
+def test_delivery_backoff(client, db, app, smtp_server, connection):
+    app.config.update(MAIL_BACKOFF=60)
+    smtp_server.fail = True
+    client.post("/api/v1/admins/invite", json={"email": "new@gmail.com"})
+
+    assert deliver(app, db, connection) == 0
+    queued = db.outbox.find_one()
+    assert queued["status"] == PENDING
+    assert queued["attempts"] == 1
+
+    # not due yet
+    smtp_server.fail = False
+    assert deliver(app, db, connection) == 0
+
+    db.outbox.update_one({}, {"$set": {"next_attempt": 0}})
+    assert deliver(app, db, connection) == 1
+
+
+def test_connection_reused(client, db, app, smtp_server, connection):
+    for i in range(3):
+        client.post("/api/v1/admins/invite", json={"email": f"new{i}@gmail.com"})
+
+    assert deliver(app, db, connection) == 3
+    assert len(smtp_server.messages) == 3
+    assert smtp_server.connections == 1
+
+
+def test_connection_idle_timeout(client, db, app, smtp_server, connection):
+    connection.idle_timeout = 0
+    for i in range(2):
+        client.post("/api/v1/admins/invite", json={"email": f"new{i}@gmail.com"})
+
+    assert deliver(app, db, connection) == 2
+    assert smtp_server.connections == 2
+
+
+def test_connection_reconnects(client, db, app, smtp_server, connection):
+    client.post("/api/v1/admins/invite", json={"email": "new0@gmail.com"})
+    assert deliver(app, db, connection) == 1
+
+    # server went away between messages
+    connection.connection.host.close()
+
+    client.post("/api/v1/admins/invite", json={"email": "new1@gmail.com"})
+    assert deliver(app, db, connection) == 1
+    assert len(smtp_server.messages) == 2
+    assert smtp_server.connections == 2
+
+
+def test_connection_closed_on_error(client, db, app, smtp_server, connection):
+    smtp_server.fail = True
+    client.post("/api/v1/admins/invite", json={"email": "new0@gmail.com"})
+    assert deliver(app, db, connection) == 0
+    assert connection.connection is None
+
+    smtp_server.fail = False
+    client.post("/api/v1/admins/invite", json={"email": "new1@gmail.com"})
+    assert deliver(app, db, connection) == 1
+    assert smtp_server.connections == 2
+
+
+def test_delivery_timed(client, db, app, smtp_server, connection):
+    metrics.reset()
+    client.post("/api/v1/admins/invite", json={"email": "new@gmail.com"})
+    deliver(app, db, connection)
+
+    smtp_server.fail = True
+    client.post("/api/v1/admins/invite", json={"email": "new@gmail.com"})
+    deliver(app, db, connection)
+
+    # Bucket counts, then the sum
+    assert sum(SMTP_DURATION.values[("ok",)][:-1]) == 1
+    assert sum(SMTP_DURATION.values[("error",)][:-1]) >= 1
@@ -0,0 +1,92 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from api import metrics
+from api.metrics import (HTTP_REQUESTS, MONGODB_DURATION, CommandMetrics,
+                         Histogram, MetricsFile, clear_metrics_dir, render)
+
+
+@pytest.fixture(autouse=True)
+def reset():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def test_metrics_requests(client):
+    client.get("/api/v1/cultures")
+    client.get("/api/v1/cultures/unknown")
+    client.get("/api/v1/nowhere")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+
+    lines = response.get_data(as_text=True).splitlines()
+    assert "# TYPE http_requests_total counter" in lines
+    for line in (
+        'http_requests_total{endpoint="cultures",method="GET",status="200"} 1',
+        'http_requests_total{endpoint="culture",method="GET",status="404"} 1',
+        'http_requests_total{endpoint="unmatched",method="GET",status="404"} 1',
+        'http_request_duration_seconds_count{endpoint="cultures",method="GET"} 1',
+        'http_response_size_bytes_bucket{endpoint="cultures",method="GET",le="256"} 1',
+    ):
+        assert line in lines
+
+
+def test_histogram_render():
+    histogram = Histogram("latency_seconds", "Latency.", ("route",), (0.1, 1))
+    for value in (0.05, 0.5, 5):
+        histogram.observe(("a",), value)
+
+    assert histogram.render(dict(histogram.values)) == [
+        'latency_seconds_bucket{route="a",le="0.1"} 1',
+        'latency_seconds_bucket{route="a",le="1"} 2',
+        'latency_seconds_bucket{route="a",le="+Inf"} 3',
+        'latency_seconds_sum{route="a"} 5.55',
+        'latency_seconds_count{route="a"} 3',
+    ]
+
+
+def test_label_escaping():
+    HTTP_REQUESTS.inc(('a"b\\c', "GET", "200"))
+    assert 'endpoint="a\\"b\\\\c"' in render()
+
+
+def test_command_metrics():
+    listener = CommandMetrics()
+    listener.succeeded(SimpleNamespace(command_name="find", duration_micros=2000))
+    listener.failed(SimpleNamespace(command_name="insert", duration_micros=3000))
+
+    assert MONGODB_DURATION.values[("find", "ok")][-1] == 0.002
+    assert MONGODB_DURATION.values[("insert", "error")][-1] == 0.003
+
+
+def test_metrics_aggregated_across_workers(tmp_path):
+    HTTP_REQUESTS.inc(("cultures", "GET", "200"), 2)
+    MONGODB_DURATION.observe(("find", "ok"), 0.002)
+    metrics_file = MetricsFile(str(tmp_path), 3600)
+    metrics_file.start()
+    metrics_file.write()
+
+    # Another worker's file
+    other = {
+        "http_requests_total": [[["cultures", "GET", "200"], 3]],
+        "mongodb_command_duration_seconds": [
+            [["find", "ok"], [0, 1] + [0] * 12 + [0.002]]
+        ],
+    }
+    (tmp_path / "metrics-1-worker.json").write_text(json.dumps(other))
+
+    lines = render(str(tmp_path)).splitlines()
+    for line in (
+        'http_requests_total{endpoint="cultures",method="GET",status="200"} 5',
+        'mongodb_command_duration_seconds_count{command="find",outcome="ok"} 2',
+        'mongodb_command_duration_seconds_sum{command="find",outcome="ok"} 0.004',
+    ):
+        assert line in lines
+
+    clear_metrics_dir(str(tmp_path))
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,102 @@
+import json
+import os
+import pstats
+import sys
+
+from api.profiling import collapse, component
+
+
+def profiles(app, tmp_path, endpoint, suffix):
+    app.extensions["profiler"].flush()
+    return list(tmp_path.glob(f"{endpoint}.*.{os.getpid()}.{suffix}"))
+
+
+def test_profile_sampled(app, client, tmp_path):
+    app.config.update(PROFILE_DIR=str(tmp_path), PROFILE_SAMPLE_RATE=1)
+    client.get("/api/v1/cultures")
+    client.get("/api/v1/cultures")
+    # Written by the flush, not by the requests
+    assert list(tmp_path.iterdir()) == []
+
+    [summary] = profiles(app, tmp_path, "cultures", "json")
+    assert json.loads(summary.read_text())["requests"] == 2
+
+    [path] = profiles(app, tmp_path, "cultures", "pstats")
+    stats = pstats.Stats(str(path))
+    assert any(function == "cultures" for _, _, function in stats.stats)
+
+
+def test_profile_components(app, client, tmp_path):
+    app.config.update(PROFILE_DIR=str(tmp_path), PROFILE_SAMPLE_RATE=1)
+    client.post("/api/v1/login", json={"email": "admin@gmail.com", "password": "x"})
+
+    [summary] = profiles(app, tmp_path, "login", "json")
+    components = json.loads(summary.read_text())["components"]
+    assert components["password_hashing"] > 0
+    assert components["validation"] > 0
+
+
+def test_profile_stack_samples(app, client, tmp_path):
+    app.config.update(
+        PROFILE_DIR=str(tmp_path),
+        PROFILE_SAMPLE_RATE=1,
+        PROFILE_MODE="sample",
+        PROFILE_INTERVAL=0.001,
+    )
+    client.post("/api/v1/login", json={"email": "admin@gmail.com", "password": "x"})
+
+    [path] = profiles(app, tmp_path, "login", "collapsed")
+    stacks = [line.rsplit(" ", 1) for line in path.read_text().splitlines()]
+    assert stacks and all(count.isdigit() for _, count in stacks)
+    assert any("werkzeug/security.py" in stack for stack, _ in stacks)
+
+    [summary] = profiles(app, tmp_path, "login", "json")
+    assert json.loads(summary.read_text())["components"]["password_hashing"] > 0
+
+
+def test_profile_on_demand(app, client, tmp_path):
+    app.config.update(PROFILE_DIR=str(tmp_path))
+    client.get("/api/v1/cultures")
+    assert profiles(app, tmp_path, "cultures", "json") == []
+
+    # Only admins may ask for a profile
+    app.test_client().get("/api/v1/cultures", headers={"X-Profile": "1"})
+    assert profiles(app, tmp_path, "cultures", "json") == []
+
+    client.get("/api/v1/cultures", headers={"X-Profile": "1"})
+    assert len(profiles(app, tmp_path, "cultures", "json")) == 1
+
+
+def test_profile_rotated(app, client, tmp_path):
+    app.config.update(PROFILE_DIR=str(tmp_path), PROFILE_SAMPLE_RATE=1)
+    old = tmp_path / "cultures.0.1.json"
+    old.write_text("{}")
+
+    client.get("/api/v1/cultures")
+    app.extensions["profiler"].flush()
+    assert not old.exists()
+    assert len(profiles(app, tmp_path, "cultures", "json")) == 1
+
+
+def test_profile_disabled(app, client, tmp_path):
+    app.config.update(PROFILE_SAMPLE_RATE=1)
+    client.get("/api/v1/cultures", headers={"X-Profile": "1"})
+    assert list(tmp_path.glob("*.json")) == []
+
+
+def test_component():
+    assert component("~:<built-in method orjson.dumps>") == "json_encoding"
+    assert component("/site-packages/marshmallow/schema.py:load") == "validation"
+    assert component("~:<built-in method bson._cbson._decode_all>") == "bson_decoding"
+    assert component("~:<built-in method _hashlib.pbkdf2_hmac>") == "password_hashing"
+    assert component("/lib/python3.8/json/encoder.py:iterencode") == "json_encoding"
+    assert component("api/bsonjson.py:transcode") == "bson_decoding"
+    assert component("api/resource/culture.py:culture") is None
+    # ETag digests and request parsing
+    assert component("~:<built-in method _hashlib.openssl_sha256>") is None
+    assert component("/site-packages/flask/json/__init__.py:loads") is None
+
+
+def test_collapse():
+    stack = collapse(sys._getframe())
+    assert stack.endswith(";tests/test_profiling.py:test_collapse")
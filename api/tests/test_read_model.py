@@ -0,0 +1,206 @@
+import queue
+import time
+
+import pytest
+
+from api import create_app
+from api.auth import auth_routes
+from api.catalog import CatalogMirror, culture_written
+from api.conftest import login_admin
+from api.encoding import stdlib_dumps
+from api.read_model import ReadModel
+from api.resource.culture import culture_routes
+
+
+@pytest.fixture
+def worker(db, client):
+    """Client of a second worker serving cultures from its read model."""
+    app = create_app()
+    app.config["SECRET_KEY"] = "testing"
+    app.config["CULTURE_READ_MODEL"] = "poll"
+    app.config["CULTURE_READ_MODEL_INTERVAL"] = 3600
+    auth_routes(app, db)
+    culture_routes(app, db)
+
+    flask_client = app.test_client()
+    token = login_admin(flask_client)
+    flask_client.environ_base["HTTP_AUTHORIZATION"] = "Bearer " + token
+    flask_client.read_model = app.extensions["culture_read_model"]
+    return flask_client
+
+
+def test_read_model_matches_database(client, worker):
+    for name in ("b", "a", "c"):
+        client.post("/api/v1/cultures", json={"name": name})
+    client.post(
+        "/api/v1/cultures/a/insights/general", json={"summary": "s", "information": "i"}
+    )
+
+    for path in (
+        "/api/v1/cultures",
+        "/api/v1/cultures?limit=2",
+        "/api/v1/cultures?after=a&limit=1",
+        "/api/v1/cultures/a",
+        "/api/v1/cultures/unknown",
+    ):
+        expected = client.get(path)
+        response = worker.get(path)
+        assert response.status_code == expected.status_code
+        assert response.data == expected.data
+        assert response.headers.get("ETag") == expected.headers.get("ETag")
+
+    etag = client.get("/api/v1/cultures/a").headers["ETag"]
+    cached = worker.get("/api/v1/cultures/a", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+
+
+def test_read_model_polls_other_workers(client, worker):
+    client.post("/api/v1/cultures", json={"name": "a"})
+    assert worker.get("/api/v1/cultures/a").status_code == 200
+
+    client.post("/api/v1/cultures", json={"name": "b"})
+    client.delete("/api/v1/cultures/a")
+    assert worker.get("/api/v1/cultures/b").status_code == 404
+
+    worker.read_model.checked -= 3600
+    assert worker.get("/api/v1/cultures/b").status_code == 200
+    assert worker.get("/api/v1/cultures/a").status_code == 404
+
+
+def test_read_model_own_writes(worker):
+    assert worker.get("/api/v1/cultures").get_json() == {"cultures": []}
+
+    worker.post("/api/v1/cultures", json={"name": "a"})
+    assert worker.get("/api/v1/cultures/a").status_code == 200
+
+    worker.put(
+        "/api/v1/cultures/a",
+        json={"name": "b", "general_insights": [], "specialized_insights": {}},
+    )
+    names = [c["name"] for c in worker.get("/api/v1/cultures").get_json()["cultures"]]
+    assert names == ["b"]
+
+
+def test_read_model_snapshots_are_immutable(db):
+    read_model = ReadModel(stdlib_dumps)
+    before = read_model.current(db)
+
+    db.cultures.insert_one({"name": "a", "modified": 1, "digest": "d"})
+    culture_written(db, "a", 1)
+    read_model.refresh(db)
+
+    assert before.names == ()
+    assert read_model.current(db).names == ("a",)
+    assert read_model.current(db).cultures["a"].digest == "d"
+
+
+class Stream:
+    """Change stream ending at None."""
+
+    def __init__(self, events):
+        self.events = events
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def __iter__(self):
+        return iter(self.events.get, None)
+
+
+class Watched:
+    """Database with a change stream on `catalog`."""
+
+    def __init__(self, db, events):
+        self.db = db
+        self.events = events
+
+    def __getattr__(self, name):
+        return getattr(self.db, name)
+
+    @property
+    def catalog(self):
+        db, events = self.db, self.events
+
+        class Catalog:
+            def __getattr__(self, name):
+                return getattr(db.catalog, name)
+
+            def watch(self):
+                return Stream(events)
+
+        return Catalog()
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_read_model_watch(db):
+    events = queue.Queue()
+    watched = Watched(db, events)
+    read_model = ReadModel(stdlib_dumps, "watch", interval=3600)
+    read_model.current(watched)
+    wait_for(lambda: read_model.watching)
+
+    db.cultures.insert_one({"name": "a", "modified": 1, "digest": "d"})
+    culture_written(db, "a", 1)
+    events.put({"operationType": "update"})
+    wait_for(lambda: "a" in read_model.current(watched).cultures)
+
+    events.put(None)
+    wait_for(lambda: not read_model.watching)
+
+
+def test_read_model_watch_unavailable(db):
+    # mongomock has no change streams, like a standalone server
+    read_model = ReadModel(stdlib_dumps, "watch", interval=0)
+    read_model.current(db)
+    wait_for(lambda: read_model._watcher_pid is not None and not read_model.watching)
+
+    db.cultures.insert_one({"name": "a", "modified": 1, "digest": "d"})
+    culture_written(db, "a", 1)
+    assert "a" in read_model.current(db).cultures
+
+
+def test_read_model_unknown_mode():
+    with pytest.raises(ValueError):
+        ReadModel(stdlib_dumps, "push")
+
+
+def test_catalog_mirror_requires_hooks():
+    class Partial(CatalogMirror):
+        def _add(self, culture):
+            pass
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+def test_catalog_mirror_late_write(db):
+    class Names(CatalogMirror):
+        def __init__(self):
+            super().__init__()
+            self.names = set()
+
+        def _add(self, culture):
+            self.names.add(culture["name"])
+
+        def _remove(self, name):
+            self.names.discard(name)
+
+    mirror = Names()
+    db.cultures.insert_one({"name": "a", "modified": 100})
+    culture_written(db, "a", 100)
+    mirror.refresh(db)
+
+    # Stamped before "a" but landed after the mirror applied it
+    db.cultures.insert_one({"name": "b", "modified": 90})
+    culture_written(db, "b", 90)
+    mirror.refresh(db)
+    assert mirror.names == {"a", "b"}
@@ -0,0 +1,81 @@
+from api.search import SearchIndex, snippet
+
+
+def insight(summary, information):
+    return {
+        "summary": summary,
+        "information": information,
+        "source": {"data": "www.example.com", "type": "link"},
+    }
+
+
+def test_search(client):
+    client.post("/api/v1/cultures", json={"name": "Amish",},)
+    client.post(
+        "/api/v1/cultures/Amish/insights/general",
+        json=insight("Family", "Decisions about care are made with the family."),
+    )
+    client.post(
+        "/api/v1/cultures/Amish/insights/Nurses",
+        json=insight("Modesty", "Patients prefer a nurse of the same gender."),
+    )
+
+    response = client.get("/api/v1/search?q=family care")
+    assert response.status_code == 200
+    hit = response.get_json()["hits"][0]
+    assert hit["name"] == "Amish"
+    assert hit["category"] == "general"
+    assert hit["position"] == 0
+    start, end = hit["highlights"][0]
+    assert hit["snippet"][start:end] == "care"
+
+    response = client.get("/api/v1/search?q=amish")
+    hit = response.get_json()["hits"][0]
+    assert hit["category"] is None
+    assert hit["snippet"] == "Amish"
+
+
+def test_search_follows_writes(client):
+    client.post("/api/v1/cultures", json={"name": "test",},)
+    assert client.get("/api/v1/search?q=gender").get_json()["hits"] == []
+
+    client.post(
+        "/api/v1/cultures/test/insights/general",
+        json=insight("Modesty", "Patients prefer a nurse of the same gender."),
+    )
+    assert len(client.get("/api/v1/search?q=gender").get_json()["hits"]) == 1
+
+    client.delete("/api/v1/cultures/test")
+    assert client.get("/api/v1/search?q=gender").get_json()["hits"] == []
+
+
+def test_search_other_worker(app, client, db):
+    index = SearchIndex()
+    index.refresh(db)
+    assert index.search("gender", 10) == []
+
+    client.post("/api/v1/cultures", json={"name": "test",},)
+    client.post(
+        "/api/v1/cultures/test/insights/general",
+        json=insight("Modesty", "Patients prefer a nurse of the same gender."),
+    )
+
+    index.refresh_if_stale(db, 60)
+    assert index.search("gender", 10) == []
+
+    index.refresh_if_stale(db, 0)
+    assert len(index.search("gender", 10)) == 1
+
+
+def test_search_invalid(client):
+    assert client.get("/api/v1/search").status_code == 400
+    assert client.get("/api/v1/search?q=...").status_code == 400
+    assert client.get("/api/v1/search?q=a&limit=0").status_code == 400
+
+
+def test_snippet():
+    text = "word " * 100 + "needle " + "word " * 100
+
+    cut, highlights = snippet(text, {"needle"})
+    assert len(cut) == 160
+    assert [cut[start:end] for start, end in highlights] == ["needle"]
@@ -0,0 +1,247 @@
+import json
+import time
+from types import SimpleNamespace
+
+import bson  # type: ignore
+import pytest  # type: ignore
+
+from api.slow_ops import (SlowOpRecorder, execution_totals, plan_flags,
+                          plan_nodes, redact)
+
+# Explain of a find on cultures by a field without an index
+COLLSCAN_EXPLAIN = {
+    "queryPlanner": {
+        "winningPlan": {
+            "stage": "SORT",
+            "inputStage": {"stage": "COLLSCAN", "filter": {"name": {"$eq": "a"}}},
+        },
+        "rejectedPlans": [{"stage": "IXSCAN", "indexName": "other"}],
+    },
+    "executionStats": {
+        "nReturned": 1,
+        "totalDocsExamined": 40,
+        "totalKeysExamined": 0,
+    },
+}
+
+IXSCAN_EXPLAIN = {
+    "stages": [
+        {
+            "$cursor": {
+                "queryPlanner": {
+                    "winningPlan": {
+                        "stage": "FETCH",
+                        "inputStage": {"stage": "IXSCAN", "indexName": "adhoc"},
+                    }
+                },
+                "executionStats": {"totalDocsExamined": 1, "totalKeysExamined": 1},
+            }
+        }
+    ]
+}
+
+
+def events(command_name, command, duration_ms, reply=None):
+    started = SimpleNamespace(
+        command_name=command_name, command=command, connection_id=1, request_id=7
+    )
+    succeeded = SimpleNamespace(
+        command_name=command_name,
+        connection_id=1,
+        request_id=7,
+        duration_micros=int(duration_ms * 1000),
+        reply=reply or {"cursor": {"firstBatch": [{"name": "a"}]}, "ok": 1},
+    )
+    return started, succeeded
+
+
+def wait_for_records(db, count):
+    deadline = time.monotonic() + 5
+    while db.slow_ops.count_documents({}) < count:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    return list(db.slow_ops.find({}, {"_id": 0}))
+
+
+def test_slow_command_recorded(db):
+    recorder = SlowOpRecorder(db, threshold_ms=100)
+    find = {
+        "find": "admins",
+        "filter": {"email": "admin@gmail.com"},
+        "sort": {"name": 1},
+        "projection": {"_id": 0},
+        "$db": "db",
+    }
+
+    started, succeeded = events("find", find, 50)
+    recorder.started(started)
+    recorder.succeeded(succeeded)
+
+    started, succeeded = events("find", find, 150)
+    recorder.started(started)
+    recorder.succeeded(succeeded)
+
+    [record] = wait_for_records(db, 1)
+    assert record["command"] == "find"
+    assert record["collection"] == "admins"
+    assert record["duration_ms"] == 150
+    assert record["filter"] == '{"email": "<str>"}'
+    assert record["sort"] == '{"name": 1}'
+    assert record["projection"] == '{"_id": 0}'
+    assert record["returned"] == 1
+    assert record["reply_bytes"] > 0
+    assert "explain" not in record
+
+
+@pytest.mark.parametrize(
+    "command",
+    [
+        {
+            "find": "cultures",
+            "filter": {"modified": {"$gt": 1}, "name.first": "a"},
+            "sort": {"$natural": 1},
+            "projection": {"insights.$": 1},
+        },
+        {
+            "aggregate": "cultures",
+            "pipeline": [{"$match": {"name": "a"}}, {"$project": {"a.b": 1}}],
+            "cursor": {},
+        },
+    ],
+)
+def test_record_stored_with_operator_keys(command):
+    stored = []
+
+    class Storing:
+        class slow_ops:
+            @staticmethod
+            def insert_one(record):
+                # What pymongo checks before inserting, mongomock doesn't
+                bson.BSON.encode(record, check_keys=True)
+                stored.append(record)
+
+    recorder = SlowOpRecorder(Storing, threshold_ms=0)
+    recorder.record({"command": next(iter(command))}, command)
+
+    [record] = stored
+    for field in ("filter", "pipeline"):
+        if field in command:
+            assert json.loads(record[field]) == redact(command[field])
+    for field in ("sort", "projection"):
+        if field in command:
+            assert json.loads(record[field]) == command[field]
+
+
+def test_ignored_commands(db):
+    recorder = SlowOpRecorder(db, threshold_ms=0)
+    for name, command in (
+        ("insert", {"insert": "cultures", "documents": []}),
+        ("find", {"find": "slow_ops", "filter": {}}),
+    ):
+        started, succeeded = events(name, command, 500)
+        recorder.started(started)
+        recorder.succeeded(succeeded)
+
+    assert recorder._pending.empty()
+
+
+def test_slow_command_explained(db):
+    explained = []
+
+    class Explaining:
+        slow_ops = db.slow_ops
+
+        @staticmethod
+        def command(command):
+            explained.append(command)
+            return COLLSCAN_EXPLAIN
+
+    recorder = SlowOpRecorder(Explaining, threshold_ms=0, explain_sample_rate=1)
+    update = {
+        "update": "cultures",
+        "updates": [{"q": {"name": "a"}, "u": {"$set": {"x": 1}}}],
+        "lsid": {"id": 1},
+        "$db": "db",
+    }
+    started, succeeded = events("update", update, 10, {"n": 1, "ok": 1})
+    recorder.started(started)
+    recorder.succeeded(succeeded)
+
+    [record] = wait_for_records(db, 1)
+    assert explained == [
+        {
+            "explain": {"update": "cultures", "updates": update["updates"]},
+            "verbosity": "executionStats",
+        }
+    ]
+    assert record["returned"] == 1
+    assert record["filter"] == '{"name": "<str>"}'
+    assert record["explain"] == {
+        "stages": ["SORT", "COLLSCAN"],
+        "indexes": [],
+        "docs_examined": 40,
+        "keys_examined": 0,
+    }
+    assert record["flags"] == [
+        "COLLSCAN",
+        "INDEX_NOT_USED:name_modified",
+        "INDEX_NOT_USED:name_unique",
+    ]
+
+
+def test_plan_flags():
+    nodes = list(plan_nodes(IXSCAN_EXPLAIN))
+    assert [node["stage"] for node in nodes] == ["FETCH", "IXSCAN"]
+    assert execution_totals(IXSCAN_EXPLAIN) == {"docs_examined": 1, "keys_examined": 1}
+
+    command = {"find": "cultures", "filter": {"name": "a"}}
+    assert plan_flags("cultures", command, ["FETCH", "IXSCAN"], ["adhoc"]) == [
+        "UNLISTED_INDEX:adhoc"
+    ]
+    assert plan_flags("cultures", command, ["FETCH", "IXSCAN"], ["name_unique"]) == []
+
+    command = {"find": "feedback", "filter": {"email": "a"}}
+    assert plan_flags("feedback", command, ["COLLSCAN"], []) == [
+        "COLLSCAN",
+        "MISSING_INDEX",
+    ]
+    assert plan_flags("feedback", {"find": "feedback"}, ["COLLSCAN"], []) == [
+        "COLLSCAN"
+    ]
+
+
+def test_redact():
+    assert redact([{"$match": {"a": {"$in": [1, "b"]}}}, {"$limit": 5}]) == [
+        {"$match": {"a": {"$in": ["<int>", "<str>"]}}},
+        {"$limit": "<int>"},
+    ]
+
+
+def test_slow_ops_route(client, db):
+    db.slow_ops.insert_many(
+        [
+            {"at": 1.0, "command": "find", "collection": "cultures", "flags": []},
+            {"at": 2.0, "command": "find", "collection": "admins"},
+            {
+                "at": 3.0,
+                "command": "find",
+                "collection": "cultures",
+                "flags": ["COLLSCAN"],
+            },
+        ]
+    )
+
+    response = client.get("/api/v1/db/slow-ops")
+    assert response.status_code == 200
+    assert [op["at"] for op in response.get_json()["slow_ops"]] == [3.0, 2.0, 1.0]
+
+    response = client.get("/api/v1/db/slow-ops?collection=cultures&limit=1")
+    assert [op["at"] for op in response.get_json()["slow_ops"]] == [3.0]
+
+    response = client.get("/api/v1/db/slow-ops?flagged=1")
+    assert [op["at"] for op in response.get_json()["slow_ops"]] == [3.0]
+
+    assert client.get("/api/v1/db/slow-ops?limit=0").status_code == 400
+
+    del client.environ_base["HTTP_AUTHORIZATION"]
+    assert client.get("/api/v1/db/slow-ops").status_code == 401
@@ -0,0 +1,60 @@
+from api.suggest import SuggestIndex
+
+
+def names(response):
+    return [suggestion["name"] for suggestion in response.get_json()["suggestions"]]
+
+
+def test_suggest_prefix(client):
+    for name in ("Somali Bantu", "Somali", "Amish", "Hmong"):
+        client.post("/api/v1/cultures", json={"name": name},)
+
+    response = client.get("/api/v1/cultures/suggest?q=som")
+    assert response.status_code == 200
+    assert names(response)[:2] == ["Somali", "Somali Bantu"]
+
+    response = client.get("/api/v1/cultures/suggest?q=BAN")
+    assert names(response)[0] == "Somali Bantu"
+
+
+def test_suggest_fuzzy(client):
+    for name in ("Amish", "Hmong", "Cape Verdean"):
+        client.post("/api/v1/cultures", json={"name": name},)
+
+    response = client.get("/api/v1/cultures/suggest?q=hmnog")
+    assert names(response) == ["Hmong"]
+    assert response.get_json()["suggestions"][0]["match"] == "fuzzy"
+
+    response = client.get("/api/v1/cultures/suggest?q=cape-verdéan")
+    assert names(response) == ["Cape Verdean"]
+
+
+def test_suggest_follows_writes(client):
+    client.post("/api/v1/cultures", json={"name": "Amish"},)
+    assert names(client.get("/api/v1/cultures/suggest?q=ami")) == ["Amish"]
+
+    client.put(
+        "/api/v1/cultures/Amish",
+        json={"name": "Old Order Amish", "general_insights": []},
+    )
+    assert names(client.get("/api/v1/cultures/suggest?q=ami")) == ["Old Order Amish"]
+
+    client.delete("/api/v1/cultures/Old Order Amish")
+    assert names(client.get("/api/v1/cultures/suggest?q=ami")) == []
+
+
+def test_suggest_invalid(client):
+    assert client.get("/api/v1/cultures/suggest").status_code == 400
+    assert client.get("/api/v1/cultures/suggest?q=a&limit=51").status_code == 400
+
+
+def test_suggest_index(db):
+    index = SuggestIndex()
+    db.cultures.insert_one({"name": "Amish", "modified": 1})
+    db.catalog.insert_one({"_id": "cultures", "version": 1, "modified": 1})
+
+    index.refresh(db)
+    assert index.suggest("amish", 10, 0.3) == [
+        {"name": "Amish", "match": "prefix", "score": 1.0}
+    ]
+    assert index.suggest("zzz", 10, 0.3) == []
@@ -0,0 +1,100 @@
+"""Module for token bucket rate limiting shared across gunicorn workers.
+
+Buckets live in the `throttle` collection so every worker sees the same
+counts. A bucket holds at most `capacity` tokens, refills at `rate` tokens per
+second and every attempt takes one token. Idle buckets expire through a TTL
+index once they would be full again.
+
+Format:
+{
+  "_id": "ip:127.0.0.1",
+  "tokens": 4.5,
+  "updated": 00000000.0,
+  "expires": ISODate(...)
+}
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Tuple
+
+from pymongo import MongoClient  # type: ignore
+from pymongo.errors import DuplicateKeyError  # type: ignore
+
+STATS_ID = "stats"
+
+
+def take(
+    db: MongoClient, key: str, capacity: float, rate: float, now: float
+) -> Tuple[bool, float]:
+    """Take a token from a bucket.
+
+    Updates are conditional on the bucket's `updated` timestamp, a bucket
+    modified by another worker in between is read again.
+
+    Arguments:
+      db: MongoDB client
+      key: bucket to take from, e.g. "ip:127.0.0.1"
+      capacity: maximum number of tokens
+      rate: tokens added per second
+      now: EPOCH timestamp of the attempt
+
+    Returns:
+      (allowed, seconds until a token is available)
+    """
+    expires = datetime.utcnow() + timedelta(seconds=capacity / rate)
+
+    for _ in range(3):
+        bucket = db.throttle.find_one({"_id": key})
+        if bucket is None:
+            try:
+                db.throttle.insert_one(
+                    {
+                        "_id": key,
+                        "tokens": capacity - 1,
+                        "updated": now,
+                        "expires": expires,
+                    }
+                )
+                return True, 0
+            except DuplicateKeyError:
+                continue
+
+        tokens = min(capacity, bucket["tokens"] + (now - bucket["updated"]) * rate)
+        if tokens < 1:
+            return False, (1 - tokens) / rate
+
+        result = db.throttle.update_one(
+            {"_id": key, "updated": bucket["updated"]},
+            {"$set": {"tokens": tokens - 1, "updated": now, "expires": expires}},
+        )
+        if result.modified_count:
+            return True, 0
+
+    # Lost every race, the bucket is under heavy contention
+    return False, 1 / rate
+
+
+def count(db: MongoClient, counter: str) -> None:
+    """Increment a limiter counter.
+
+    Arguments:
+      db: MongoDB client
+      counter: name of the counter
+    """
+    db.throttle.update_one({"_id": STATS_ID}, {"$inc": {counter: 1}}, upsert=True)
+
+
+def stats(db: MongoClient) -> Dict[str, int]:
+    """Fetch the limiter counters.
+
+    Arguments:
+      db: MongoDB client
+
+    Returns:
+      counters along with the number of buckets currently tracked
+
+      {"allowed": 10, "rejected_ip": 2, "rejected_email": 1, "buckets": 3}
+    """
+    counters = db.throttle.find_one({"_id": STATS_ID}) or {}
+    counters.pop("_id", None)
+    counters["buckets"] = db.throttle.count_documents({"_id": {"$ne": STATS_ID}})
+    return counters
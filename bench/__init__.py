@@ -0,0 +1 @@
+"""Benchmarks for the API, run each module with `python -m bench.<module>`."""
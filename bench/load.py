@@ -0,0 +1,733 @@
+"""HTTP load benchmark of the culture, admin and auth routes.
+
+Seeds a scratch database of a local mongod, starts gunicorn with a config of
+deploy/ (or targets a server already running against that database), then
+keeps `--concurrency` connections busy for `--duration` seconds with a mix of
+requests weighted like real traffic: mostly public culture reads, a few admin
+reads and writes, logins and token refreshes. Each route's requests per
+second and p50/p95/p99 latency are printed and saved as JSON, `--baseline`
+compares them with a previous run.
+
+Logins are throttled per IP and email (api/throttle.py), the benchmark spreads
+them over `--admins` seeded admins and random X-Real-IP addresses. Past the
+burst the email buckets still run dry, so 429s are reported as a route of their
+own (e.g. `login_throttled`) and left out of the route's and the total's
+latencies: those measure password hashing, not the throttle. Invites and
+recoveries queue emails, the started server runs no outbox worker so none is
+sent.
+
+Usage:
+  python -m bench.load --serve [--config deploy/gunicorn_gthread.py]
+      [--mongo-uri mongodb://localhost:27017] [--duration 30] [--concurrency 16]
+      [--output bench-load.json] [--baseline previous.json]
+  python -m bench.load --url http://127.0.0.1:8000 --database <its database>
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import (Any, Callable, Dict, List, NamedTuple, Optional, Sequence,
+                    Tuple)
+from urllib.parse import quote, urlsplit
+
+from pymongo import MongoClient  # type: ignore
+from werkzeug.security import generate_password_hash
+
+from api.caching import content_digest
+from api.catalog import culture_written
+
+from .validation import culture
+
+BENCH_PASSWORD = "bench-password"
+
+
+class Request(NamedTuple):
+    """Request of the benchmark."""
+
+    route: str
+    method: str
+    path: str
+    body: Optional[Dict[str, Any]] = None
+    headers: Optional[Dict[str, str]] = None
+    # Shared state the response updates, see `State.done`
+    context: Any = None
+
+
+class State:
+    """Names, emails and tokens shared by the load threads. Thread safe."""
+
+    def __init__(self, cultures: List[str], admins: List[str], token: str):
+        """Create the state of a seeded database.
+
+        Arguments:
+          cultures: seeded culture names, never deleted
+          admins: seeded admin emails, never deleted
+          token: access token of an admin
+        """
+        self.cultures = cultures
+        self.admins = admins
+        self.token = token
+        self.created: List[str] = []
+        self.registered: List[str] = []
+        self.refresh_tokens: List[str] = []
+        self.etags: Dict[str, str] = {}
+        self.lock = threading.Lock()
+
+    def auth(self) -> Dict[str, str]:
+        """Authorization header of an admin."""
+        return {"Authorization": f"Bearer {self.token}"}
+
+    def take(self, items: List[str]) -> Optional[str]:
+        """Remove and return an item of a shared list, None when empty."""
+        with self.lock:
+            return items.pop() if items else None
+
+    def add(self, items: List[str], item: str) -> None:
+        """Append to a shared list."""
+        with self.lock:
+            items.append(item)
+
+    def done(self, request: Request, status: int, body: bytes, etag: str) -> None:
+        """Record what a response created.
+
+        Arguments:
+          request: request sent
+          status: HTTP status code
+          body: response body
+          etag: ETag header, empty if none
+        """
+        if request.route == "culture" and etag:
+            self.etags[request.context] = etag
+        elif request.route == "culture_create" and status == 201:
+            self.add(self.created, request.context)
+        elif request.route == "register" and status == 201:
+            self.add(self.registered, request.context)
+        elif request.route in ("login", "token_refresh") and status == 200:
+            self.add(self.refresh_tokens, json.loads(body)["refresh_token"])
+
+
+def unique(prefix: str) -> str:
+    """Name unique to this run."""
+    return f"{prefix}-{uuid.uuid4().hex[:12]}"
+
+
+def cultures(state: State, rng: random.Random) -> Request:
+    """GET /api/v1/cultures, whole list or a page."""
+    query = rng.choice(["", "?limit=20", f"?after={rng.choice(state.cultures)}"])
+    return Request("cultures", "GET", f"/api/v1/cultures{query}")
+
+
+def culture_get(state: State, rng: random.Random) -> Request:
+    """GET /api/v1/cultures/<name>, revalidated when the client has an ETag."""
+    name = rng.choice(state.cultures)
+    etag = state.etags.get(name)
+    if etag and rng.random() < 0.5:
+        return Request(
+            "culture_revalidate",
+            "GET",
+            f"/api/v1/cultures/{quote(name)}",
+            headers={"If-None-Match": etag},
+        )
+    return Request("culture", "GET", f"/api/v1/cultures/{quote(name)}", context=name)
+
+
+def cultures_version(state: State, rng: random.Random) -> Request:
+    """GET /api/v1/cultures/version."""
+    return Request("cultures_version", "GET", "/api/v1/cultures/version")
+
+
+def cultures_changes(state: State, rng: random.Random) -> Request:
+    """GET /api/v1/cultures/changes of the last hour."""
+    since = int(time.time()) - 3600
+    return Request("cultures_changes", "GET", f"/api/v1/cultures/changes?since={since}")
+
+
+def culture_create(state: State, rng: random.Random) -> Request:
+    """POST /api/v1/cultures."""
+    name = unique("bench-culture")
+    return Request(
+        "culture_create",
+        "POST",
+        "/api/v1/cultures",
+        {"name": name},
+        state.auth(),
+        context=name,
+    )
+
+
+def culture_update(state: State, rng: random.Random) -> Request:
+    """PUT /api/v1/cultures/<name> of a culture the benchmark created."""
+    name = rng.choice(state.created) if state.created else None
+    if name is None:
+        return culture_create(state, rng)
+    return Request(
+        "culture_update",
+        "PUT",
+        f"/api/v1/cultures/{quote(name)}",
+        {**culture(20, 3, 10), "name": name},
+        state.auth(),
+    )
+
+
+def culture_delete(state: State, rng: random.Random) -> Request:
+    """DELETE /api/v1/cultures/<name> of a culture the benchmark created."""
+    name = state.take(state.created)
+    if name is None:
+        return culture_create(state, rng)
+    return Request(
+        "culture_delete",
+        "DELETE",
+        f"/api/v1/cultures/{quote(name)}",
+        None,
+        state.auth(),
+    )
+
+
+def login(state: State, rng: random.Random) -> Request:
+    """POST /api/v1/login of a seeded admin, from a random address."""
+    return Request(
+        "login",
+        "POST",
+        "/api/v1/login",
+        {"email": rng.choice(state.admins), "password": BENCH_PASSWORD},
+        {"X-Real-IP": f"10.{rng.randrange(256)}.{rng.randrange(256)}.1"},
+    )
+
+
+def token_refresh(state: State, rng: random.Random) -> Request:
+    """POST /api/v1/token/refresh with a refresh token of an earlier login."""
+    token = state.take(state.refresh_tokens)
+    if token is None:
+        return login(state, rng)
+    return Request(
+        "token_refresh",
+        "POST",
+        "/api/v1/token/refresh",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+
+
+def login_throttle(state: State, rng: random.Random) -> Request:
+    """GET /api/v1/login/throttle."""
+    return Request(
+        "login_throttle", "GET", "/api/v1/login/throttle", headers=state.auth()
+    )
+
+
+def register(state: State, rng: random.Random) -> Request:
+    """POST /api/v1/register of a new admin."""
+    email = f"{unique('bench')}@example.com"
+    return Request(
+        "register",
+        "POST",
+        "/api/v1/register",
+        {
+            "name": "Bench",
+            "email": email,
+            "password": BENCH_PASSWORD,
+            "password_confirmation": BENCH_PASSWORD,
+        },
+        state.auth(),
+        context=email,
+    )
+
+
+def admins(state: State, rng: random.Random) -> Request:
+    """GET /api/v1/admins."""
+    return Request("admins", "GET", "/api/v1/admins", headers=state.auth())
+
+
+def admin(state: State, rng: random.Random) -> Request:
+    """GET /api/v1/admins/<email>."""
+    email = rng.choice(state.admins)
+    return Request("admin", "GET", f"/api/v1/admins/{email}", headers=state.auth())
+
+
+def admin_update(state: State, rng: random.Random) -> Request:
+    """PUT /api/v1/admins/<email> renaming a seeded admin."""
+    email = rng.choice(state.admins)
+    return Request(
+        "admin_update",
+        "PUT",
+        f"/api/v1/admins/{email}",
+        {"email": email, "name": unique("Bench")},
+        state.auth(),
+    )
+
+
+def admin_delete(state: State, rng: random.Random) -> Request:
+    """DELETE /api/v1/admins/<email> of an admin the benchmark registered."""
+    email = state.take(state.registered)
+    if email is None:
+        return register(state, rng)
+    return Request(
+        "admin_delete", "DELETE", f"/api/v1/admins/{email}", None, state.auth()
+    )
+
+
+def invite(state: State, rng: random.Random) -> Request:
+    """POST /api/v1/admins/invite."""
+    email = f"{unique('invite')}@example.com"
+    return Request(
+        "invite", "POST", "/api/v1/admins/invite", {"email": email}, state.auth()
+    )
+
+
+def admin_recover(state: State, rng: random.Random) -> Request:
+    """POST /api/v1/admins/recover of a seeded admin."""
+    return Request(
+        "admin_recover",
+        "POST",
+        "/api/v1/admins/recover",
+        {"email": rng.choice(state.admins)},
+    )
+
+
+# (request builder, weight), mostly public reads
+MIX: List[Tuple[Callable[[State, random.Random], Request], float]] = [
+    (culture_get, 45),
+    (cultures, 25),
+    (cultures_version, 8),
+    (cultures_changes, 4),
+    (login, 2),
+    (token_refresh, 1),
+    (login_throttle, 0.5),
+    (admins, 3),
+    (admin, 2),
+    (culture_create, 1.5),
+    (culture_update, 2),
+    (culture_delete, 1),
+    (register, 0.5),
+    (admin_update, 0.5),
+    (admin_delete, 0.5),
+    (invite, 0.25),
+    (admin_recover, 0.25),
+]
+
+
+def seed(db: MongoClient, cultures_count: int, admins_count: int) -> State:
+    """Fill a database with cultures and admins.
+
+    Arguments:
+      db: scratch database
+      cultures_count: cultures to create
+      admins_count: admins to create
+
+    Returns:
+      state without a token, see `login_token`
+    """
+    names = [f"bench-seed-{i:04d}" for i in range(cultures_count)]
+    now = int(time.time())
+    for i, name in enumerate(names):
+        # A few large cultures among many small ones
+        document = {
+            **(culture(200, 10, 50) if i % 10 == 0 else culture(20, 3, 10)),
+            "name": name,
+            "modified": now,
+        }
+        document["digest"] = content_digest(document)
+        db.cultures.insert_one(document)
+        culture_written(db, name, now)
+
+    password = generate_password_hash(BENCH_PASSWORD)
+    emails = [f"bench-admin-{i:03d}@example.com" for i in range(admins_count)]
+    db.admins.insert_many(
+        [
+            {"name": "Bench", "email": email, "password": password, "superUser": False}
+            for email in emails
+        ]
+    )
+    return State(names, emails, "")
+
+
+def connect(url: str) -> http.client.HTTPConnection:
+    """Open a keep-alive connection to the server.
+
+    Arguments:
+      url: http://host:port
+
+    Returns:
+      connection
+    """
+    parts = urlsplit(url)
+    return http.client.HTTPConnection(
+        parts.hostname or "localhost", parts.port or 80, timeout=60
+    )
+
+
+def send(
+    connection: http.client.HTTPConnection, request: Request
+) -> Tuple[int, bytes, str]:
+    """Send a request and read the whole response.
+
+    Returns:
+      (status, body, ETag)
+    """
+    headers = dict(request.headers or {})
+    body = None
+    if request.body is not None:
+        body = json.dumps(request.body).encode()
+        headers["Content-Type"] = "application/json"
+    connection.request(request.method, request.path, body, headers)
+    response = connection.getresponse()
+    data = response.read()
+    return response.status, data, response.getheader("ETag", "")
+
+
+def run(
+    url: str, state: State, duration: float, concurrency: int, seed_value: int = 0
+) -> Tuple[Dict[str, List[float]], Dict[str, Dict[int, int]], float]:
+    """Keep `concurrency` connections busy with the mix for `duration` seconds.
+
+    Arguments:
+      url: http://host:port of the server
+      state: seeded state with a token
+      duration: seconds to run
+      concurrency: connections, each sending its next request once answered
+      seed_value: seed of the request choice
+
+    Returns:
+      (latencies in seconds per route, statuses per route, elapsed seconds)
+    """
+    builders = [builder for builder, _ in MIX]
+    weights = [weight for _, weight in MIX]
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    statuses: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def work(index: int) -> None:
+        rng = random.Random(seed_value * 1000 + index)
+        connection = connect(url)
+        local: List[Tuple[str, int, float]] = []
+        while time.monotonic() < deadline:
+            request = rng.choices(builders, weights)[0](state, rng)
+            start = time.perf_counter()
+            try:
+                status, body, etag = send(connection, request)
+            except (OSError, http.client.HTTPException):
+                # Counted as status 0, reconnect for the next request
+                status, body, etag = 0, b"", ""
+                connection.close()
+                connection = connect(url)
+            seconds = time.perf_counter() - start
+            local.append((reported_route(request, status), status, seconds))
+            state.done(request, status, body, etag)
+        connection.close()
+
+        with lock:
+            for route, status, seconds in local:
+                latencies[route].append(seconds)
+                statuses[route][status] += 1
+
+    started = time.monotonic()
+    threads = [
+        threading.Thread(target=work, args=(i,), daemon=True)
+        for i in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, statuses, time.monotonic() - started
+
+
+# Suffix of the route 429 responses are reported under
+THROTTLED = "_throttled"
+
+
+def reported_route(request: Request, status: int) -> str:
+    """Route a response is reported under, throttled ones apart.
+
+    Arguments:
+      request: request sent
+      status: HTTP status code
+
+    Returns:
+      route of the request, with `THROTTLED` appended for a 429
+    """
+    return request.route + THROTTLED if status == 429 else request.route
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Nearest-rank percentile.
+
+    Arguments:
+      values: sorted values
+      q: percentile, 0 to 100
+
+    Returns:
+      the value at or below which `q` percent of the values fall
+    """
+    if not values:
+        return 0.0
+    rank = max(1, int(-(-q * len(values) // 100)))
+    return values[rank - 1]
+
+
+def summarize(
+    latencies: Dict[str, List[float]],
+    statuses: Dict[str, Dict[int, int]],
+    elapsed: float,
+) -> Dict[str, Dict[str, Any]]:
+    """Throughput and latency percentiles per route, and overall as `total`.
+
+    `total` leaves out throttled routes, see `reported_route`.
+
+    Returns:
+      {"culture": {"requests": 1000, "rps": 33.3, "p50_ms": 2.1, ...}}
+    """
+    summary: Dict[str, Dict[str, Any]] = {}
+    every: List[float] = []
+    for route in sorted(latencies):
+        values = sorted(latencies[route])
+        if not route.endswith(THROTTLED):
+            every.extend(values)
+        summary[route] = {
+            "requests": len(values),
+            "rps": round(len(values) / elapsed, 2),
+            "p50_ms": round(percentile(values, 50) * 1000, 3),
+            "p95_ms": round(percentile(values, 95) * 1000, 3),
+            "p99_ms": round(percentile(values, 99) * 1000, 3),
+            "statuses": {str(k): v for k, v in sorted(statuses[route].items())},
+        }
+
+    every.sort()
+    served = {
+        route: counts
+        for route, counts in statuses.items()
+        if not route.endswith(THROTTLED)
+    }
+    summary["total"] = {
+        "requests": len(every),
+        "rps": round(len(every) / elapsed, 2),
+        "p50_ms": round(percentile(every, 50) * 1000, 3),
+        "p95_ms": round(percentile(every, 95) * 1000, 3),
+        "p99_ms": round(percentile(every, 99) * 1000, 3),
+        "statuses": {
+            str(status): sum(served[route].get(status, 0) for route in served)
+            for status in sorted({k for s in served.values() for k in s})
+        },
+    }
+    return summary
+
+
+def compare(
+    baseline: Dict[str, Dict[str, Any]],
+    current: Dict[str, Dict[str, Any]],
+    tolerance: float,
+) -> List[str]:
+    """Find routes that got slower, or slower to serve, than a baseline.
+
+    Arguments:
+      baseline: `summarize` of the previous run
+      current: `summarize` of this run
+      tolerance: allowed relative change, e.g. 0.2 for 20%
+
+    Returns:
+      regressions, e.g. "culture p99_ms 12.0 -> 20.5 (+71%)"
+    """
+    regressions = []
+    for route in sorted(set(baseline) & set(current)):
+        # Fewer throttled requests is no regression
+        if route.endswith(THROTTLED):
+            continue
+        for metric, worse in (
+            ("p50_ms", 1),
+            ("p95_ms", 1),
+            ("p99_ms", 1),
+            ("rps", -1),
+        ):
+            before, after = baseline[route].get(metric), current[route].get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            if change * worse > tolerance:
+                regressions.append(
+                    f"{route} {metric} {before} -> {after} ({change:+.0%})"
+                )
+    return regressions
+
+
+def print_summary(summary: Dict[str, Dict[str, Any]]) -> None:
+    """Print a summary as a table."""
+    print(
+        f"{'route':<20} {'requests':>9} {'rps':>9} {'p50 ms':>9} "
+        f"{'p95 ms':>9} {'p99 ms':>9}  statuses"
+    )
+    for route, row in summary.items():
+        statuses = " ".join(f"{k}:{v}" for k, v in row["statuses"].items())
+        print(
+            f"{route:<20} {row['requests']:>9} {row['rps']:>9.1f} "
+            f"{row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f}"
+            f"  {statuses}"
+        )
+
+
+def free_port() -> int:
+    """Port nothing listens on."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve(
+    config: str, app: str, mongo_uri: str, database: str
+) -> Tuple["subprocess.Popen[bytes]", str]:
+    """Start gunicorn against the scratch database.
+
+    Arguments:
+      config: gunicorn config file, e.g. deploy/gunicorn_gthread.py
+      app: WSGI app, empty for configs naming their own (the ASGI one)
+      mongo_uri: connection string of the mongod
+      database: scratch database name
+
+    Returns:
+      (gunicorn process, http://host:port)
+    """
+    port = free_port()
+    env = {
+        **os.environ,
+        "FLASK_ENV": "production",
+        "MONGO_URI": mongo_uri,
+        "MONGO_INITDB_DATABASE": database,
+        "SECRET_KEY": "bench",
+        "GUNICORN_BIND": f"127.0.0.1:{port}",
+        "MAIL_OUTBOX_WORKERS": "0",
+    }
+    command = [sys.executable, "-m", "gunicorn", "-c", config] + ([app] if app else [])
+    process = subprocess.Popen(command, env=env)
+
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {process.returncode}")
+        try:
+            connection = connect(url)
+            connection.request("GET", "/health")
+            if connection.getresponse().status == 200:
+                return process, url
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("gunicorn did not answer /health within 30s")
+
+
+def login_token(url: str, state: State) -> str:
+    """Access token of the first seeded admin."""
+    status, body, _ = send(
+        connect(url),
+        Request(
+            "login",
+            "POST",
+            "/api/v1/login",
+            {"email": state.admins[0], "password": BENCH_PASSWORD},
+        ),
+    )
+    if status != 200:
+        raise RuntimeError(f"login of the benchmark admin failed with {status}")
+    return json.loads(body)["token"]
+
+
+def git_commit() -> str:
+    """Commit of the working tree, empty outside a git checkout."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def main() -> None:
+    """Run the benchmark and print and save the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--serve", action="store_true", help="start gunicorn")
+    target.add_argument("--url", help="server already running on --database")
+    parser.add_argument("--config", default="deploy/gunicorn_gthread.py")
+    parser.add_argument(
+        "--app", default="api.__main__:app", help="empty for deploy/gunicorn_asgi.py"
+    )
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--database", default=f"bench_{uuid.uuid4().hex[:8]}")
+    parser.add_argument("--keep", action="store_true", help="keep the database")
+    parser.add_argument("--cultures", type=int, default=100)
+    parser.add_argument("--admins", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=5)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench-load.json")
+    parser.add_argument("--baseline", help="results of a previous run to compare")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    client = MongoClient(args.mongo_uri)
+    db = client[args.database]
+    process = None
+    try:
+        state = seed(db, args.cultures, args.admins)
+        if args.serve:
+            process, url = serve(args.config, args.app, args.mongo_uri, args.database)
+        else:
+            url = args.url
+        state.token = login_token(url, state)
+
+        if args.warmup:
+            run(url, state, args.warmup, args.concurrency, args.seed + 1)
+        latencies, statuses, elapsed = run(
+            url, state, args.duration, args.concurrency, args.seed
+        )
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        if not args.keep:
+            client.drop_database(args.database)
+
+    summary = summarize(latencies, statuses, elapsed)
+    print_summary(summary)
+    with open(args.output, "w") as f:
+        json.dump(
+            {
+                "meta": {
+                    "started": int(time.time() - elapsed),
+                    "duration": round(elapsed, 3),
+                    "concurrency": args.concurrency,
+                    "cultures": args.cultures,
+                    "config": args.config if args.serve else args.url,
+                    "commit": git_commit(),
+                    "python": platform.python_version(),
+                },
+                "routes": summary,
+            },
+            f,
+            indent=2,
+        )
+    print(f"saved {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(json.load(f)["routes"], summary, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,516 @@
+"""Replay an nginx access log against the API and compare its latencies.
+
+Reads access logs in the `main` format of nginx.conf (plain or gzipped) and
+sends the same requests, in the same order and at the same pace (or
+`--speed` times faster), to gunicorn started on `api.__main__:app` or to a
+staging server already running against `--database`.
+
+The database is seeded like bench/load.py, and identifiers of the log are
+mapped onto the seeded ones: every culture name and admin email of a path
+always becomes the same seeded culture or admin, so reads hit documents
+exactly as often as in production. Logs hold no bodies or tokens, so write
+routes get synthetic bodies (the request builders of bench/load.py), and every
+request an admin token. Deletes only remove what the replay created, insight
+deletes included. The client address of each line is sent as X-Real-IP, so the
+login throttle sees production's clients.
+
+Requests are sent when due, whether or not earlier ones were answered: the
+latency of a request is counted from when it was due, so a server falling
+behind shows up as higher latency rather than as fewer requests. nginx logs
+whole seconds, requests of the same second are spread evenly over it.
+
+Results are saved in the format of bench/load.py, `--baseline` compares them
+with a previous replay of the same log.
+
+Usage:
+  python -m bench.replay access.log [access.log.1.gz ...] --serve
+      [--speed 1] [--limit 10000] [--concurrency 64]
+      [--output bench-replay.json] [--baseline previous.json]
+  python -m bench.replay access.log --url http://127.0.0.1:8000
+      --database <its database>
+"""
+import argparse
+import gzip
+import http.client
+import json
+import platform
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+import zlib
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from pymongo import MongoClient  # type: ignore
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import Map, Rule
+
+from . import load
+
+# log_format main of nginx.conf
+LINE = re.compile(
+    r"^(?P<ip>\S+) - \S+ \[(?P<time>[^\]]+)\] "
+    r'"(?P<method>[A-Z]+) (?P<target>\S+) [^"]*" (?P<status>\d{3}) '
+)
+
+# Routes of api.__main__:app, named after their Flask endpoints
+ROUTES = Map(
+    [
+        Rule("/health", endpoint="health", methods=["GET"]),
+        Rule("/api/v1/login", endpoint="login", methods=["POST"]),
+        Rule("/api/v1/login/throttle", endpoint="login_throttle", methods=["GET"]),
+        Rule("/api/v1/token/refresh", endpoint="token_refresh", methods=["POST"]),
+        Rule("/api/v1/register", endpoint="register", methods=["POST"]),
+        Rule("/api/v1/admins", endpoint="admins", methods=["GET"]),
+        Rule("/api/v1/admins/invite", endpoint="invite", methods=["POST"]),
+        Rule("/api/v1/admins/recover", endpoint="admin_recover", methods=["POST"]),
+        Rule("/api/v1/admins/<email>", endpoint="admin", methods=["GET"]),
+        Rule("/api/v1/admins/<email>", endpoint="admin_update", methods=["PUT"]),
+        Rule("/api/v1/admins/<email>", endpoint="admin_delete", methods=["DELETE"]),
+        Rule("/api/v1/cultures", endpoint="cultures", methods=["GET"]),
+        Rule("/api/v1/cultures", endpoint="culture_create", methods=["POST"]),
+        Rule("/api/v1/cultures/version", endpoint="cultures_version", methods=["GET"]),
+        Rule("/api/v1/cultures/changes", endpoint="cultures_changes", methods=["GET"]),
+        Rule("/api/v1/cultures/suggest", endpoint="suggest", methods=["GET"]),
+        Rule("/api/v1/cultures/<name>", endpoint="culture", methods=["GET"]),
+        Rule("/api/v1/cultures/<name>", endpoint="culture_update", methods=["PUT"]),
+        Rule("/api/v1/cultures/<name>", endpoint="culture_delete", methods=["DELETE"]),
+        Rule("/api/v1/cultures/<name>/insights", endpoint="insights", methods=["GET"]),
+        Rule(
+            "/api/v1/cultures/<name>/insights/<category>",
+            endpoint="insight_create",
+            methods=["POST"],
+        ),
+        Rule(
+            "/api/v1/cultures/<name>/insights/<category>/<int:index>",
+            endpoint="insight_update",
+            methods=["PATCH"],
+        ),
+        Rule(
+            "/api/v1/cultures/<name>/insights/<category>/<int:index>",
+            endpoint="insight_delete",
+            methods=["DELETE"],
+        ),
+        Rule(
+            "/api/v1/cultures/<name>/insights/<category>/reorder",
+            endpoint="insight_reorder",
+            methods=["POST"],
+        ),
+        Rule("/api/v1/bundle", endpoint="bundle", methods=["GET"]),
+        Rule("/api/v1/search", endpoint="search", methods=["GET"]),
+        Rule("/api/v1/feedback", endpoint="feedback", methods=["POST"]),
+        Rule("/api/v1/feedback", endpoint="feedback_list", methods=["GET"]),
+        Rule("/api/v1/db/pool", endpoint="pool", methods=["GET"]),
+        Rule("/api/v1/db/slow-ops", endpoint="slow_ops", methods=["GET"]),
+    ]
+)
+
+# Never proxied for outside clients, see nginx.conf
+SKIPPED_PATHS = ("/metrics",)
+
+
+class Entry(NamedTuple):
+    """Request of the log."""
+
+    # Seconds since the first request of the log
+    offset: float
+    ip: str
+    method: str
+    path: str
+    query: str
+    # Flask endpoint, "unmatched" for paths the API doesn't serve
+    endpoint: str
+    args: Dict[str, Any]
+
+
+def read_lines(paths: Iterable[str]) -> Iterable[str]:
+    """Lines of access logs, gzipped ones included."""
+    for path in paths:
+        opener: Any = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8", errors="replace") as f:
+            yield from f
+
+
+def parse(lines: Iterable[str]) -> Tuple[List[Entry], int]:
+    """Rebuild the request stream of access log lines.
+
+    Arguments:
+      lines: lines in the `main` log format, in any order
+
+    Returns:
+      (requests ordered by time, number of lines skipped)
+    """
+    adapter = ROUTES.bind("localhost")
+    parsed: List[Tuple[float, str, str, str, str, str, Dict[str, Any]]] = []
+    skipped = 0
+    for line in lines:
+        match = LINE.match(line)
+        if match is None:
+            skipped += 1
+            continue
+        path, _, query = match.group("target").partition("?")
+        if path in SKIPPED_PATHS:
+            skipped += 1
+            continue
+        try:
+            stamp = datetime.strptime(match.group("time"), "%d/%b/%Y:%H:%M:%S %z")
+        except ValueError:
+            skipped += 1
+            continue
+
+        method = match.group("method")
+        try:
+            endpoint, args = adapter.match(path, "GET" if method == "HEAD" else method)
+        except HTTPException:
+            endpoint, args = "unmatched", {}
+        parsed.append(
+            (stamp.timestamp(), match.group("ip"), method, path, query, endpoint, args)
+        )
+
+    if not parsed:
+        return [], skipped
+
+    # Spread the requests of each logged second evenly over it
+    parsed.sort(key=lambda request: request[0])
+    per_second: Dict[float, int] = defaultdict(int)
+    for request in parsed:
+        per_second[request[0]] += 1
+    first = parsed[0][0]
+    seen: Dict[float, int] = defaultdict(int)
+    entries = []
+    for second, *rest in parsed:
+        offset = second - first + seen[second] / per_second[second]
+        seen[second] += 1
+        entries.append(Entry(offset, *rest))  # type: ignore
+    return entries, skipped
+
+
+def seeded(items: List[str], value: str) -> str:
+    """Seeded name or email a name or email of the log always maps to."""
+    return items[zlib.crc32(value.encode()) % len(items)]
+
+
+class ReplayState(load.State):
+    """State of a replay, also tracking the insights it appended. Thread safe."""
+
+    def __init__(self, cultures: List[str], admins: List[str], token: str):
+        """Create the state of a seeded database, see `load.State`."""
+        super().__init__(cultures, admins, token)
+        # Index of the culture of every appended general insight
+        self.appended: List[int] = []
+        # Culture index -> general insights appended and not deleted yet
+        self.insights: Dict[int, int] = defaultdict(int)
+
+    def done(self, request: load.Request, status: int, body: bytes, etag: str) -> None:
+        """Record what a response created, see `load.State.done`."""
+        super().done(request, status, body, etag)
+        if request.route == "insight_create" and status == 201:
+            with self.lock:
+                self.appended.append(request.context)
+                self.insights[request.context] += 1
+
+    def take_insight(self) -> Optional[Tuple[int, int]]:
+        """Claim the last general insight the replay appended to a culture.
+
+        Returns:
+          (culture index, insight index), None when nothing is left to delete
+        """
+        with self.lock:
+            if not self.appended:
+                return None
+            index = self.appended.pop()
+            self.insights[index] -= 1
+            # See `load.seed`, appended insights come after the seeded ones.
+            # Concurrent deletes can shift it out of range (404), never onto
+            # a seeded insight
+            return index, (200 if index % 10 == 0 else 20) + self.insights[index]
+
+
+def insight_create(state: ReplayState, rng: random.Random) -> load.Request:
+    """POST /api/v1/cultures/<name>/insights/general of a seeded culture."""
+    index = rng.randrange(len(state.cultures))
+    return load.Request(
+        "insight_create",
+        "POST",
+        f"/api/v1/cultures/{state.cultures[index]}/insights/general",
+        load.culture(1, 0, 0)["general_insights"][0],
+        state.auth(),
+        context=index,
+    )
+
+
+def insight_update(state: ReplayState, rng: random.Random) -> load.Request:
+    """PATCH the first general insight of a seeded culture."""
+    name = rng.choice(state.cultures)
+    return load.Request(
+        "insight_update",
+        "PATCH",
+        f"/api/v1/cultures/{name}/insights/general/0",
+        {"summary": load.unique("summary")},
+        state.auth(),
+    )
+
+
+def insight_delete(state: ReplayState, rng: random.Random) -> load.Request:
+    """DELETE a general insight the replay appended to a seeded culture."""
+    taken = state.take_insight()
+    if taken is None:
+        return insight_create(state, rng)
+    index, insight = taken
+    return load.Request(
+        "insight_delete",
+        "DELETE",
+        f"/api/v1/cultures/{state.cultures[index]}/insights/general/{insight}",
+        None,
+        state.auth(),
+    )
+
+
+def insight_reorder(state: ReplayState, rng: random.Random) -> load.Request:
+    """Shuffle `category 0` of a seeded culture, which nothing else changes."""
+    index = rng.randrange(len(state.cultures))
+    # See `load.seed`
+    order = list(range(50 if index % 10 == 0 else 10))
+    rng.shuffle(order)
+    return load.Request(
+        "insight_reorder",
+        "POST",
+        f"/api/v1/cultures/{state.cultures[index]}/insights/category%200/reorder",
+        {"order": order},
+        state.auth(),
+    )
+
+
+def feedback(state: ReplayState, rng: random.Random) -> load.Request:
+    """POST /api/v1/feedback."""
+    return load.Request(
+        "feedback", "POST", "/api/v1/feedback", {"feedback": "replayed feedback"}
+    )
+
+
+# Endpoint -> builder of a synthetic request, for routes reading a body
+WRITES = {
+    builder.__name__: builder
+    for builder in (
+        load.culture_create,
+        load.culture_update,
+        load.culture_delete,
+        load.login,
+        load.token_refresh,
+        load.register,
+        load.admin_update,
+        load.admin_delete,
+        load.invite,
+        load.admin_recover,
+        insight_create,
+        insight_update,
+        insight_delete,
+        insight_reorder,
+        feedback,
+    )
+}
+
+
+def build(entry: Entry, state: ReplayState, rng: random.Random) -> load.Request:
+    """Request to send for a log entry.
+
+    Arguments:
+      entry: request of the log
+      state: seeded state with a token
+      rng: random source of synthetic bodies
+
+    Returns:
+      request labeled with the entry's endpoint
+    """
+    if entry.endpoint in WRITES:
+        request = WRITES[entry.endpoint](state, rng)
+        # Labeled with the builder's route, deletes with nothing to delete create
+        headers = {**(request.headers or {}), "X-Real-IP": entry.ip}
+        return request._replace(headers=headers)
+
+    path = entry.path
+    args = dict(entry.args)
+    if args:
+        if "name" in args:
+            args["name"] = seeded(state.cultures, args["name"])
+        if "email" in args:
+            args["email"] = seeded(state.admins, args["email"])
+        path = ROUTES.bind("localhost").build(entry.endpoint, args, entry.method)
+    if entry.query:
+        path = f"{path}?{entry.query}"
+    return load.Request(
+        entry.endpoint,
+        entry.method,
+        path,
+        headers={**state.auth(), "X-Real-IP": entry.ip},
+        context=args.get("name"),
+    )
+
+
+def replay(
+    url: str,
+    state: ReplayState,
+    entries: List[Entry],
+    speed: float,
+    concurrency: int,
+    token_lifetime: float = 600,
+) -> Tuple[Dict[str, List[float]], Dict[str, Dict[int, int]], float]:
+    """Send the requests of a log when they are due.
+
+    Arguments:
+      url: http://host:port of the server
+      state: seeded state with a token
+      entries: requests of the log
+      speed: how many times faster than logged to send them
+      concurrency: connections, requests wait for a free one
+      token_lifetime: seconds before the admin token is renewed
+
+    Returns:
+      (latencies in seconds per endpoint, statuses per endpoint, elapsed seconds)
+    """
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    statuses: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+    lock = threading.Lock()
+    due: "queue.Queue[Optional[Tuple[float, Entry]]]" = queue.Queue()
+
+    def work(index: int) -> None:
+        rng = random.Random(index)
+        connection = load.connect(url)
+        while True:
+            item = due.get()
+            if item is None:
+                break
+            when, entry = item
+            request = build(entry, state, rng)
+            try:
+                status, body, etag = load.send(connection, request)
+            except (OSError, http.client.HTTPException):
+                status, body, etag = 0, b"", ""
+                connection.close()
+                connection = load.connect(url)
+            # Late requests count from when they were due
+            seconds = time.monotonic() - when
+            state.done(request, status, body, etag)
+            route = load.reported_route(request, status)
+            with lock:
+                latencies[route].append(seconds)
+                statuses[route][status] += 1
+        connection.close()
+
+    threads = [
+        threading.Thread(target=work, args=(i,), daemon=True)
+        for i in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+
+    started = renewed = time.monotonic()
+    for entry in entries:
+        when = started + entry.offset / speed
+        if when - renewed > token_lifetime:
+            try:
+                state.token = load.login_token(url, state)
+            except (OSError, RuntimeError):
+                # Throttled by replayed logins, retried with the next request
+                pass
+            else:
+                renewed = when
+        delay = when - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        due.put((when, entry))
+
+    for _ in threads:
+        due.put(None)
+    for thread in threads:
+        thread.join()
+    return latencies, statuses, time.monotonic() - started
+
+
+def main() -> None:
+    """Replay the logs and print and save the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("logs", nargs="+", help="access logs, .gz ones included")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--serve", action="store_true", help="start gunicorn")
+    target.add_argument("--url", help="server already running on --database")
+    parser.add_argument("--config", default="deploy/gunicorn_gthread.py")
+    parser.add_argument("--app", default="api.__main__:app")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--database", default=f"bench_{uuid.uuid4().hex[:8]}")
+    parser.add_argument("--keep", action="store_true", help="keep the database")
+    parser.add_argument("--cultures", type=int, default=100)
+    parser.add_argument("--admins", type=int, default=50)
+    parser.add_argument("--speed", type=float, default=1)
+    parser.add_argument("--limit", type=int, help="replay the first LIMIT requests")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--output", default="bench-replay.json")
+    parser.add_argument("--baseline", help="results of a previous replay to compare")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    entries, skipped = parse(read_lines(args.logs))
+    entries = entries[: args.limit]
+    if not entries:
+        sys.exit("no requests to replay")
+    print(
+        f"replaying {len(entries)} requests over {entries[-1].offset / args.speed:.0f}s"
+        f", skipped {skipped} lines"
+    )
+
+    client = MongoClient(args.mongo_uri)
+    process = None
+    try:
+        seeded_state = load.seed(client[args.database], args.cultures, args.admins)
+        state = ReplayState(seeded_state.cultures, seeded_state.admins, "")
+        if args.serve:
+            process, url = load.serve(
+                args.config, args.app, args.mongo_uri, args.database
+            )
+        else:
+            url = args.url
+        state.token = load.login_token(url, state)
+        latencies, statuses, elapsed = replay(
+            url, state, entries, args.speed, args.concurrency
+        )
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        if not args.keep:
+            client.drop_database(args.database)
+
+    summary = load.summarize(latencies, statuses, elapsed)
+    load.print_summary(summary)
+    meta: Dict[str, Any] = {
+        "started": int(time.time() - elapsed),
+        "duration": round(elapsed, 3),
+        "logs": args.logs,
+        "requests": len(entries),
+        "skipped": skipped,
+        "speed": args.speed,
+        "concurrency": args.concurrency,
+        "config": args.config if args.serve else args.url,
+        "commit": load.git_commit(),
+        "python": platform.python_version(),
+    }
+    with open(args.output, "w") as f:
+        json.dump({"meta": meta, "routes": summary}, f, indent=2)
+    print(f"saved {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = load.compare(json.load(f)["routes"], summary, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
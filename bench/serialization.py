@@ -0,0 +1,95 @@
+"""Micro-benchmark of encoding culture documents for GET /api/v1/cultures/<name>.
+
+Compares Flask's `jsonify`, the previous path, against each JSON provider,
+against transcoding the raw BSON (`CULTURE_RAW_BSON`) and against a hit in the
+encoded culture cache, reporting time and peak memory per response. Paths
+that encode decoded documents include decoding the BSON pymongo receives.
+
+Usage:
+  python -m bench.serialization [--general 500] [--categories 20] [--insights 100]
+"""
+import argparse
+import timeit
+import tracemalloc
+from typing import Any, Callable, Dict
+
+import bson
+from bson import ObjectId
+from flask import jsonify
+
+from api import create_app
+from api.bsonjson import transcode
+from api.encoding import PROVIDERS, EncodedCache, orjson
+
+from .validation import culture
+
+
+def peak_memory(func: Callable[[], Any]) -> int:
+    """Measure the peak memory allocated by one call.
+
+    Arguments:
+      func: function to call
+
+    Returns:
+      bytes
+    """
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main() -> None:
+    """Run the benchmark and print the time and memory per response."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--general", type=int, default=500)
+    parser.add_argument("--categories", type=int, default=20)
+    parser.add_argument("--insights", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    document: Dict[str, Any] = {
+        "_id": ObjectId(),
+        "modified": 1600000000,
+        **culture(args.general, args.categories, args.insights),
+    }
+
+    app = create_app("stdlib")
+    cache = EncodedCache(64 * 1024 * 1024)
+    cache.put("benchmark", PROVIDERS["stdlib"](document))
+
+    raw = bson.encode(document)
+
+    def previous() -> Any:
+        # `culture()` stringified `_id` in place before every jsonify
+        decoded = bson.decode(raw)
+        decoded["_id"] = str(decoded["_id"])
+        return jsonify(decoded).get_data()
+
+    candidates: Dict[str, Callable[[], Any]] = {"jsonify": previous}
+    for name in sorted(PROVIDERS):
+        if name == "orjson" and orjson is None:
+            print("orjson not installed, skipped")
+            continue
+        candidates[name] = lambda dumps=PROVIDERS[name]: dumps(bson.decode(raw))
+    candidates["bson stream"] = lambda: sum(len(chunk) for chunk in transcode(raw))
+    candidates["cache hit"] = lambda: cache.get("benchmark")
+
+    total = args.general + args.categories * args.insights
+    size = len(PROVIDERS["stdlib"](document))
+    print(f"{total} insights, {size / 1024:.0f} KiB encoded, best of {args.repeat}")
+
+    with app.test_request_context():
+        baseline = min(timeit.repeat(previous, number=1, repeat=args.repeat))
+        for name, func in candidates.items():
+            best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+            print(
+                f"  {name:<12} {best * 1000:8.3f} ms  {baseline / best:7.1f}x"
+                f"  {peak_memory(func) / 1024:8.0f} KiB peak"
+            )
+
+
+if __name__ == "__main__":
+    main()
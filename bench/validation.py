@@ -0,0 +1,93 @@
+"""Micro-benchmark of request body validation for large cultures.
+
+Compares the previous path, a new `CultureUpdateSchema` per request with a
+nested `InsightSchema` per insight, against `validate_request_body`.
+
+Usage:
+  python -m bench.validation [--general 200] [--categories 10] [--insights 50]
+"""
+import argparse
+import timeit
+from typing import Any, Dict
+
+from marshmallow import Schema, fields
+
+from api.request_schemas import (CultureUpdateSchema, InsightSchema,
+                                 validate_request_body)
+
+
+class NestedCultureUpdateSchema(Schema):
+    """`CultureUpdateSchema` as it was, with nested insight schemas."""
+
+    name = fields.String(required=True)
+    general_insights = fields.List(fields.Nested(InsightSchema()), required=True)
+    specialized_insights = fields.Dict(
+        keys=fields.String(),
+        values=fields.List(fields.Nested(InsightSchema()), required=True),
+    )
+
+
+def culture(general: int, categories: int, insights: int) -> Dict[str, Any]:
+    """Build a culture body of the given size.
+
+    Arguments:
+      general: number of general insights
+      categories: number of specialized insight categories
+      insights: number of insights per category
+
+    Returns:
+      PUT /api/v1/cultures/<name> body
+    """
+
+    def insight(i: int) -> Dict[str, Any]:
+        return {
+            "summary": f"summary {i}",
+            "information": "some interesting information " * 20,
+            "source": {"type": "link", "data": f"http://www.example.com/{i}"},
+        }
+
+    return {
+        "name": "benchmark",
+        "general_insights": [insight(i) for i in range(general)],
+        "specialized_insights": {
+            f"category {c}": [insight(i) for i in range(insights)]
+            for c in range(categories)
+        },
+    }
+
+
+def main() -> None:
+    """Run the benchmark and print the time per validation."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--general", type=int, default=200)
+    parser.add_argument("--categories", type=int, default=10)
+    parser.add_argument("--insights", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    body = culture(args.general, args.categories, args.insights)
+    total = args.general + args.categories * args.insights
+    assert validate_request_body(CultureUpdateSchema, body) == (
+        NestedCultureUpdateSchema().load(body)
+    )
+
+    results = {
+        "nested schema per request": timeit.repeat(
+            lambda: NestedCultureUpdateSchema().load(body), number=1, repeat=args.repeat
+        ),
+        "validate_request_body": timeit.repeat(
+            lambda: validate_request_body(CultureUpdateSchema, body),
+            number=1,
+            repeat=args.repeat,
+        ),
+    }
+
+    print(f"{total} insights, best of {args.repeat}")
+    baseline = min(results["nested schema per request"])
+    for name, times in results.items():
+        best = min(times)
+        print(f"  {name:<28} {best * 1000:8.2f} ms  {baseline / best:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""Gunicorn settings for the ASGI app, see api/asgi.py.
+
+GET /api/v1/cultures and GET /api/v1/cultures/<name> are served on the event
+loop with motor, one worker holds hundreds of slow connections. Every other
+route runs on the Flask app in a thread pool.
+
+Usage:
+  gunicorn -c deploy/gunicorn_asgi.py
+"""
+import os
+
+wsgi_app = "api.asgi:create_asgi_app()"
+bind = os.getenv("GUNICORN_BIND", "unix:gunicorn.sock")
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+
+# The event loop, and the motor client bound to it, only exist after fork
+preload_app = False
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = 30
+keepalive = 5
+
+
+def on_starting(server):
+    """Drop the metrics of the previous run, see api/metrics.py."""
+    # pylint: disable=import-outside-toplevel
+    from api.metrics import clear_metrics_dir
+
+    clear_metrics_dir(os.getenv("METRICS_DIR"))
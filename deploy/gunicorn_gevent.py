@@ -0,0 +1,32 @@
+"""Gunicorn settings for gevent workers.
+
+The worker monkey patches the standard library before the app is imported, so
+pymongo and smtplib yield to other requests while they wait on sockets. One
+worker holds up to `worker_connections` requests, bounded in practice by
+MONGO_MAX_POOL_SIZE (and MONGO_WAIT_QUEUE_TIMEOUT_MS for requests waiting on
+the pool).
+
+Usage:
+  gunicorn -c deploy/gunicorn_gevent.py "api.__main__:app"
+"""
+import os
+
+bind = os.getenv("GUNICORN_BIND", "unix:gunicorn.sock")
+worker_class = "gevent"
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "500"))
+
+# The app must be imported after the worker patched the standard library
+preload_app = False
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = 30
+keepalive = 5
+
+
+def on_starting(server):
+    """Drop the metrics of the previous run, see api/metrics.py."""
+    # pylint: disable=import-outside-toplevel
+    from api.metrics import clear_metrics_dir
+
+    clear_metrics_dir(os.getenv("METRICS_DIR"))
@@ -0,0 +1,32 @@
+"""Gunicorn settings for threaded workers, the default deployment.
+
+Every worker serves `threads` requests at once, each thread blocking on MongoDB
+or SMTP without holding up the others. Keep MONGO_MAX_POOL_SIZE at least at
+GUNICORN_THREADS so threads don't wait for a connection, see
+GET /api/v1/db/pool.
+
+Usage:
+  gunicorn -c deploy/gunicorn_gthread.py "api.__main__:app"
+"""
+import os
+
+bind = os.getenv("GUNICORN_BIND", "unix:gunicorn.sock")
+worker_class = "gthread"
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+
+# Workers import the app, and so connect to MongoDB, after they are forked
+preload_app = False
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = 30
+# Behind nginx, which keeps its own client connections alive
+keepalive = 5
+
+
+def on_starting(server):
+    """Drop the metrics of the previous run, see api/metrics.py."""
+    # pylint: disable=import-outside-toplevel
+    from api.metrics import clear_metrics_dir
+
+    clear_metrics_dir(os.getenv("METRICS_DIR"))